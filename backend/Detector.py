@@ -0,0 +1,244 @@
+"""
+Shared YOLO object detector.
+
+The detectors run the detection network directly (letterbox -> forward pass ->
+NMS) instead of going through YOLO.predict/YOLO.track. The predictor objects
+behind those calls keep per-call state and the tracker on the model, so they
+cannot be shared between jobs; the bare network is stateless in inference
+mode, which lets every job in a worker process share one loaded copy of the
+weights while keeping its own ObjectTracker.
+
+The forward pass is pluggable: YoloDetector runs the PyTorch weights, while
+OnnxDetector and OpenVinoDetector run a one-time export of the same model
+through ONNX Runtime or OpenVINO, which are considerably faster on CPU-only
+machines. All of them share pre- and post-processing and return the same
+Detections, so the tracker cannot tell them apart.
+"""
+
+import os
+import ast
+import time
+import threading
+from collections import namedtuple
+
+import numpy as np
+import torch
+from ultralytics import YOLO
+from ultralytics.data.augment import LetterBox
+from ultralytics.utils import ops, yaml_load
+
+from Metrics import STAGE_SECONDS, FRAMES_TOTAL
+
+_PREPROCESS_SECONDS = STAGE_SECONDS.labels(stage='detect_preprocess')
+_INFERENCE_SECONDS = STAGE_SECONDS.labels(stage='detect_inference')
+_POSTPROCESS_SECONDS = STAGE_SECONDS.labels(stage='detect_postprocess')
+_FRAMES_DETECTED = FRAMES_TOTAL.labels(kind='detected')
+
+# Per-frame detector output in original frame coordinates
+Detections = namedtuple("Detections", ["xyxy", "conf", "cls"])
+
+BACKENDS = ("torch", "onnx", "onnx_int8", "openvino")
+
+
+class BaseDetector:
+    # Exported graphs are compiled for one input size: pad every frame to the
+    # full square instead of the minimal stride-aligned rectangle
+    fixed_shape = True
+    stride = 32
+    names = {}
+
+    def _preprocess(self, frames, imgsz):
+        same_shapes = len({frame.shape for frame in frames}) == 1
+        letterbox = LetterBox(new_shape=(imgsz, imgsz), auto=same_shapes and not self.fixed_shape, stride=self.stride)
+        batch = np.stack([letterbox(image=frame) for frame in frames])
+        batch = batch[..., ::-1].transpose((0, 3, 1, 2))  # BGR->RGB, BHWC->BCHW
+        return np.ascontiguousarray(batch, dtype=np.float32) / 255.0
+
+    def _forward(self, batch):
+        """Run the network on a (B, 3, H, W) float32 batch and return raw predictions as a tensor."""
+        raise NotImplementedError
+
+    def detect(self, frames, conf=0.25, iou=0.45, imgsz=640):
+        """
+        Run detection on a batch of frames.
+
+        Args:
+            frames (list[np.ndarray]): BGR frames
+            conf (float): Confidence threshold
+            iou (float): NMS IoU threshold
+            imgsz (int): Inference size
+
+        Returns:
+            list[Detections]: One entry per input frame, in order
+        """
+        if not frames:
+            return []
+        started = time.perf_counter()
+        batch = self._preprocess(frames, imgsz)
+        preprocessed = time.perf_counter()
+        preds = self._forward(batch)
+        inferred = time.perf_counter()
+        results = ops.non_max_suppression(preds, conf, iou, max_det=300)
+
+        detections = []
+        for det, frame in zip(results, frames):
+            det[:, :4] = ops.scale_boxes(batch.shape[2:], det[:, :4], frame.shape)
+            det = det.cpu().numpy()
+            detections.append(Detections(det[:, :4], det[:, 4], det[:, 5]))
+
+        # Per batch: divide by the batch size for per-frame cost
+        _PREPROCESS_SECONDS.observe(preprocessed - started)
+        _INFERENCE_SECONDS.observe(inferred - preprocessed)
+        _POSTPROCESS_SECONDS.observe(time.perf_counter() - inferred)
+        _FRAMES_DETECTED.inc(len(frames))
+        return detections
+
+    def warmup(self, imgsz=640):
+        """Run one dummy inference so graph setup and allocator warmup happen before the first job."""
+        self.detect([np.zeros((imgsz, imgsz, 3), dtype=np.uint8)], imgsz=imgsz)
+
+
+class YoloDetector(BaseDetector):
+    fixed_shape = False
+
+    def __init__(self, weights_path, device="cpu", threads=None):
+        """
+        Load a YOLO detection model.
+
+        Args:
+            weights_path (str): Path to the .pt weights file
+            device (str): Torch device to run on
+            threads (Optional[int]): Intra-op threads (None keeps torch's default)
+        """
+        yolo = YOLO(weights_path, task="detect")
+        self.weights_path = weights_path
+        self.device = torch.device(device)
+        if threads:
+            torch.set_num_threads(threads)
+        self.names = yolo.names
+        self.model = yolo.model.fuse(verbose=False).to(self.device).eval()
+        for param in self.model.parameters():
+            param.requires_grad = False
+        self.stride = int(max(self.model.stride))
+
+    def _forward(self, batch):
+        with torch.inference_mode():
+            preds = self.model(torch.from_numpy(batch).to(self.device))
+        return preds[0] if isinstance(preds, (list, tuple)) else preds
+
+
+class OnnxDetector(BaseDetector):
+    def __init__(self, model_path, threads=None):
+        """
+        Load an exported ONNX model into an ONNX Runtime CPU session.
+
+        Args:
+            model_path (str): Path to the .onnx file
+            threads (Optional[int]): Intra-op threads (defaults to the CPU count)
+        """
+        import onnxruntime as ort
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        options.execution_mode = ort.ExecutionMode.ORT_SEQUENTIAL
+        options.intra_op_num_threads = threads or os.cpu_count() or 1
+        options.inter_op_num_threads = 1
+        self.weights_path = model_path
+        self.session = ort.InferenceSession(model_path, sess_options=options, providers=["CPUExecutionProvider"])
+        self.input_name = self.session.get_inputs()[0].name
+
+        metadata = self.session.get_modelmeta().custom_metadata_map
+        self.names = ast.literal_eval(metadata["names"])
+        self.stride = int(metadata.get("stride", 32))
+
+    def _forward(self, batch):
+        return torch.from_numpy(self.session.run(None, {self.input_name: batch})[0])
+
+
+class OpenVinoDetector(BaseDetector):
+    def __init__(self, model_dir, threads=None):
+        """
+        Compile an exported OpenVINO model for the CPU.
+
+        Args:
+            model_dir (str): Export directory containing the .xml/.bin pair and metadata.yaml
+            threads (Optional[int]): Inference threads (defaults to the CPU count)
+        """
+        import openvino as ov
+
+        xml_path = next(os.path.join(model_dir, f) for f in os.listdir(model_dir) if f.endswith(".xml"))
+        config = {
+            "PERFORMANCE_HINT": "LATENCY",
+            "INFERENCE_NUM_THREADS": threads or os.cpu_count() or 1
+        }
+        self.weights_path = model_dir
+        self.model = ov.Core().compile_model(xml_path, "CPU", config)
+        # An InferRequest runs one inference at a time and owns its output buffers, while the
+        # registry shares this detector between job threads: each thread gets its own request
+        self.requests = threading.local()
+
+        metadata = yaml_load(os.path.join(model_dir, "metadata.yaml"))
+        self.names = metadata["names"]
+        self.stride = int(metadata.get("stride", 32))
+
+    def _forward(self, batch):
+        request = getattr(self.requests, 'request', None)
+        if request is None:
+            request = self.requests.request = self.model.create_infer_request()
+        return torch.from_numpy(request.infer({0: batch})[self.model.output(0)].copy())
+
+
+def export_path(weights_path, backend):
+    """Location of the exported model for a .pt file (next to the weights)."""
+    stem = os.path.splitext(weights_path)[0]
+    return {
+        "torch": weights_path,
+        "onnx": f"{stem}.onnx",
+        "onnx_int8": f"{stem}_int8.onnx",
+        "openvino": f"{stem}_openvino_model"
+    }[backend]
+
+
+def export_model(weights_path, backend, imgsz=640):
+    """
+    Export .pt weights for a backend unless an export already exists.
+
+    Returns:
+        str: Path of the exported model
+    """
+    path = export_path(weights_path, backend)
+    if backend == "torch" or os.path.exists(path):
+        return path
+    # Dynamic axes so micro-batches of any size run through the same graph
+    exported = YOLO(weights_path, task="detect").export(format=backend, imgsz=imgsz, dynamic=True, half=False)
+    if os.path.abspath(exported) != os.path.abspath(path):
+        os.replace(exported, path)
+    return path
+
+
+def create_detector(weights_path, backend="torch", threads=None):
+    """
+    Create a detector for .pt weights on the given inference backend, exporting the model on first use.
+
+    Args:
+        weights_path (str): Path to the .pt weights file
+        backend (str): One of BACKENDS ("onnx_int8" must have been built with QuantizeDetector.py)
+        threads (Optional[int]): Inference threads
+
+    Returns:
+        BaseDetector: The loaded detector
+    """
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown detector backend '{backend}', expected one of {', '.join(BACKENDS)}")
+    if backend == "torch":
+        return YoloDetector(weights_path, threads=threads)
+    if backend == "onnx_int8":
+        # Calibration needs sample footage, so the INT8 build is made offline
+        path = export_path(weights_path, backend)
+        if not os.path.exists(path):
+            raise FileNotFoundError(f"INT8 model '{path}' not found, build it with QuantizeDetector.py")
+        return OnnxDetector(path, threads=threads)
+    path = export_model(weights_path, backend)
+    if backend == "onnx":
+        return OnnxDetector(path, threads=threads)
+    return OpenVinoDetector(path, threads=threads)
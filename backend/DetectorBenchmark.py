@@ -0,0 +1,199 @@
+"""
+Accuracy-vs-speed benchmark for detector backends.
+
+Runs each backend on the same frames sampled from walkthrough videos and
+reports, against the FP32 PyTorch baseline:
+  - per-frame latency (mean, p50, p95) and throughput
+  - detection agreement: share of baseline boxes matched (IoU >= 0.5) and,
+    among the matches, the share with the same class
+  - inventory impact: items counted by a full scan_video run per video and
+    how well the per-class counts agree with the baseline inventory
+
+Usage:
+    python DetectorBenchmark.py walkthrough.mp4 --backends onnx onnx_int8 --frames 200
+"""
+
+import json
+import time
+import argparse
+
+import cv2
+import numpy as np
+
+from Detector import BACKENDS
+from FramePipeline import sample_frames
+from ModelRegistry import DEFAULT_WEIGHTS, model_registry
+from VideoScanner import scan_video
+
+
+def _iou_matrix(a, b):
+    """Pairwise IoU between (N, 4) and (M, 4) xyxy boxes."""
+    x1 = np.maximum(a[:, None, 0], b[None, :, 0])
+    y1 = np.maximum(a[:, None, 1], b[None, :, 1])
+    x2 = np.minimum(a[:, None, 2], b[None, :, 2])
+    y2 = np.minimum(a[:, None, 3], b[None, :, 3])
+    inter = np.clip(x2 - x1, 0, None) * np.clip(y2 - y1, 0, None)
+    area_a = (a[:, 2] - a[:, 0]) * (a[:, 3] - a[:, 1])
+    area_b = (b[:, 2] - b[:, 0]) * (b[:, 3] - b[:, 1])
+    return inter / np.maximum(area_a[:, None] + area_b[None, :] - inter, 1e-9)
+
+
+def match_detections(baseline, candidate, min_iou=0.5):
+    """
+    Greedily match candidate detections to baseline detections of one frame by IoU.
+
+    Returns:
+        tuple: (baseline boxes, candidate boxes, matched pairs, matched pairs with the same class)
+    """
+    n, m = len(baseline.xyxy), len(candidate.xyxy)
+    if n == 0 or m == 0:
+        return n, m, 0, 0
+    ious = _iou_matrix(baseline.xyxy, candidate.xyxy)
+    matched = same_class = 0
+    for _ in range(min(n, m)):
+        i, j = np.unravel_index(ious.argmax(), ious.shape)
+        if ious[i, j] < min_iou:
+            break
+        matched += 1
+        same_class += int(baseline.cls[i] == candidate.cls[j])
+        ious[i, :] = -1
+        ious[:, j] = -1
+    return n, m, matched, same_class
+
+
+def time_backend(detector, frames, batch_size, imgsz):
+    """Run a detector over the frames and return (detections, per-frame latencies in ms)."""
+    detections, latencies = [], []
+    for i in range(0, len(frames), batch_size):
+        batch = frames[i:i + batch_size]
+        start = time.perf_counter()
+        detections.extend(detector.detect(batch, conf=0.55, iou=0.45, imgsz=imgsz))
+        latencies.extend([(time.perf_counter() - start) * 1000 / len(batch)] * len(batch))
+    return detections, np.array(latencies)
+
+
+def count_items(video_path, detector):
+    """
+    Run the full scan (detection, tracking, counting) on a video with the given detector and
+    return the per-class item counts.
+
+    Frames are detected at the source resolution, the same frames the latency is measured on,
+    whatever DETECT_WIDTH and CASCADE_WEIGHTS say.
+    """
+    cap = cv2.VideoCapture(video_path)
+    if not cap.isOpened():
+        raise IOError(f"Could not open video file '{video_path}'")
+    try:
+        scan = scan_video(cap, cap.get(cv2.CAP_PROP_FPS), int(cap.get(cv2.CAP_PROP_FRAME_WIDTH)),
+                          int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT)), detector=detector, detect_width=0)
+    finally:
+        cap.release()
+    return dict(scan["inventory"].counts)
+
+
+def count_agreement(baseline, candidate):
+    """Share of items on which two per-class inventories agree (1.0 = identical counts)."""
+    total = max(sum(baseline.values()), sum(candidate.values()))
+    if total == 0:
+        return 1.0
+    common = sum(min(count, candidate.get(cls, 0)) for cls, count in baseline.items())
+    return common / total
+
+
+def run_benchmark(videos, backends, weights=DEFAULT_WEIGHTS, baseline="torch", num_frames=200,
+                  batch_size=1, imgsz=640, count=True):
+    """
+    Benchmark backends against the baseline.
+
+    Returns:
+        dict: backend -> metrics
+    """
+    frames = sample_frames(videos, num_frames)
+    print(f"Benchmarking on {len(frames)} frames from {len(videos)} videos")
+
+    results = {}
+    reference = None
+    reference_counts = None
+    for backend in [baseline] + [b for b in backends if b != baseline]:
+        detector = model_registry.get_detector(weights, backend)
+        detections, latencies = time_backend(detector, frames, batch_size, imgsz)
+        metrics = {
+            'latency_ms_mean': float(latencies.mean()),
+            'latency_ms_p50': float(np.percentile(latencies, 50)),
+            'latency_ms_p95': float(np.percentile(latencies, 95)),
+            'throughput_fps': float(1000 / latencies.mean()),
+            'detections': int(sum(len(d.xyxy) for d in detections))
+        }
+
+        if reference is None:
+            reference = detections
+        else:
+            totals = np.array([match_detections(b, c) for b, c in zip(reference, detections)]).sum(axis=0)
+            base_boxes, cand_boxes, matched, same_class = (int(v) for v in totals)
+            metrics['box_recall'] = matched / base_boxes if base_boxes else 1.0
+            metrics['box_precision'] = matched / cand_boxes if cand_boxes else 1.0
+            metrics['class_agreement'] = same_class / matched if matched else 1.0
+            metrics['speedup'] = results[baseline]['latency_ms_mean'] / metrics['latency_ms_mean']
+
+        if count:
+            counts = {}
+            for video in videos:
+                for cls, n in count_items(video, detector).items():
+                    counts[cls] = counts.get(cls, 0) + n
+            metrics['counted_items'] = sum(counts.values())
+            metrics['counts'] = counts
+            if reference_counts is None:
+                reference_counts = counts
+            else:
+                metrics['counted_items_delta'] = metrics['counted_items'] - sum(reference_counts.values())
+                metrics['count_agreement'] = count_agreement(reference_counts, counts)
+
+        results[backend] = metrics
+    return results
+
+
+def print_report(results, baseline):
+    columns = [
+        ('mean ms', 'latency_ms_mean', '.1f'),
+        ('p50 ms', 'latency_ms_p50', '.1f'),
+        ('p95 ms', 'latency_ms_p95', '.1f'),
+        ('fps', 'throughput_fps', '.1f'),
+        ('speedup', 'speedup', '.2f'),
+        ('recall', 'box_recall', '.1%'),
+        ('cls agr', 'class_agreement', '.1%'),
+        ('items', 'counted_items', 'd'),
+        ('delta', 'counted_items_delta', '+d'),
+        ('cnt agr', 'count_agreement', '.1%')
+    ]
+    print("\n" + f"{'backend':<10}" + "".join(f"{title:>9}" for title, _, _ in columns))
+    for backend, metrics in results.items():
+        cells = [format(metrics[key], spec) if key in metrics else '-' for _, key, spec in columns]
+        print(f"{backend:<10}" + "".join(f"{cell:>9}" for cell in cells))
+    print(f"(speedup, recall, class and count agreement relative to {baseline})")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare detector backends against the FP32 baseline')
+    parser.add_argument('videos', nargs='+', help='Walkthrough videos to benchmark on')
+    parser.add_argument('--backends', nargs='+', default=['onnx_int8'], choices=BACKENDS,
+                        help='Backends to compare with the baseline')
+    parser.add_argument('--baseline', default='torch', choices=BACKENDS, help='Reference backend')
+    parser.add_argument('--weights', default=DEFAULT_WEIGHTS, help='Weight file name in MODEL_DIR or a path')
+    parser.add_argument('--frames', type=int, default=200, help='Frames sampled for latency and agreement')
+    parser.add_argument('--batch-size', type=int, default=1, help='Frames per detector call')
+    parser.add_argument('--imgsz', type=int, default=640, help='Inference size')
+    parser.add_argument('--no-count', action='store_true', help='Skip the full scan_video inventory comparison')
+    parser.add_argument('--json', help='Also write the results to this JSON file')
+    args = parser.parse_args()
+
+    results = run_benchmark(args.videos, args.backends, weights=args.weights, baseline=args.baseline,
+                            num_frames=args.frames, batch_size=args.batch_size, imgsz=args.imgsz,
+                            count=not args.no_count)
+    print_report(results, args.baseline)
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,195 @@
+"""
+Two-stage detector cascade.
+
+Most sampled frames of a walkthrough are yet another view of objects that are
+already being tracked. The cascade runs a small model (e.g. yolo11n) on every
+frame and only re-runs the large model on the frames where its answer
+matters:
+  - the small model sees a candidate that matches nothing in the previous frame
+  - it has uncertain detections (between candidate_conf and the detection
+    threshold) on something that is not already in the previous frame, and
+    no frame was escalated for uncert_interval frames
+  - the scan loop reports a track that is about to be counted (escalate_next)
+  - no frame went to the large model for refresh_interval frames
+Escalated frames use the large model's detections, all others the small
+model's, so tracking and counting see one stream of Detections. The cascade
+holds per-job state (previous boxes, pending escalation) around detectors that
+are shared through the model registry.
+
+A whole micro-batch goes through the small model before the scan loop tracks
+any of it, so escalate_next() usually arrives while frames of the batch that
+was already detected are still to be tracked. The scan loop passes each frame
+through take_pending() before tracking it, which re-runs that one frame on the
+large model, so the request is served by the very next frame and not a batch
+later. stats() (and insurefire_frames_total{kind="cascade"} against
+{kind="escalated"}) show how much of the work the small model does alone.
+"""
+
+import numpy as np
+
+from Detector import Detections
+from Metrics import FRAMES_TOTAL
+
+_FRAMES_CASCADE = FRAMES_TOTAL.labels(kind='cascade')
+_FRAMES_ESCALATED = FRAMES_TOTAL.labels(kind='escalated')
+
+
+def _box_iou(a, b):
+    """Pairwise IoU between (N, 4) and (M, 4) xyxy boxes."""
+    x1 = np.maximum(a[:, None, 0], b[None, :, 0])
+    y1 = np.maximum(a[:, None, 1], b[None, :, 1])
+    x2 = np.minimum(a[:, None, 2], b[None, :, 2])
+    y2 = np.minimum(a[:, None, 3], b[None, :, 3])
+    inter = np.clip(x2 - x1, 0, None) * np.clip(y2 - y1, 0, None)
+    area_a = (a[:, 2] - a[:, 0]) * (a[:, 3] - a[:, 1])
+    area_b = (b[:, 2] - b[:, 0]) * (b[:, 3] - b[:, 1])
+    return inter / np.maximum(area_a[:, None] + area_b[None, :] - inter, 1e-9)
+
+
+class DetectorCascade:
+    def __init__(self, small, large, candidate_conf=0.25, new_object_iou=0.3, refresh_interval=15,
+                 uncertain_interval=5):
+        """
+        Initialize the cascade for one job.
+
+        Args:
+            small (BaseDetector): Fast detector run on every frame
+            large (BaseDetector): Accurate detector run on escalated frames (same class list)
+            candidate_conf (float): Small-model confidence from which a detection counts as a candidate
+            new_object_iou (float): A confident detection overlapping no previous box by this much is new
+            refresh_interval (int): Escalate at least once every this many frames (0 disables)
+            uncertain_interval (int): Frames since the last escalation before uncertain detections
+                escalate again (a cluttered room has some on nearly every frame)
+        """
+        if small.names != large.names:
+            raise ValueError("The cascade's models must predict the same classes")
+        self.small = small
+        self.large = large
+        self.names = large.names
+        self.candidate_conf = candidate_conf
+        self.new_object_iou = new_object_iou
+        self.refresh_interval = refresh_interval
+        self.uncertain_interval = uncertain_interval
+
+        self.previous_boxes = None  # detections of the last frame, whichever model produced them
+        self.pending = False
+        self.since_escalation = 0
+        self.batch_escalated = []  # whether each frame of the last batch went to the large model
+        self.frames = 0
+        self.escalations = {'new_object': 0, 'uncertain': 0, 'track': 0, 'refresh': 0}
+
+    @property
+    def fixed_shape(self):
+        return self.small.fixed_shape or self.large.fixed_shape
+
+    def escalate_next(self):
+        """Send the next frame to the large model (e.g. a track is one observation away from being counted)."""
+        self.pending = True
+
+    def _unmatched(self, boxes):
+        """Which boxes overlap no box of the previous frame."""
+        if self.previous_boxes is None or not len(self.previous_boxes):
+            return np.ones(len(boxes), dtype=bool)
+        return _box_iou(boxes, self.previous_boxes).max(axis=1) < self.new_object_iou
+
+    def _reason(self, candidates, conf):
+        """Why a frame should go to the large model, or None."""
+        if self.pending:
+            return 'track'
+        confident = candidates.conf >= conf
+        boxes = candidates.xyxy[confident]
+        if len(boxes) and np.any(self._unmatched(boxes)):
+            return 'new_object'
+        # Uncertain candidates on objects already in view are being tracked anyway
+        uncertain = candidates.xyxy[~confident]
+        if (len(uncertain) and self.since_escalation >= self.uncertain_interval
+                and np.any(self._unmatched(uncertain))):
+            return 'uncertain'
+        if self.refresh_interval and self.since_escalation >= self.refresh_interval:
+            return 'refresh'
+        return None
+
+    def detect(self, frames, conf=0.25, iou=0.45, imgsz=640):
+        """
+        Run detection on a batch of frames, escalating the frames that need it.
+
+        Escalation decisions are made frame by frame in order, so a frame is compared
+        with the detections actually used for the frame before it.
+
+        Returns:
+            list[Detections]: One entry per input frame, in order
+        """
+        candidates = self.small.detect(frames, conf=min(conf, self.candidate_conf), iou=iou, imgsz=imgsz)
+        escalated = []
+        results = []
+        for i, frame_candidates in enumerate(candidates):
+            reason = self._reason(frame_candidates, conf)
+            self.frames += 1
+            _FRAMES_CASCADE.inc()
+            if reason is not None:
+                self.escalations[reason] += 1
+                self.pending = False
+                self.since_escalation = 0
+                escalated.append(i)
+                results.append(None)
+            else:
+                self.since_escalation += 1
+                keep = frame_candidates.conf >= conf
+                results.append(Detections(frame_candidates.xyxy[keep], frame_candidates.conf[keep],
+                                          frame_candidates.cls[keep]))
+            if results[-1] is not None:
+                self.previous_boxes = results[-1].xyxy
+            else:
+                # The large model will find at least what the small one is sure about
+                self.previous_boxes = frame_candidates.xyxy[frame_candidates.conf >= conf]
+
+        if escalated:
+            for i, detections in zip(escalated, self.large.detect([frames[i] for i in escalated], conf=conf,
+                                                                  iou=iou, imgsz=imgsz)):
+                results[i] = detections
+            if escalated[-1] == len(results) - 1:
+                self.previous_boxes = results[-1].xyxy
+            _FRAMES_ESCALATED.inc(len(escalated))
+        self.batch_escalated = [False] * len(results)
+        for i in escalated:
+            self.batch_escalated[i] = True
+        return results
+
+    def take_pending(self, index, frame, detections, conf=0.25, iou=0.45, imgsz=640):
+        """
+        Serve an escalate_next() request that arrived after the last batch was detected.
+
+        Called by the scan loop for each frame of the batch right before tracking it.
+
+        Args:
+            index (int): Position of the frame in the batch passed to detect()
+            frame (np.ndarray): The frame
+            detections (Detections): What detect() returned for it
+
+        Returns:
+            Detections: The large model's detections if an escalation is pending and the frame
+                did not go to the large model already, otherwise detections
+        """
+        if not self.pending:
+            return detections
+        self.pending = False
+        if self.batch_escalated[index]:
+            return detections
+        self.batch_escalated[index] = True
+        self.escalations['track'] += 1
+        self.since_escalation = 0
+        detections = self.large.detect([frame], conf=conf, iou=iou, imgsz=imgsz)[0]
+        if index == len(self.batch_escalated) - 1:
+            self.previous_boxes = detections.xyxy
+        _FRAMES_ESCALATED.inc()
+        return detections
+
+    def stats(self):
+        """Frames run through the cascade and how many were escalated, by reason."""
+        escalated = sum(self.escalations.values())
+        return {
+            'frames': self.frames,
+            'escalated': escalated,
+            'escalation_rate': escalated / self.frames if self.frames else 0.0,
+            'reasons': dict(self.escalations)
+        }
@@ -0,0 +1,191 @@
+"""
+Frame sources for the detection loop.
+
+FramePrefetcher decodes frames on a background thread into a bounded queue so
+that decoding overlaps with inference; read_frames is the plain sequential
+equivalent. Both yield (frame_number, frame) with 1-based frame numbers,
+optionally downscaled right after decoding, and batched() groups them into
+micro-batches for the detector. read_frames_at re-reads selected frames at
+full resolution after a scan. sample_frames picks frames spread over whole
+videos for calibration and benchmarking.
+"""
+
+import time
+import queue
+import threading
+from itertools import islice
+
+import cv2
+
+from Metrics import STAGE_SECONDS, FRAMES_TOTAL
+
+_DECODE_SECONDS = STAGE_SECONDS.labels(stage='decode')
+_SAMPLE_SECONDS = STAGE_SECONDS.labels(stage='sample')
+_DECODE_WAIT_SECONDS = STAGE_SECONDS.labels(stage='decode_wait')
+_DOWNSCALE_SECONDS = STAGE_SECONDS.labels(stage='downscale')
+_FRAMES_DECODED = FRAMES_TOTAL.labels(kind='decoded')
+
+_END = object()
+
+
+def read_frames(cap, frame_filter=None, start_frame=0, end_frame=None, resize=None):
+    """
+    Yield (frame_number, frame) from an opened cv2.VideoCapture on the calling thread.
+
+    Args:
+        cap: An opened cv2.VideoCapture
+        frame_filter (callable): Optional frame_filter(frame_number, frame) -> bool; frames it rejects are dropped
+        start_frame (int): Frames already consumed before the capture's current position
+        end_frame (Optional[int]): Stop after this frame number
+        resize (Optional[tuple]): (width, height) the frames that pass the filter are downscaled to
+    """
+    frame_number = start_frame
+    while cap.isOpened() and (end_frame is None or frame_number < end_frame):
+        started = time.perf_counter()
+        ret, frame = cap.read()
+        if not ret:
+            break
+        decoded = time.perf_counter()
+        _DECODE_SECONDS.observe(decoded - started)
+        _FRAMES_DECODED.inc()
+        frame_number += 1
+        if frame_filter is not None:
+            keep = frame_filter(frame_number, frame)
+            _SAMPLE_SECONDS.observe(time.perf_counter() - decoded)
+            if not keep:
+                continue
+        if resize is not None:
+            with _DOWNSCALE_SECONDS.time():
+                frame = cv2.resize(frame, resize, interpolation=cv2.INTER_AREA)
+        yield frame_number, frame
+
+
+def read_frames_at(cap, frame_numbers, max_skip=60):
+    """
+    Yield (frame_number, frame) for selected frames of an opened cv2.VideoCapture.
+
+    Nearby frames are reached by grabbing forward (no color conversion for the
+    frames in between), distant ones by seeking.
+
+    Args:
+        cap: An opened cv2.VideoCapture
+        frame_numbers (iterable): 1-based frame numbers, in any order
+        max_skip (int): Largest forward gap bridged by grabbing instead of seeking
+    """
+    position = int(cap.get(cv2.CAP_PROP_POS_FRAMES))  # frames consumed so far
+    for frame_number in sorted(set(frame_numbers)):
+        if frame_number <= position or frame_number - 1 - position > max_skip:
+            cap.set(cv2.CAP_PROP_POS_FRAMES, frame_number - 1)
+            position = frame_number - 1
+        while position < frame_number - 1:
+            if not cap.grab():
+                return
+            position += 1
+        ret, frame = cap.read()
+        if not ret:
+            return
+        position += 1
+        yield frame_number, frame
+
+
+class FramePrefetcher:
+    def __init__(self, cap, queue_size=32, frame_filter=None, start_frame=0, end_frame=None, resize=None):
+        """
+        Start decoding frames from a capture on a background thread.
+
+        Args:
+            cap: An opened cv2.VideoCapture (or anything with the same read()/isOpened() API)
+            queue_size (int): Maximum number of decoded frames held in memory
+            frame_filter (callable): Optional frame_filter(frame_number, frame) -> bool, run on the decoder thread
+            start_frame (int): Frames already consumed before the capture's current position
+            end_frame (Optional[int]): Stop after this frame number
+            resize (Optional[tuple]): (width, height) kept frames are downscaled to on the decoder thread
+        """
+        self.cap = cap
+        self.frame_filter = frame_filter
+        self.start_frame = start_frame
+        self.end_frame = end_frame
+        self.resize = resize
+        self.frames = queue.Queue(maxsize=max(1, queue_size))
+        self.stopped = threading.Event()
+        self.error = None
+        self.thread = threading.Thread(target=self._decode_loop, name="frame-decoder", daemon=True)
+        self.thread.start()
+
+    def _put(self, item):
+        # Block while the queue is full, but give up as soon as the consumer stops
+        while not self.stopped.is_set():
+            try:
+                self.frames.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _decode_loop(self):
+        try:
+            for item in read_frames(self.cap, self.frame_filter, self.start_frame, self.end_frame, self.resize):
+                if not self._put(item):
+                    return
+        except Exception as e:
+            self.error = e
+        finally:
+            self._put(_END)
+
+    def __iter__(self):
+        try:
+            while True:
+                # Time spent here is the detector waiting on the decoder
+                started = time.perf_counter()
+                item = self.frames.get()
+                _DECODE_WAIT_SECONDS.observe(time.perf_counter() - started)
+                if item is _END:
+                    break
+                yield item
+        finally:
+            self.stop()
+        if self.error is not None:
+            raise self.error
+
+    def stop(self):
+        """Stop the decoder thread and wait for it to exit."""
+        self.stopped.set()
+        if self.thread is not threading.current_thread():
+            self.thread.join()
+
+
+def batched(frames, batch_size):
+    """Group an iterable of (frame_number, frame) into lists of up to batch_size items."""
+    batch = []
+    for item in frames:
+        batch.append(item)
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def sample_frames(video_paths, max_frames):
+    """
+    Sample up to max_frames frames spread evenly over a set of videos.
+
+    Args:
+        video_paths (list[str]): Local video files
+        max_frames (int): Total number of frames to return
+
+    Returns:
+        list[np.ndarray]: BGR frames
+    """
+    per_video = max(1, max_frames // len(video_paths))
+    frames = []
+    for path in video_paths:
+        cap = cv2.VideoCapture(path)
+        if not cap.isOpened():
+            raise IOError(f"Could not open video file '{path}'")
+        total = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+        stride = max(1, total // per_video) if total > 0 else 1
+        sampled = read_frames(cap, frame_filter=lambda n, _: (n - 1) % stride == 0)
+        frames.extend(frame for _, frame in islice(sampled, per_video))
+        cap.release()
+    return frames[:max_frames]
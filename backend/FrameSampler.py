@@ -0,0 +1,104 @@
+"""
+Scene-aware frame sampling.
+
+Handheld walkthroughs spend a lot of time nearly static (the camera lingers on
+a shelf, the user turns slowly). Running the detector on every one of those
+frames is wasted work, so the sampler estimates inter-frame motion on a tiny
+grayscale thumbnail and only lets frames through densely while the view is
+changing, and sparsely while it is not.
+"""
+
+import cv2
+import numpy as np
+
+
+class AdaptiveFrameSampler:
+    def __init__(self, min_stride=1, max_stride=8, motion_low=2.0, motion_high=12.0, thumb_width=64):
+        """
+        Initialize the sampler.
+
+        Args:
+            min_stride (int): Frame stride used while the camera is moving quickly
+            max_stride (int): Frame stride used while the view is static
+            motion_low (float): Mean absolute thumbnail difference (0-255) at or below which the view counts as static
+            motion_high (float): Mean absolute thumbnail difference at or above which the view counts as a pan
+            thumb_width (int): Width of the grayscale thumbnail used for motion estimation
+        """
+        self.min_stride = max(1, int(min_stride))
+        self.max_stride = max(self.min_stride, int(max_stride))
+        self.motion_low = motion_low
+        self.motion_high = max(motion_high, motion_low + 1e-6)
+        self.thumb_width = thumb_width
+
+        self.reference = None  # Thumbnail of the last frame let through
+        self.last_frame_number = None
+        self.frames_seen = 0
+        self.frames_sampled = 0
+
+    @property
+    def adaptive(self):
+        return self.max_stride > self.min_stride
+
+    def _thumbnail(self, frame):
+        height, width = frame.shape[:2]
+        # Decimate before resizing so the cost does not grow with the source resolution
+        step = max(1, width // (self.thumb_width * 4))
+        small = frame[::step, ::step]
+        thumb_height = max(1, int(round(self.thumb_width * height / width)))
+        small = cv2.resize(small, (self.thumb_width, thumb_height), interpolation=cv2.INTER_AREA)
+        return cv2.cvtColor(small, cv2.COLOR_BGR2GRAY).astype(np.int16)
+
+    def stride_for_motion(self, motion):
+        """Map a motion estimate to the stride the sampler should currently use."""
+        if motion <= self.motion_low:
+            return self.max_stride
+        if motion >= self.motion_high:
+            return self.min_stride
+        t = (motion - self.motion_low) / (self.motion_high - self.motion_low)
+        return int(round(self.max_stride - t * (self.max_stride - self.min_stride)))
+
+    def should_process(self, frame_number, frame):
+        """
+        Decide whether a frame should go through the detector.
+
+        Args:
+            frame_number (int): 1-based frame number in the source video
+            frame (np.ndarray): The decoded BGR frame
+
+        Returns:
+            bool: True if the frame should be processed
+        """
+        self.frames_seen += 1
+        gap = None if self.last_frame_number is None else frame_number - self.last_frame_number
+
+        if gap is None:
+            process = True
+        elif gap < self.min_stride:
+            process = False
+        elif not self.adaptive:
+            process = gap >= self.min_stride
+        elif gap >= self.max_stride:
+            process = True
+        else:
+            # Motion is measured against the last processed frame, so slow drift
+            # accumulates until it is large enough to trigger a detection
+            thumb = self._thumbnail(frame)
+            motion = float(np.mean(np.abs(thumb - self.reference)))
+            process = gap >= self.stride_for_motion(motion)
+            if process:
+                self.reference = thumb
+
+        if process:
+            if self.adaptive and (gap is None or gap >= self.max_stride):
+                self.reference = self._thumbnail(frame)
+            self.last_frame_number = frame_number
+            self.frames_sampled += 1
+        return process
+
+    def stats(self):
+        """Return how many frames were seen and how many were let through."""
+        return {
+            'frames_seen': self.frames_seen,
+            'frames_sampled': self.frames_sampled,
+            'reduction': self.frames_seen / self.frames_sampled if self.frames_sampled else 0.0
+        }
@@ -1,12 +1,15 @@
 import os
 import base64
 import google.generativeai as genai
-from PIL import Image
-import io
 import ast
+import json
 import requests
 from dotenv import load_dotenv
 
+from Metrics import track_call
+from ValuationExecutor import gemini_limiter
+from ValuationCache import valuation_cache, perceptual_hash
+
 # Load environment variables
 load_dotenv()
 
@@ -16,27 +19,53 @@ if not GEMINI_API_KEY:
     print("Warning: GEMINI_API_KEY not found in environment variables")
 genai.configure(api_key=GEMINI_API_KEY)
 
+# Most crops packed into one batched valuation request
+GEMINI_BATCH_SIZE = int(os.environ.get("GEMINI_BATCH_SIZE", 8))
+
+
+def image_part(image_data):
+    """Request part for an image: encoded bytes are sent as they are, without decoding them first."""
+    if isinstance(image_data, (bytes, bytearray)):
+        mime_type = "image/png" if image_data[:8] == b"\x89PNG\r\n\x1a\n" else "image/jpeg"
+        return {"mime_type": mime_type, "data": bytes(image_data)}
+    return image_data  # Assume it's already a PIL Image
+
 class FurniturePriceEstimator:
     def __init__(self):
         # Initialize Gemini model
         self.model = genai.GenerativeModel('gemini-2.0-flash-lite')
 
-    def analyze_item_with_gemini(self, image_data):
+    def _generate(self, stage, contents, **kwargs):
+        """One timed generate_content request (a single attempt)."""
+        with track_call('gemini', stage):
+            return self.model.generate_content(contents, **kwargs)
+
+    def analyze_item_with_gemini(self, image_data, label=None):
         """
         Analyzes an image of furniture and returns a tuple of (name, price).
         
+        A near-duplicate of an item valued before (same detected class) is answered
+        from the valuation cache without calling Gemini.
+        
         Args:
             image_data: Either a bytes object containing image data or a PIL Image object
+            label (str): Optional detector class name, part of the cache key
             
         Returns:
             tuple: (name: str, price: int)
         """
-        # Convert image data to PIL Image
-        if isinstance(image_data, bytes):
-            image = Image.open(io.BytesIO(image_data))
-        else:
-            image = image_data  # Assume it's already a PIL Image
-        
+        phash = perceptual_hash(image_data) if valuation_cache is not None else None
+        if phash is not None:
+            cached = valuation_cache.get(phash, label)
+            if cached is not None:
+                return cached
+        valuation = self._analyze_item(image_data)
+        if phash is not None:
+            valuation_cache.put(phash, label, *valuation)
+        return valuation
+
+    def _analyze_item(self, image_data):
+        """Value one item with its own Gemini request (no cache)."""
         prompt = """
         Please analyze this item, make a conservative estimate of its price and and produce a single, number value between 1 and 1000000.
         If ever questioning the quality of the image or the premiumness of the item, choose a lower quartile price for the object.
@@ -46,8 +75,8 @@ class FurniturePriceEstimator:
         The object should be a common household item, if it is not, be safe and return the name, but set the price to 0.
         """
         
-        # Get response from Gemini
-        response = self.model.generate_content([prompt, image])
+        # Get response from Gemini (rate limited, with retries)
+        response = gemini_limiter.call(self._generate, 'gemini_valuation', [prompt, image_part(image_data)])
         
         try:
             # Parse the response into a tuple
@@ -57,4 +86,107 @@ class FurniturePriceEstimator:
             else:
                 raise ValueError("Invalid response format")
         except (ValueError, SyntaxError) as e:
-            raise ValueError(f"Could not parse response: {str(e)}")
\ No newline at end of file
+            raise ValueError(f"Could not parse response: {str(e)}")
+
+    def analyze_items_with_gemini(self, images, labels=None):
+        """
+        Analyzes several item images in one request and returns a (name, price) tuple per image.
+
+        Items found in the valuation cache are answered from it and left out of the request.
+        Items missing from the response or with a malformed entry (or all of them, if the
+        batch request fails or its response cannot be parsed) are valued one by one.
+
+        Args:
+            images (list): Image bytes or PIL Images, one per item
+            labels (list): Optional detector class name per item, given to the model as a hint and part of the cache key
+
+        Returns:
+            list: (name: str, price: int) per image, or None where even the single-item call failed
+        """
+        labels = labels if labels is not None else [None] * len(images)
+        results = {}
+        hashes = [None] * len(images)
+        if valuation_cache is not None:
+            for i, image in enumerate(images):
+                hashes[i] = perceptual_hash(image)
+                cached = valuation_cache.get(hashes[i], labels[i])
+                if cached is not None:
+                    results[i] = cached
+
+        uncached = [i for i in range(len(images)) if i not in results]
+        if len(uncached) > 1:
+            batch = {}
+            try:
+                batch = self._analyze_batch([images[i] for i in uncached], [labels[i] for i in uncached])
+            except Exception as e:
+                print(f"Batch valuation of {len(uncached)} items failed, valuing them one by one: {str(e)}")
+            if len(batch) < len(uncached):
+                print(f"Batch valuation returned {len(batch)} of {len(uncached)} items")
+            for position, valuation in batch.items():
+                results[uncached[position]] = valuation
+                if hashes[uncached[position]] is not None:
+                    valuation_cache.put(hashes[uncached[position]], labels[uncached[position]], *valuation)
+
+        valuations = []
+        for i, image in enumerate(images):
+            if i in results:
+                valuations.append(results[i])
+                continue
+            try:
+                valuations.append(self._analyze_item(image))
+                if hashes[i] is not None:
+                    valuation_cache.put(hashes[i], labels[i], *valuations[-1])
+            except Exception as e:
+                print(f"Error estimating price for item {i + 1} of the batch: {str(e)}")
+                valuations.append(None)
+        return valuations
+
+    def _analyze_batch(self, images, labels=None):
+        """Send all images in one request; return {index: (name, price)} for the well-formed entries."""
+        prompt = f"""
+        You are given {len(images)} images, each labeled "Item N" and showing one item that fills about 90% of the frame.
+        For each item, make a conservative estimate of its price as a single number between 1 and 1000000.
+        If ever questioning the quality of the image or the premiumness of the item, choose a lower quartile price for the object.
+        Decide a very short description name for each item, 3-7 words.
+        If an item is not a common household item, be safe and return its name, but set its price to 0.
+        Respond with a JSON array containing exactly one object per item, in the format
+        [{{"item": 1, "name": "name of object", "price": 100}}, ...]
+        Only output the JSON array, nothing else.
+        """
+        contents = [prompt]
+        for i, image_data in enumerate(images):
+            label = f"Item {i + 1}"
+            if labels is not None and labels[i]:
+                label += f" (detected as {labels[i]})"
+            contents.append(label + ":")
+            contents.append(image_part(image_data))
+
+        response = gemini_limiter.call(self._generate, 'gemini_batch_valuation', contents,
+                                       generation_config={"response_mime_type": "application/json"})
+
+        text = response.text.strip()
+        if text.startswith("```"):
+            text = text.strip("`")
+            text = text[text.find("["):]
+        entries = json.loads(text)
+        if not isinstance(entries, list):
+            raise ValueError("Batch response is not a list")
+
+        results = {}
+        duplicates = set()
+        for entry in entries:
+            try:
+                index = int(entry["item"]) - 1
+                name = entry["name"]
+                price = int(round(float(entry["price"])))
+            except (TypeError, KeyError, ValueError):
+                continue
+            if not 0 <= index < len(images) or not isinstance(name, str) or not name.strip():
+                continue
+            if index in results:
+                duplicates.add(index)
+            results[index] = (name.strip(), price)
+        # Conflicting answers for the same item are re-asked individually
+        for index in duplicates:
+            del results[index]
+        return results
@@ -0,0 +1,175 @@
+"""
+Running inventory of counted items.
+
+Items get their stable ID ("<class>_<n>") at the moment a track is counted,
+and per-class counts, totals and price statistics are updated in O(1) as
+snapshots and valuations come in, so the final report is read off directly
+instead of being recomputed by rescanning every tracked object per item.
+"""
+
+from collections import defaultdict
+
+
+class InventoryAggregator:
+    def __init__(self):
+        self.counts = defaultdict(int)  # class name -> number of counted items
+        self.items = {}  # item_id -> metadata, in counting order
+        self.tracks = {}  # track_id -> item_id
+        self.numbers = {}  # item_id -> per-class item number
+        self.by_class = defaultdict(list)  # class name -> item_ids
+        self.stats = {}  # class name -> statistics over items with snapshots
+
+    def _class_stats(self, class_name):
+        # Plain dict rather than a defaultdict with a lambda so the aggregator
+        # can be pickled back from segment worker processes
+        if class_name not in self.stats:
+            self.stats[class_name] = {
+                'items': 0,
+                'priced': 0,
+                'total_value': 0.0,
+                'min_price': None,
+                'max_price': None
+            }
+        return self.stats[class_name]
+
+    def __len__(self):
+        return len(self.items)
+
+    def count_item(self, track_id, class_name, confidence, frame_number):
+        """
+        Register a newly counted track and assign its item ID.
+
+        Args:
+            track_id (int): Tracker ID of the object
+            class_name (str): Majority class of the track
+            confidence (float): Detection confidence when counted
+            frame_number (int): Frame in which the track was counted
+
+        Returns:
+            str: The item ID
+        """
+        self.counts[class_name] += 1
+        item_id = f"{class_name}_{self.counts[class_name]}"
+        self.items[item_id] = {
+            "class": class_name,
+            "track_id": int(track_id),
+            "confidence": float(confidence),
+            "first_seen_frame": frame_number,
+            "snapshot_path": None,
+            "estimated_value": None
+        }
+        self.tracks[int(track_id)] = item_id
+        self.numbers[item_id] = self.counts[class_name]
+        self.by_class[class_name].append(item_id)
+        return item_id
+
+    def add_track(self, track_id, item_track_id):
+        """Attach another track ID (a re-identified object) to the item counted under item_track_id."""
+        self.tracks[int(track_id)] = self.tracks[int(item_track_id)]
+
+    def item_for_track(self, track_id):
+        """Return (item_id, per-class item number) for a counted track, or (None, None)."""
+        item_id = self.tracks.get(int(track_id))
+        return item_id, self.numbers.get(item_id)
+
+    def attach_snapshot(self, item_id, public_url, confidence, frame_number):
+        """Record the uploaded snapshot of an item; only items with snapshots are reported."""
+        item = self.items[item_id]
+        listed = item.get("public_url") is not None
+        item["public_url"] = public_url
+        item["best_confidence"] = float(confidence)
+        item["snapshot_frame"] = int(frame_number)
+        if not listed:
+            self._class_stats(item["class"])['items'] += 1
+            self._add_price(item, 1)
+
+    def set_valuation(self, item_id, name, price):
+        """Record the estimated name and price (None if unknown) of an item."""
+        item = self.items[item_id]
+        listed = item.get("public_url") is not None
+        old_price = item.get("estimated_price")
+        if listed:
+            self._add_price(item, -1)
+        item["estimated_name"] = name
+        item["estimated_price"] = price
+        if listed:
+            self._add_price(item, 1)
+            stats = self._class_stats(item["class"])
+            # A replaced price may have been the class minimum or maximum
+            if old_price is not None and float(old_price) in (stats['min_price'], stats['max_price']):
+                self._refresh_extremes(item["class"])
+
+    def _refresh_extremes(self, class_name):
+        """Recompute a class's min and max price from the current valuations of its listed items."""
+        items = [self.items[item_id] for item_id in self.by_class[class_name]]
+        prices = [float(item["estimated_price"]) for item in items
+                  if item.get("public_url") is not None and item.get("estimated_price") is not None]
+        stats = self._class_stats(class_name)
+        stats['min_price'] = min(prices) if prices else None
+        stats['max_price'] = max(prices) if prices else None
+
+    def _add_price(self, item, sign):
+        price = item.get("estimated_price")
+        if price is None:
+            return
+        price = float(price)
+        stats = self._class_stats(item["class"])
+        stats['priced'] += sign
+        stats['total_value'] += sign * price
+        if sign > 0:
+            stats['min_price'] = price if stats['min_price'] is None else min(stats['min_price'], price)
+            stats['max_price'] = price if stats['max_price'] is None else max(stats['max_price'], price)
+
+    @property
+    def total_value(self):
+        return sum(stats['total_value'] for stats in self.stats.values())
+
+    @property
+    def item_count(self):
+        """Number of items with snapshots."""
+        return sum(stats['items'] for stats in self.stats.values())
+
+    def listed_items(self):
+        """Metadata of the items with snapshots, keyed by item ID."""
+        return {item_id: item for item_id, item in self.items.items() if item.get("public_url") is not None}
+
+    def summary(self):
+        """
+        Final inventory summary over the items with snapshots.
+
+        Returns:
+            dict: total_items, total_value and per-class count, priced, total_value, average, min and max price
+        """
+        classes = {}
+        for class_name, stats in sorted(self.stats.items()):
+            if not stats['items']:
+                continue
+            classes[class_name] = dict(
+                stats,
+                average_price=stats['total_value'] / stats['priced'] if stats['priced'] else 0
+            )
+        return {
+            'total_items': self.item_count,
+            'total_value': self.total_value,
+            'classes': classes
+        }
+
+    def print_report(self):
+        """Print the final inventory: per-class counts and item prices, then the totals."""
+        print("\nFinal Items Inventory:")
+        summary = self.summary()
+        for class_name, stats in summary['classes'].items():
+            print(f"{class_name}: {stats['items']} items")
+            for item_id in self.by_class[class_name]:
+                item = self.items[item_id]
+                if item.get("public_url") is None:
+                    continue
+                price = item.get("estimated_price")
+                if price is not None:
+                    print(f"  - {item['estimated_name']}: ${float(price):,.2f}")
+                else:
+                    print(f"  - {item['estimated_name']}: Price not available")
+
+        print(f"\nTotal unique items with snapshots: {summary['total_items']}")
+        print(f"Total estimated value: ${summary['total_value']:,.2f}")
+        print(f"Snapshots uploaded: {summary['total_items']}")
@@ -0,0 +1,275 @@
+"""
+On-disk checkpoints for video jobs.
+
+A job's checkpoint directory holds up to four files:
+  job.json         what to run (video URL and options), written when the job is
+                   queued so queued and running jobs survive a restart
+  scan.pkl         scan state: the frame reached plus the tracker, track table,
+                   counted items and chosen snapshots (or the finished scan)
+  valuations.pkl   snapshots already uploaded and valued, by track ID
+  claim.lock       locked (flock) by the process that has the job queued or
+                   running, so a job is never picked up by two processes; it
+                   outlives clear() and goes with the claim
+
+Every write goes to a temporary file that is renamed over the previous one,
+so a worker dying mid-write leaves the last complete checkpoint in place. A
+restarted job resumes the scan from the recorded frame and skips the uploads
+and Gemini calls it already paid for.
+"""
+
+import os
+import re
+import json
+import time
+import pickle
+import shutil
+import logging
+import tempfile
+from typing import Optional, Dict, Any, List
+
+try:
+    import fcntl
+except ImportError:  # Windows: no cross-process claims
+    fcntl = None
+
+CHECKPOINT_DIR = os.environ.get(
+    "CHECKPOINT_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "checkpoints")
+)
+# Seconds between scan checkpoints
+CHECKPOINT_INTERVAL = float(os.environ.get("CHECKPOINT_INTERVAL", 30))
+# Checkpoints of jobs that are not queued any more are deleted after this many seconds
+CHECKPOINT_TTL = float(os.environ.get("CHECKPOINT_TTL", 7 * 24 * 3600))
+
+SCAN_VERSION = 2
+
+# Job IDs become directory names: no separators, dots or other path syntax
+_JOB_ID_PATTERN = re.compile(r'^[A-Za-z0-9_-]{1,128}$')
+
+
+def valid_job_id(job_id) -> bool:
+    """True if job_id is safe to use as a file name (letters, digits, '-' and '_')."""
+    return isinstance(job_id, str) and _JOB_ID_PATTERN.match(job_id) is not None
+
+
+def _atomic_write(path: str, data: bytes):
+    fd, tmp_path = tempfile.mkstemp(prefix=".tmp-", dir=os.path.dirname(path))
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+class JobCheckpoint:
+    def __init__(self, job_id: str, directory: Optional[str] = None, interval: float = CHECKPOINT_INTERVAL):
+        """
+        Checkpoint store of a single job.
+
+        Args:
+            job_id (str): The ID of the job row
+            directory (Optional[str]): Root checkpoint directory (env CHECKPOINT_DIR)
+            interval (float): Minimum seconds between scan checkpoints (env CHECKPOINT_INTERVAL)
+
+        Raises:
+            ValueError: If job_id is not a valid job ID
+        """
+        self.job_id = str(job_id)
+        if not valid_job_id(self.job_id):
+            raise ValueError(f"Invalid job ID {self.job_id!r}")
+        root = os.path.realpath(directory or CHECKPOINT_DIR)
+        self.path = os.path.join(root, self.job_id)
+        if os.path.dirname(os.path.realpath(self.path)) != root:
+            raise ValueError(f"Checkpoint of job {self.job_id!r} would be outside {root}")
+        self.interval = interval
+        self.last_saved = time.monotonic()
+        self.valuations = None
+        self.claim_fd = None
+
+    def _file(self, name: str) -> str:
+        return os.path.join(self.path, name)
+
+    def _write(self, name: str, data: bytes):
+        os.makedirs(self.path, exist_ok=True)
+        _atomic_write(self._file(name), data)
+
+    def _read_pickle(self, name: str):
+        try:
+            with open(self._file(name), 'rb') as f:
+                return pickle.load(f)
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            # A checkpoint from an incompatible version of the code: start over
+            logging.warning(f"Ignoring unreadable checkpoint {self._file(name)}: {str(e)}")
+            return None
+
+    # Job description
+
+    def save_job(self, video_url: str, show_display: bool, options: Dict[str, Any]):
+        """Record what the job runs so it can be requeued after a restart."""
+        self._write('job.json', json.dumps({
+            'job_id': self.job_id,
+            'video_url': video_url,
+            'show_display': show_display,
+            'options': options,
+            'queued_at': time.time()
+        }).encode())
+
+    def load_job(self) -> Optional[Dict[str, Any]]:
+        try:
+            with open(self._file('job.json')) as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return None
+
+    def release_job(self):
+        """Stop requeueing the job on restart (its scan and valuation state is kept for a manual retry)."""
+        if os.path.exists(self._file('job.json')):
+            os.remove(self._file('job.json'))
+
+    # Claim
+
+    def claim(self) -> bool:
+        """
+        Take the job for this process. The claim holds until release_claim() or until the
+        process exits, whichever comes first, so a crashed worker never blocks recovery.
+
+        Returns:
+            bool: False if another process (or another claim in this one) already holds the job
+        """
+        if fcntl is None or self.claim_fd is not None:
+            return True
+        lock_path = self._file('claim.lock')
+        while True:
+            os.makedirs(self.path, exist_ok=True)
+            try:
+                fd = os.open(lock_path, os.O_RDWR | os.O_CREAT, 0o644)
+            except FileNotFoundError:
+                continue  # the previous holder removed the directory after makedirs
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                os.close(fd)
+                return False
+            try:
+                current = os.stat(lock_path)
+            except FileNotFoundError:
+                current = None
+            if current is not None and os.path.samestat(os.fstat(fd), current):
+                self.claim_fd = fd
+                return True
+            # Locked a file the previous holder removed on release: claim the current one
+            os.close(fd)
+
+    def release_claim(self):
+        """Let other processes pick the job up again (removing the checkpoint if it was cleared)."""
+        if self.claim_fd is None:
+            return
+        try:
+            # A cleared checkpoint only kept the lock file for the claim
+            if os.listdir(self.path) == ['claim.lock']:
+                os.remove(self._file('claim.lock'))
+                os.rmdir(self.path)
+        except OSError:
+            pass
+        os.close(self.claim_fd)
+        self.claim_fd = None
+
+    # Scan state
+
+    def due(self) -> bool:
+        """True when the checkpoint interval has elapsed since the last scan checkpoint."""
+        return time.monotonic() - self.last_saved >= self.interval
+
+    def save_scan(self, video_path: str, frame_number: int, state: Dict[str, Any], complete: bool = False):
+        """
+        Write the scan state reached after frame_number.
+
+        Args:
+            video_path (str): The video being scanned (a checkpoint is only resumed for the same video)
+            frame_number (int): Last frame whose detections are reflected in state
+            state (dict): Picklable scan state (or the finished scan result when complete)
+            complete (bool): The scan is finished and state is its result
+        """
+        started = time.monotonic()
+        self._write('scan.pkl', pickle.dumps({
+            'version': SCAN_VERSION,
+            'video_path': video_path,
+            'frame_number': frame_number,
+            'complete': complete,
+            'state': state
+        }, protocol=pickle.HIGHEST_PROTOCOL))
+        self.last_saved = time.monotonic()
+        logging.info(f"Checkpointed job {self.job_id} at frame {frame_number} "
+                     f"in {self.last_saved - started:.2f}s")
+
+    def load_scan(self, video_path: str) -> Optional[Dict[str, Any]]:
+        """Return the saved scan checkpoint for this video, or None."""
+        saved = self._read_pickle('scan.pkl')
+        if saved is None or saved.get('version') != SCAN_VERSION or saved.get('video_path') != video_path:
+            return None
+        return saved
+
+    # Valuations
+
+    def load_valuations(self) -> Dict[int, Dict[str, Any]]:
+        """Snapshots already uploaded and valued, {track_id: {public_url, estimated_name, estimated_price}}."""
+        if self.valuations is None:
+            self.valuations = self._read_pickle('valuations.pkl') or {}
+        return self.valuations
+
+    def save_valuation(self, track_id: int, valuation: Dict[str, Any]):
+        """Record a finished upload and valuation."""
+        valuations = self.load_valuations()
+        valuations[int(track_id)] = valuation
+        self._write('valuations.pkl', pickle.dumps(valuations, protocol=pickle.HIGHEST_PROTOCOL))
+
+    def clear(self):
+        """
+        Delete the checkpoint once the job has completed.
+
+        The claim's lock file is left in place: whoever holds the claim still does until
+        release_claim(), which removes the rest.
+        """
+        try:
+            names = os.listdir(self.path)
+        except FileNotFoundError:
+            return
+        for name in names:
+            if name == 'claim.lock':
+                continue
+            path = self._file(name)
+            if os.path.isdir(path):
+                shutil.rmtree(path, ignore_errors=True)
+            elif os.path.exists(path):
+                os.remove(path)
+        if not os.path.exists(self._file('claim.lock')):
+            shutil.rmtree(self.path, ignore_errors=True)
+
+
+def pending_jobs(directory: Optional[str] = None) -> List[Dict[str, Any]]:
+    """
+    Jobs that were queued or running when the process stopped, oldest first.
+
+    Checkpoints without a queued job that are older than CHECKPOINT_TTL are removed.
+    """
+    root = directory or CHECKPOINT_DIR
+    if not os.path.isdir(root):
+        return []
+    jobs = []
+    for job_id in os.listdir(root):
+        if not valid_job_id(job_id) or not os.path.isdir(os.path.join(root, job_id)):
+            continue
+        checkpoint = JobCheckpoint(job_id, directory=root)
+        job = checkpoint.load_job()
+        if job is not None:
+            jobs.append(job)
+        elif time.time() - os.path.getmtime(checkpoint.path) > CHECKPOINT_TTL and checkpoint.claim():
+            checkpoint.clear()
+            checkpoint.release_claim()
+    return sorted(jobs, key=lambda job: job.get('queued_at', 0))
@@ -0,0 +1,200 @@
+"""
+Background job queue for video processing.
+
+The API enqueues (job_id, video_url) pairs and returns immediately; a fixed
+pool of worker threads pulls jobs off the queue, runs process_video and keeps
+the job row in Supabase up to date ('processing' -> 'completed' / 'failed').
+Queued jobs are recorded in the checkpoint directory, so after a restart
+recover() requeues them and they resume from their last checkpoint. A job
+is claimed (see JobCheckpoint.claim) from the moment it is queued until it
+finishes, so two processes sharing the checkpoint directory never run it twice.
+"""
+
+import os
+import time
+import queue
+import threading
+import logging
+from typing import Callable, Optional, Dict, Any
+
+from JobCheckpoint import JobCheckpoint, pending_jobs
+from ProgressBroker import progress_broker
+from Metrics import JOBS_TOTAL, STAGE_SECONDS
+
+
+class QueueFullError(Exception):
+    """Raised when the queue already holds the maximum number of pending jobs."""
+
+
+class JobClaimedError(Exception):
+    """Raised when the job is already queued or running, in this process or another one."""
+
+
+class JobQueue:
+    def __init__(self, db, num_workers: Optional[int] = None, max_pending: Optional[int] = None,
+                 process: Optional[Callable] = None):
+        """
+        Initialize the job queue.
+
+        Args:
+            db (SupaDB): Database client used to update job status
+            num_workers (Optional[int]): Number of concurrent workers (env VIDEO_WORKERS, default 2)
+            max_pending (Optional[int]): Maximum number of queued jobs, 0 for unbounded (env VIDEO_QUEUE_SIZE)
+            process (Optional[callable]): Runs a job, process(video_url, job_id, db, show_display, **options)
+                (defaults to app.process_video, imported when the first job runs: importing app
+                connects to Supabase)
+        """
+        self.db = db
+        self.process = process
+        if num_workers is None:
+            num_workers = int(os.environ.get("VIDEO_WORKERS", 2))
+        if max_pending is None:
+            max_pending = int(os.environ.get("VIDEO_QUEUE_SIZE", 0))
+        self.num_workers = max(1, num_workers)
+        self.jobs = queue.Queue(maxsize=max_pending)
+        self.workers = []
+        self.active_jobs = set()
+        self.claims = {}  # job_id -> JobCheckpoint holding the job's claim
+        self.lock = threading.Lock()
+
+    def start(self):
+        """Start the worker threads. Safe to call more than once."""
+        with self.lock:
+            if self.workers:
+                return
+            for i in range(self.num_workers):
+                worker = threading.Thread(target=self._worker_loop, name=f"video-worker-{i}", daemon=True)
+                worker.start()
+                self.workers.append(worker)
+        logging.info(f"Job queue started with {self.num_workers} workers")
+
+    def stop(self):
+        """Signal every worker to exit once the jobs already queued are done."""
+        with self.lock:
+            workers, self.workers = self.workers, []
+        for _ in workers:
+            self.jobs.put(None)
+        for worker in workers:
+            worker.join()
+
+    def submit(self, job_id: str, video_url: str, show_display: bool = False, **options) -> int:
+        """
+        Enqueue a video processing job.
+
+        Args:
+            job_id (str): The ID of the job row
+            video_url (str): Public URL (or local path) of the video to process
+            show_display (bool): Whether to render the annotated display
+            **options: Extra keyword arguments for process_video (e.g. preview_path)
+
+        Returns:
+            int: Number of jobs ahead of this one (queued or running)
+
+        Raises:
+            QueueFullError: If the queue is at capacity
+            JobClaimedError: If the job is already queued or running
+            ValueError: If job_id is not a valid job ID
+        """
+        checkpoint = JobCheckpoint(job_id)
+        if not checkpoint.claim():
+            raise JobClaimedError(f"Job {job_id} is already queued or running")
+        checkpoint.save_job(video_url, show_display, options)
+        # Position and enqueue together, so concurrent submits get distinct positions
+        with self.lock:
+            position = self.jobs.qsize() + len(self.active_jobs)
+            try:
+                self.jobs.put_nowait({
+                    'job_id': job_id,
+                    'video_url': video_url,
+                    'show_display': show_display,
+                    'options': options
+                })
+            except queue.Full:
+                checkpoint.release_job()
+                checkpoint.release_claim()
+                raise QueueFullError(f"Job queue is full ({self.jobs.maxsize} pending jobs)")
+            self.claims[job_id] = checkpoint
+        progress_broker.publish(job_id, 'status', status='queued', queue_position=position)
+        return position
+
+    def recover(self) -> int:
+        """
+        Requeue the jobs that were queued or running when the process last stopped.
+        Jobs claimed by another live process are left to it.
+
+        Returns:
+            int: Number of jobs requeued
+        """
+        recovered = 0
+        for job in pending_jobs():
+            try:
+                self.submit(job['job_id'], job['video_url'], job.get('show_display', False), **job.get('options', {}))
+                recovered += 1
+            except QueueFullError:
+                logging.warning(f"Job queue full, could not requeue job {job['job_id']}")
+            except JobClaimedError:
+                logging.info(f"Job {job['job_id']} is claimed by another process, not requeueing it")
+        if recovered:
+            logging.info(f"Requeued {recovered} interrupted jobs")
+        return recovered
+
+    def stats(self) -> Dict[str, Any]:
+        """Return a snapshot of the queue state."""
+        with self.lock:
+            active = list(self.active_jobs)
+        return {
+            'workers': self.num_workers,
+            'pending': self.jobs.qsize(),
+            'active': active
+        }
+
+    def _worker_loop(self):
+        # Load and warm the detector before taking jobs; the registry makes sure
+        # this happens once per process no matter how many workers there are
+        try:
+            from ModelRegistry import model_registry
+            model_registry.preload()
+        except Exception as e:
+            logging.error(f"Could not preload models: {str(e)}")
+        while True:
+            job = self.jobs.get()
+            try:
+                if job is None:
+                    return
+                self._run_job(job)
+            finally:
+                self.jobs.task_done()
+
+    def _run_job(self, job: Dict[str, Any]):
+        job_id = job['job_id']
+        with self.lock:
+            self.active_jobs.add(job_id)
+        started = time.perf_counter()
+        try:
+            logging.info(f"Worker {threading.current_thread().name} starting job {job_id}")
+            self.db.update_job_status(job_id, 'processing')
+            progress_broker.publish(job_id, 'status', status='processing')
+            if self.process is None:
+                from app import process_video
+                self.process = process_video
+            self.process(job['video_url'], job_id, self.db, job['show_display'], **job['options'])
+            progress_broker.publish(job_id, 'status', status='completed')
+            JOBS_TOTAL.inc(status='completed')
+            logging.info(f"Job {job_id} completed successfully")
+        except Exception as e:
+            logging.error(f"Error during video processing for job {job_id}: {str(e)}")
+            # Do not retry a failing job on every restart; its checkpoint stays for a manual resubmit
+            JobCheckpoint(job_id).release_job()
+            progress_broker.publish(job_id, 'status', status='failed', error=str(e))
+            JOBS_TOTAL.inc(status='failed')
+            try:
+                self.db.update_job_status(job_id, 'failed')
+            except Exception as status_error:
+                logging.error(f"Could not mark job {job_id} as failed: {str(status_error)}")
+        finally:
+            STAGE_SECONDS.observe(time.perf_counter() - started, stage='job')
+            with self.lock:
+                self.active_jobs.discard(job_id)
+                checkpoint = self.claims.pop(job_id, None)
+            if checkpoint is not None:
+                checkpoint.release_claim()
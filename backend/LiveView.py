@@ -0,0 +1,214 @@
+"""
+Live view of running jobs.
+
+The processing loop hands a frame to the job's LiveFramePublisher at most
+LIVE_VIEW_FPS times per second (the hot loop only pays for a clock check on
+the other frames). A background thread downscales it, draws the tracking
+overlay and encodes it to JPEG once, into a small per-job ring buffer kept in
+memory. The API serves /api/latest-frame and the MJPEG stream of
+/api/job/<job_id>/live straight from those buffers, so any number of viewers
+share the same encoded frames and nothing is written to disk.
+"""
+
+import os
+import time
+import queue
+import threading
+from collections import deque
+from typing import Dict, Iterator, Optional, Tuple
+
+import cv2
+
+from PreviewEncoder import annotate_frame
+from Metrics import STAGE_SECONDS
+
+# Published frames per second per job
+LIVE_VIEW_FPS = float(os.environ.get("LIVE_VIEW_FPS", 5))
+# Width of published frames (smaller sources are not upscaled)
+LIVE_VIEW_WIDTH = int(os.environ.get("LIVE_VIEW_WIDTH", 640))
+LIVE_VIEW_QUALITY = int(os.environ.get("LIVE_VIEW_QUALITY", 70))
+# Encoded frames kept per job
+LIVE_VIEW_FRAMES = int(os.environ.get("LIVE_VIEW_FRAMES", 8))
+
+BOUNDARY = 'frame'
+
+
+class FrameRing:
+    def __init__(self, size: int):
+        self.frames = deque(maxlen=max(1, size))  # (sequence number, frame number, JPEG bytes)
+        self.sequence = 0
+        self.closed_at = None
+        self.updated_at = time.monotonic()
+
+
+class LiveFramePublisher:
+    def __init__(self, live_view, job_id: str, interval: float, width: int, quality: int):
+        self.live_view = live_view
+        self.job_id = job_id
+        self.interval = interval
+        self.width = width
+        self.quality = quality
+        self.next_publish = 0.0
+        self.frames = queue.Queue(maxsize=1)
+        self.frames_dropped = 0
+        self.thread = threading.Thread(target=self._encode_loop, name=f"live-view-{job_id}", daemon=True)
+        self.thread.start()
+
+    def due(self) -> bool:
+        """True when a frame submitted now would be published (check this before collecting the overlay)."""
+        return time.monotonic() >= self.next_publish
+
+    def submit(self, frame, annotations, object_counts, frame_number) -> bool:
+        """
+        Hand a frame to the encoder thread without blocking, at most once per interval.
+
+        The frame is used by reference and must not be modified afterwards.
+
+        Returns:
+            bool: False if the frame was skipped (throttled, or the encoder is still busy)
+        """
+        now = time.monotonic()
+        if now < self.next_publish:
+            return False
+        try:
+            self.frames.put_nowait((frame, list(annotations), dict(object_counts), frame_number))
+        except queue.Full:
+            self.frames_dropped += 1
+            return False
+        self.next_publish = now + self.interval
+        return True
+
+    def _encode_loop(self):
+        encode_seconds = STAGE_SECONDS.labels(stage='live_encode')
+        while True:
+            item = self.frames.get()
+            if item is None:
+                break
+            frame, annotations, object_counts, frame_number = item
+            with encode_seconds.time():
+                height, width = frame.shape[:2]
+                scale = min(1.0, self.width / width)
+                if scale < 1.0:
+                    frame = cv2.resize(frame, (self.width, max(2, int(height * scale))),
+                                       interpolation=cv2.INTER_AREA)
+                else:
+                    frame = frame.copy()
+                annotate_frame(frame, annotations, object_counts, frame_number, scale)
+                ok, buffer = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, self.quality])
+            if ok:
+                self.live_view.put(self.job_id, frame_number, buffer.tobytes())
+
+    def close(self):
+        """Publish the last queued frame, stop the encoder and end the job's live streams."""
+        self.frames.put(None)
+        self.thread.join()
+        self.live_view.close(self.job_id)
+
+
+class LiveView:
+    def __init__(self, fps: float = LIVE_VIEW_FPS, width: int = LIVE_VIEW_WIDTH, quality: int = LIVE_VIEW_QUALITY,
+                 ring_size: int = LIVE_VIEW_FRAMES, retention: float = 600.0, keepalive: float = 15.0):
+        """
+        Initialize the live view store.
+
+        Args:
+            fps (float): Frames published per second per job
+            width (int): Width of published frames
+            quality (int): JPEG quality
+            ring_size (int): Encoded frames kept per job
+            retention (float): Seconds the last frame of a finished job stays available
+            keepalive (float): Seconds a stream waits for a new frame before re-sending the last one
+        """
+        self.interval = 1.0 / fps if fps > 0 else 0.0
+        self.width = width
+        self.quality = quality
+        self.ring_size = ring_size
+        self.retention = retention
+        self.keepalive = keepalive
+        self.rings: Dict[str, FrameRing] = {}
+        self.changed = threading.Condition()
+
+    def publisher(self, job_id: str) -> LiveFramePublisher:
+        """Start a throttled frame publisher for one job."""
+        job_id = str(job_id)
+        with self.changed:
+            self.rings[job_id] = FrameRing(self.ring_size)
+        return LiveFramePublisher(self, job_id, self.interval, self.width, self.quality)
+
+    def put(self, job_id: str, frame_number: int, jpeg: bytes):
+        """Add an encoded frame to the job's ring and wake its viewers."""
+        with self.changed:
+            ring = self.rings.get(job_id)
+            if ring is None:
+                ring = self.rings[job_id] = FrameRing(self.ring_size)
+            ring.sequence += 1
+            ring.frames.append((ring.sequence, frame_number, jpeg))
+            ring.updated_at = time.monotonic()
+            self.changed.notify_all()
+
+    def close(self, job_id: str):
+        """Mark the job's live view as finished; its last frame stays available for a while."""
+        with self.changed:
+            ring = self.rings.get(job_id)
+            if ring is not None:
+                ring.closed_at = time.monotonic()
+            self._expire()
+            self.changed.notify_all()
+
+    def _expire(self):
+        now = time.monotonic()
+        for job_id in [job_id for job_id, ring in self.rings.items()
+                       if ring.closed_at is not None and now - ring.closed_at > self.retention]:
+            del self.rings[job_id]
+
+    def latest(self, job_id: Optional[str] = None) -> Optional[Tuple[int, bytes]]:
+        """
+        Return (frame number, JPEG bytes) of the newest frame of a job, or of the most recently
+        updated job when no job ID is given; None if there is no frame.
+        """
+        with self.changed:
+            if job_id is None:
+                rings = [ring for ring in self.rings.values() if ring.frames]
+                ring = max(rings, key=lambda ring: ring.updated_at) if rings else None
+            else:
+                ring = self.rings.get(str(job_id))
+            if ring is None or not ring.frames:
+                return None
+            _, frame_number, jpeg = ring.frames[-1]
+            return frame_number, jpeg
+
+    def has_job(self, job_id: str) -> bool:
+        with self.changed:
+            return str(job_id) in self.rings
+
+    def stream(self, job_id: str) -> Iterator[bytes]:
+        """
+        Yield the job's frames as multipart/x-mixed-replace parts (MJPEG), newest frame first,
+        until the job's live view is closed. A viewer that falls behind skips to the newest frame.
+        """
+        job_id = str(job_id)
+        sequence = 0
+        while True:
+            with self.changed:
+                self.changed.wait_for(
+                    lambda: job_id not in self.rings or self.rings[job_id].closed_at is not None or
+                    (self.rings[job_id].frames and self.rings[job_id].frames[-1][0] != sequence),
+                    timeout=self.keepalive
+                )
+                ring = self.rings.get(job_id)
+                if ring is None:
+                    return
+                part = ring.frames[-1] if ring.frames else None
+                closed = ring.closed_at is not None
+            # Re-send the last frame on a timeout so proxies keep an idle stream open
+            if part is not None and (part[0] != sequence or not closed):
+                sequence = part[0]
+                jpeg = part[2]
+                yield (f"--{BOUNDARY}\r\nContent-Type: image/jpeg\r\nContent-Length: {len(jpeg)}\r\n\r\n"
+                       .encode() + jpeg + b"\r\n")
+            if closed:
+                return
+
+
+# One live view store per API process (jobs run on its worker threads)
+live_view = LiveView()
@@ -0,0 +1,210 @@
+"""
+In-process metrics with Prometheus text exposition.
+
+Counters and latency histograms for the pipeline stages (decode, detection,
+tracking, snapshot crop, JPEG encode, Supabase upload, Gemini valuation,
+database calls). Recording is a bisect plus a couple of additions under a
+per-series lock, cheap enough to leave on in the per-frame loop. Hot paths
+bind their labelled series once (e.g. STAGE_SECONDS.labels(stage='decode'))
+so no label lookup happens per observation.
+
+Metrics are per process: the API process serves them on /metrics; segment
+worker processes of sharded jobs are not included.
+"""
+
+import time
+import bisect
+import threading
+from contextlib import contextmanager
+from typing import Callable, Dict, Tuple
+
+# Seconds; spans a sub-millisecond crop up to a slow upload or model call
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def _format_labels(names: Tuple[str, ...], values: Tuple[str, ...], extra: str = '') -> str:
+    pairs = [f'{name}="{value}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _format_value(value: float) -> str:
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _CounterSeries:
+    def __init__(self):
+        self.value = 0
+        self.lock = threading.Lock()
+
+    def inc(self, amount=1):
+        with self.lock:
+            self.value += amount
+
+
+class _HistogramSeries:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.lock = threading.Lock()
+
+    def observe(self, value: float):
+        index = bisect.bisect_left(self.buckets, value)
+        with self.lock:
+            self.counts[index] += 1
+            self.sum += value
+
+    @contextmanager
+    def time(self):
+        """Observe the duration of the with-block."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start)
+
+
+class _Metric:
+    kind = ''
+
+    def __init__(self, name: str, help_text: str, labelnames: Tuple[str, ...] = ()):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self.series: Dict[Tuple[str, ...], object] = {}
+        self.lock = threading.Lock()
+
+    def _new_series(self):
+        raise NotImplementedError
+
+    def labels(self, **labels):
+        """Return the series for a label combination (bind it once outside hot loops)."""
+        key = tuple(str(labels[name]) for name in self.labelnames)
+        series = self.series.get(key)
+        if series is None:
+            with self.lock:
+                series = self.series.setdefault(key, self._new_series())
+        return series
+
+
+class Counter(_Metric):
+    kind = 'counter'
+
+    def _new_series(self):
+        return _CounterSeries()
+
+    def inc(self, amount=1, **labels):
+        self.labels(**labels).inc(amount)
+
+    def render(self):
+        for key, series in list(self.series.items()):
+            yield f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(series.value)}"
+
+
+class Histogram(_Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, help_text, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help_text, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def _new_series(self):
+        return _HistogramSeries(self.buckets)
+
+    def observe(self, value, **labels):
+        self.labels(**labels).observe(value)
+
+    def time(self, **labels):
+        return self.labels(**labels).time()
+
+    def render(self):
+        for key, series in list(self.series.items()):
+            with series.lock:
+                counts, total = list(series.counts), series.sum
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += count
+                le = f'le="{_format_value(bound)}"'
+                yield f"{self.name}_bucket{_format_labels(self.labelnames, key, le)} {cumulative}"
+            labels = _format_labels(self.labelnames, key)
+            yield f"{self.name}_sum{labels} {_format_value(total)}"
+            yield f"{self.name}_count{labels} {cumulative}"
+
+
+class Gauge(_Metric):
+    kind = 'gauge'
+
+    def __init__(self, name, help_text, callback: Callable[[], float]):
+        super().__init__(name, help_text)
+        self.callback = callback
+
+    def render(self):
+        yield f"{self.name} {_format_value(self.callback())}"
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self.metrics: Dict[str, _Metric] = {}
+        self.lock = threading.Lock()
+
+    def _register(self, metric):
+        with self.lock:
+            return self.metrics.setdefault(metric.name, metric)
+
+    def counter(self, name, help_text, labelnames=()) -> Counter:
+        return self._register(Counter(name, help_text, labelnames))
+
+    def histogram(self, name, help_text, labelnames=(), buckets=DEFAULT_BUCKETS) -> Histogram:
+        return self._register(Histogram(name, help_text, labelnames, buckets))
+
+    def gauge(self, name, help_text, callback) -> Gauge:
+        """Register a gauge whose value is read from callback() at scrape time."""
+        with self.lock:
+            self.metrics[name] = Gauge(name, help_text, callback)
+            return self.metrics[name]
+
+    def render(self) -> str:
+        """Prometheus text exposition format (version 0.0.4)."""
+        lines = []
+        with self.lock:
+            metrics = list(self.metrics.values())
+        for metric in metrics:
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+# One registry per process
+registry = MetricsRegistry()
+
+STAGE_SECONDS = registry.histogram(
+    'insurefire_stage_seconds', 'Latency of video pipeline stages in seconds', ('stage',)
+)
+FRAMES_TOTAL = registry.counter(
+    'insurefire_frames_total', 'Video frames decoded, and run through the detector', ('kind',)
+)
+ITEMS_COUNTED_TOTAL = registry.counter('insurefire_items_counted_total', 'Items counted by the tracker')
+EXTERNAL_CALLS_TOTAL = registry.counter(
+    'insurefire_external_calls_total', 'Calls to Supabase and Gemini by outcome', ('service', 'outcome')
+)
+JOBS_TOTAL = registry.counter('insurefire_jobs_total', 'Video jobs finished, by status', ('status',))
+
+
+@contextmanager
+def track_call(service: str, stage: str):
+    """Time an external call under stage and count it by outcome for service."""
+    start = time.perf_counter()
+    try:
+        yield
+    except BaseException:
+        EXTERNAL_CALLS_TOTAL.inc(service=service, outcome='error')
+        raise
+    else:
+        EXTERNAL_CALLS_TOTAL.inc(service=service, outcome='ok')
+    finally:
+        STAGE_SECONDS.observe(time.perf_counter() - start, stage=stage)
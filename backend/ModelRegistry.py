@@ -0,0 +1,138 @@
+"""
+Process-wide registry of loaded models.
+
+Each worker process loads and warms every detector exactly once and shares it
+between concurrent jobs; jobs get their own ObjectTracker so tracking state is
+never shared. Weight files are cached in MODEL_DIR and checked against a
+sha256 sidecar so a truncated or corrupted download is caught (and replaced)
+at startup instead of being discovered, or re-downloaded, mid-job.
+"""
+
+import os
+import hashlib
+import logging
+import threading
+from typing import Dict
+
+from ultralytics.utils.downloads import attempt_download_asset
+
+from Detector import BaseDetector, create_detector
+from DetectorCascade import DetectorCascade
+from ObjectTracker import ObjectTracker
+from FurniturePriceEstimator import FurniturePriceEstimator
+
+MODEL_DIR = os.environ.get("MODEL_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "models"))
+DEFAULT_WEIGHTS = os.environ.get("YOLO_WEIGHTS", "yolo11l.pt")
+# Inference runtime for the detector: torch, onnx or openvino
+DETECTOR_BACKEND = os.environ.get("DETECTOR_BACKEND", "torch")
+# Small model run on every frame in front of YOLO_WEIGHTS (e.g. yolo11n.pt); empty disables the cascade
+CASCADE_WEIGHTS = os.environ.get("CASCADE_WEIGHTS", "")
+
+
+def _sha256(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def ensure_weights(name: str) -> str:
+    """
+    Make sure a weight file is present and intact in MODEL_DIR, downloading it if needed.
+
+    Args:
+        name (str): Weight file name (e.g. 'yolo11l.pt') or an absolute path
+
+    Returns:
+        str: Absolute path of the verified weight file
+    """
+    path = name if os.path.isabs(name) else os.path.join(MODEL_DIR, name)
+    checksum_path = path + ".sha256"
+
+    if os.path.exists(path) and os.path.exists(checksum_path):
+        with open(checksum_path) as f:
+            expected = f.read().strip()
+        if _sha256(path) == expected:
+            return path
+        logging.warning(f"Checksum mismatch for {path}, downloading it again")
+        os.remove(path)
+
+    if not os.path.exists(path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        logging.info(f"Downloading model weights to {path}")
+        attempt_download_asset(path)
+        if not os.path.exists(path):
+            raise FileNotFoundError(f"Could not download model weights '{name}'")
+
+    # First time we see this file (downloaded now or copied in by hand): record its digest
+    with open(checksum_path, 'w') as f:
+        f.write(_sha256(path))
+    return path
+
+
+class ModelRegistry:
+    def __init__(self):
+        self.detectors: Dict[str, BaseDetector] = {}
+        self.price_estimator = None
+        self.lock = threading.Lock()
+
+    def get_detector(self, weights: str = DEFAULT_WEIGHTS, backend: str = None) -> BaseDetector:
+        """
+        Return the shared, warmed-up detector for a weight file, loading it on first use.
+
+        Args:
+            weights (str): Weight file name in MODEL_DIR or an absolute path
+            backend (str): Inference backend (defaults to env DETECTOR_BACKEND); the
+                model is exported for it once and the export is reused afterwards
+
+        Returns:
+            BaseDetector: Detector shared by every job in this process
+        """
+        backend = backend or DETECTOR_BACKEND
+        key = f"{weights}:{backend}"
+        detector = self.detectors.get(key)
+        if detector is not None:
+            return detector
+        with self.lock:
+            if key not in self.detectors:
+                path = ensure_weights(weights)
+                threads = int(os.environ.get("DETECTOR_THREADS", 0)) or None
+                logging.info(f"Loading detector {path} on the {backend} backend")
+                detector = create_detector(path, backend, threads=threads)
+                detector.warmup()
+                self.detectors[key] = detector
+            return self.detectors[key]
+
+    def create_cascade(self, small_weights: str = None, weights: str = DEFAULT_WEIGHTS,
+                       backend: str = None) -> DetectorCascade:
+        """
+        Return a detector cascade for a single job around the shared small and large detectors.
+
+        Args:
+            small_weights (str): Weights of the model run on every frame (defaults to env CASCADE_WEIGHTS)
+            weights (str): Weights of the model run on escalated frames
+            backend (str): Inference backend of both models
+        """
+        small = self.get_detector(small_weights or CASCADE_WEIGHTS, backend)
+        return DetectorCascade(small, self.get_detector(weights, backend))
+
+    def create_tracker(self, frame_rate: float) -> ObjectTracker:
+        """Return fresh tracking state for a single job."""
+        return ObjectTracker(frame_rate=frame_rate)
+
+    def get_price_estimator(self) -> FurniturePriceEstimator:
+        """Return the shared Gemini price estimator."""
+        with self.lock:
+            if self.price_estimator is None:
+                self.price_estimator = FurniturePriceEstimator()
+            return self.price_estimator
+
+    def preload(self, *weights: str):
+        """Load and warm detectors ahead of the first job (call at worker startup)."""
+        for name in weights or tuple(name for name in (DEFAULT_WEIGHTS, CASCADE_WEIGHTS) if name):
+            self.get_detector(name)
+
+
+# One registry per process
+model_registry = ModelRegistry()
@@ -0,0 +1,113 @@
+"""
+Per-job multi-object tracker.
+
+Wraps the ultralytics BoT-SORT / ByteTrack implementations so detection and
+tracking can be decoupled: the detector may run on a batch of frames while the
+tracker is still updated one frame at a time, in frame order.
+"""
+
+import numpy as np
+from ultralytics.engine.results import Boxes
+from ultralytics.trackers.basetrack import BaseTrack
+from ultralytics.trackers.bot_sort import BOTSORT
+from ultralytics.trackers.byte_tracker import BYTETracker
+from ultralytics.utils import IterableSimpleNamespace, yaml_load
+from ultralytics.utils.checks import check_yaml
+
+
+# Track IDs come from a process-wide counter that the stock trackers reset on
+# construction. Several jobs can track concurrently in one process, so keep the
+# counter running to never hand out the same ID twice.
+class _BotSort(BOTSORT):
+    @staticmethod
+    def reset_id():
+        pass
+
+
+class _ByteTrack(BYTETracker):
+    @staticmethod
+    def reset_id():
+        pass
+
+
+TRACKER_MAP = {"botsort": _BotSort, "bytetrack": _ByteTrack}
+
+
+class ObjectTracker:
+    def __init__(self, tracker_config="botsort.yaml", frame_rate=30):
+        """
+        Initialize a tracker for a single video.
+
+        Args:
+            tracker_config (str): Ultralytics tracker config file ('botsort.yaml' or 'bytetrack.yaml')
+            frame_rate (float): Frame rate of the frames fed to update()
+        """
+        cfg = IterableSimpleNamespace(**yaml_load(check_yaml(tracker_config)))
+        if cfg.tracker_type not in TRACKER_MAP:
+            raise ValueError(f"Unsupported tracker type '{cfg.tracker_type}'")
+        self.tracker = TRACKER_MAP[cfg.tracker_type](args=cfg, frame_rate=max(1, int(round(frame_rate or 30))))
+        self.last_frame_number = None
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['next_track_id'] = BaseTrack._count
+        return state
+
+    def __setstate__(self, state):
+        # A tracker restored from a checkpoint (possibly in a fresh process) must
+        # not hand out track IDs that were already in use before the checkpoint
+        BaseTrack._count = max(BaseTrack._count, state.pop('next_track_id', 0))
+        self.__dict__.update(state)
+
+    def advance(self, steps):
+        """
+        Advance the tracker clock over frames that were not run through the detector.
+
+        Kalman predictions are stepped once per skipped frame and the frame counter
+        moves with them, so motion models and lost-track timeouts stay in source
+        frame units no matter how sparsely frames are sampled.
+        """
+        if steps <= 0:
+            return
+        tracker = self.tracker
+        stracks = tracker.joint_stracks(tracker.tracked_stracks, tracker.lost_stracks)
+        if stracks:
+            for _ in range(steps):
+                tracker.multi_predict(stracks)
+        tracker.frame_id += steps
+
+    def update(self, xyxy, conf, cls, frame, frame_number=None):
+        """
+        Associate one frame's detections with existing tracks.
+
+        Args:
+            xyxy (np.ndarray): (N, 4) boxes in frame pixel coordinates
+            conf (np.ndarray): (N,) detection confidences
+            cls (np.ndarray): (N,) class indices
+            frame (np.ndarray): The frame the detections came from (used for camera motion compensation)
+            frame_number (Optional[int]): Source frame number; gaps since the previous update advance the tracker clock
+
+        Returns:
+            tuple: (boxes (M, 4) int, track_ids (M,) int, cls_ids (M,) int, confs (M,) float) for confirmed tracks
+        """
+        if frame_number is not None:
+            if self.last_frame_number is not None:
+                self.advance(frame_number - self.last_frame_number - 1)
+            self.last_frame_number = frame_number
+
+        data = np.concatenate([
+            np.asarray(xyxy, dtype=np.float32).reshape(-1, 4),
+            np.asarray(conf, dtype=np.float32).reshape(-1, 1),
+            np.asarray(cls, dtype=np.float32).reshape(-1, 1)
+        ], axis=1)
+        tracks = self.tracker.update(Boxes(data, frame.shape[:2]), frame)
+        if len(tracks) == 0:
+            empty = np.empty((0,), dtype=int)
+            return np.empty((0, 4), dtype=int), empty, empty, np.empty((0,), dtype=np.float32)
+        # Track rows are [x1, y1, x2, y2, track_id, score, cls, det_index]
+        return (
+            tracks[:, :4].astype(int),
+            tracks[:, 4].astype(int),
+            tracks[:, 6].astype(int),
+            tracks[:, 5]
+        )
@@ -0,0 +1,127 @@
+"""
+Annotated preview rendering.
+
+annotate_frame draws the tracking overlay (boxes, labels and the running
+inventory) and is shared by the interactive display and the preview encoder.
+PreviewEncoder renders a reduced-resolution annotated video on a background
+thread: the detection loop only hands over the frame reference and a list of
+overlay tuples, and if the encoder falls behind frames are dropped rather than
+blocking detection.
+"""
+
+import queue
+import threading
+
+import cv2
+
+COLOR_NEW = (0, 165, 255)  # Orange for tracks that are not counted yet
+COLOR_COUNTED = (0, 255, 0)  # Green for counted tracks
+COLOR_TEXT = (0, 0, 255)
+
+
+def annotate_frame(frame, annotations, object_counts, frame_number, scale=1.0):
+    """
+    Draw the tracking overlay onto a frame in place.
+
+    Args:
+        frame (np.ndarray): BGR frame to draw on
+        annotations (list): (box, label, color) tuples with boxes in the coordinates of the scanned frame
+        object_counts (dict): Class name -> number of counted items
+        frame_number (int): Source frame number
+        scale (float): Ratio between the frame being drawn on and the scanned frame
+    """
+    for box, label, color in annotations:
+        x1, y1, x2, y2 = (int(v * scale) for v in box)
+        cv2.rectangle(frame, (x1, y1), (x2, y2), color, 2)
+        cv2.putText(frame, label, (x1, y1 - 10), cv2.FONT_HERSHEY_SIMPLEX, 0.5, color, 2)
+
+    y_pos = 30
+    cv2.putText(frame, f"Frame: {frame_number}", (10, y_pos), cv2.FONT_HERSHEY_SIMPLEX, 0.7, COLOR_TEXT, 2)
+    y_pos += 30
+
+    cv2.putText(frame, "Items Inventory:", (10, y_pos), cv2.FONT_HERSHEY_SIMPLEX, 0.7, COLOR_TEXT, 2)
+    y_pos += 30
+
+    for cls, count in sorted(object_counts.items()):
+        cv2.putText(frame, f"{cls}: {count}", (10, y_pos), cv2.FONT_HERSHEY_SIMPLEX, 0.7, COLOR_TEXT, 2)
+        y_pos += 30
+    return frame
+
+
+class PreviewEncoder:
+    def __init__(self, path, source_fps, scale=0.5, preview_fps=10, queue_size=8):
+        """
+        Start the background preview encoder.
+
+        The video file is opened on the first frame, sized from that frame: the scan hands over
+        the frames it detects on, which are already downscaled when the source is large.
+
+        Args:
+            path (str): Output .mp4 path
+            source_fps (float): Frame rate of the source video (used to keep preview timing real-time)
+            scale (float): Preview resolution relative to the frames handed over
+            preview_fps (float): Frame rate of the preview video
+            queue_size (int): Frames buffered before new ones are dropped
+        """
+        self.path = path
+        self.source_fps = source_fps or 30
+        self.preview_fps = min(preview_fps, self.source_fps)
+        self.scale = scale
+        self.size = None
+        self.writer = None
+
+        self.frames = queue.Queue(maxsize=max(1, queue_size))
+        self.frames_written = 0
+        self.frames_dropped = 0
+        self.thread = threading.Thread(target=self._encode_loop, name="preview-encoder", daemon=True)
+        self.thread.start()
+
+    def submit(self, frame, annotations, object_counts, frame_number):
+        """
+        Queue a frame for the preview without blocking.
+
+        The frame is used by reference and must not be modified afterwards.
+
+        Returns:
+            bool: False if the frame was dropped because the encoder is behind
+        """
+        try:
+            self.frames.put_nowait((frame, list(annotations), dict(object_counts), frame_number))
+            return True
+        except queue.Full:
+            self.frames_dropped += 1
+            return False
+
+    def _encode_loop(self):
+        while True:
+            item = self.frames.get()
+            if item is None:
+                break
+            frame, annotations, object_counts, frame_number = item
+
+            # Write the frame as many times as needed for the preview clock to catch
+            # up with the source position (zero when the preview is already ahead),
+            # so both dense and sparse sampling play back in real time
+            target = int((frame_number - 1) * self.preview_fps / self.source_fps) + 1
+            if target <= self.frames_written:
+                continue
+            if self.writer is None:
+                height, width = frame.shape[:2]
+                # Most codecs want even dimensions
+                self.size = (max(2, int(width * self.scale) // 2 * 2), max(2, int(height * self.scale) // 2 * 2))
+                self.writer = cv2.VideoWriter(self.path, cv2.VideoWriter_fourcc(*'mp4v'), self.preview_fps,
+                                              self.size)
+            preview = cv2.resize(frame, self.size, interpolation=cv2.INTER_AREA)
+            # Overlay boxes are in the coordinates of the frame handed over
+            annotate_frame(preview, annotations, object_counts, frame_number, self.size[0] / frame.shape[1])
+            for _ in range(target - self.frames_written):
+                self.writer.write(preview)
+                self.frames_written += 1
+        if self.writer is not None:
+            self.writer.release()
+
+    def close(self):
+        """Flush the queued frames and finalize the video file."""
+        self.frames.put(None)
+        self.thread.join()
+        print(f"Preview written to {self.path} ({self.frames_written} frames, {self.frames_dropped} dropped)")
@@ -0,0 +1,128 @@
+"""
+Push channel for job progress.
+
+The processing loop publishes its progress (frames processed, processing fps,
+items counted, valuations done) into the in-process broker, and the API
+streams it to clients as server-sent events, so the frontend no longer polls
+the job row. Publishing is throttled per job: the hot loop only pays for a
+clock check on frames where nothing is sent. Every event carries the job's
+full current state, so a client that connects late or misses events is
+immediately up to date.
+"""
+
+import json
+import time
+import threading
+from typing import Any, Dict, Iterator, Optional
+
+TERMINAL_STATUSES = ('completed', 'failed')
+
+
+class JobProgress:
+    def __init__(self, broker, job_id: str, interval: float):
+        self.broker = broker
+        self.job_id = job_id
+        self.interval = interval
+        self.next_publish = 0.0
+
+    def due(self) -> bool:
+        """True when a throttled update would be sent now (check this before computing the fields)."""
+        return time.monotonic() >= self.next_publish
+
+    def update(self, event: str = 'progress', force: bool = False, **fields):
+        """
+        Merge fields into the job state and notify subscribers, at most once per interval unless forced.
+
+        Args:
+            event (str): SSE event name
+            force (bool): Send even if the throttle interval has not elapsed (stage changes, final counts)
+            **fields: State fields to set
+        """
+        now = time.monotonic()
+        if not force and now < self.next_publish:
+            return
+        self.next_publish = now + self.interval
+        self.broker.publish(self.job_id, event, **fields)
+
+
+class ProgressBroker:
+    def __init__(self, interval: float = 0.5, retention: float = 600.0, keepalive: float = 15.0):
+        """
+        Initialize the broker.
+
+        Args:
+            interval (float): Minimum seconds between throttled updates of a job
+            retention (float): Seconds the final state of a finished job stays available
+            keepalive (float): Seconds between keepalive comments on idle streams
+        """
+        self.interval = interval
+        self.retention = retention
+        self.keepalive = keepalive
+        self.jobs: Dict[str, Dict[str, Any]] = {}
+        self.changed = threading.Condition()
+
+    def job(self, job_id: str) -> JobProgress:
+        """Return a throttled publisher for one job."""
+        return JobProgress(self, str(job_id), self.interval)
+
+    def publish(self, job_id: str, event: str, **fields):
+        """Merge fields into the job's state and wake its subscribers."""
+        job_id = str(job_id)
+        with self.changed:
+            job = self.jobs.get(job_id)
+            if job is None:
+                job = self.jobs[job_id] = {'version': 0, 'state': {'job_id': job_id}, 'finished_at': None}
+            job['state'].update(fields)
+            job['event'] = event
+            job['version'] += 1
+            if fields.get('status') in TERMINAL_STATUSES:
+                job['finished_at'] = time.monotonic()
+            self._expire()
+            self.changed.notify_all()
+
+    def _expire(self):
+        now = time.monotonic()
+        for job_id in [job_id for job_id, job in self.jobs.items()
+                       if job['finished_at'] is not None and now - job['finished_at'] > self.retention]:
+            del self.jobs[job_id]
+
+    def state(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """Return a copy of the job's current state, or None if the broker has not seen the job."""
+        with self.changed:
+            job = self.jobs.get(str(job_id))
+            return dict(job['state']) if job is not None else None
+
+    def stream(self, job_id: str) -> Iterator[str]:
+        """
+        Yield the job's state as SSE messages: the current state first, then every change,
+        until the job completes or fails, or the broker no longer has the job (e.g. it expired).
+        """
+        job_id = str(job_id)
+        version = -1
+        while True:
+            with self.changed:
+                self.changed.wait_for(
+                    lambda: job_id not in self.jobs or self.jobs[job_id]['version'] != version,
+                    timeout=self.keepalive
+                )
+                job = self.jobs.get(job_id)
+                if job is None:
+                    # Nothing more will be published for it: free the connection
+                    return
+                if job['version'] == version:
+                    message = None
+                else:
+                    version = job['version']
+                    event, state = job['event'], dict(job['state'])
+                    message = f"event: {event}\ndata: {json.dumps(state)}\n\n"
+            if message is None:
+                # Comment line: keeps proxies from closing an idle connection
+                yield ": keepalive\n\n"
+                continue
+            yield message
+            if state.get('status') in TERMINAL_STATUSES:
+                return
+
+
+# One broker per API process (jobs run on its worker threads)
+progress_broker = ProgressBroker()
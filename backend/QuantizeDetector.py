@@ -0,0 +1,113 @@
+"""
+INT8 build of the detector.
+
+Statically quantizes the ONNX export of the detection model with ONNX Runtime,
+calibrating activation ranges on frames sampled from real walkthrough videos.
+The detection head (box decoding and class scores) is left in FP32: it is a
+small share of the compute but quantizing it costs most of the accuracy.
+
+The result is written next to the weights as <stem>_int8.onnx and is picked up
+by DETECTOR_BACKEND=onnx_int8. Use DetectorBenchmark.py to compare it with the
+FP32 baseline before switching a deployment over.
+
+Usage:
+    python QuantizeDetector.py walkthrough1.mp4 walkthrough2.mp4 --calibration-frames 300
+"""
+
+import os
+import argparse
+
+import onnx
+from onnxruntime.quantization import CalibrationDataReader, CalibrationMethod, QuantFormat, QuantType, quantize_static
+from onnxruntime.quantization.shape_inference import quant_pre_process
+
+from Detector import OnnxDetector, export_model, export_path
+from FramePipeline import sample_frames
+from ModelRegistry import DEFAULT_WEIGHTS, ensure_weights
+
+
+class _CalibrationReader(CalibrationDataReader):
+    """Feeds letterboxed calibration frames to the ONNX Runtime quantizer one at a time."""
+
+    def __init__(self, detector, frames, imgsz):
+        self.detector = detector
+        self.frames = iter(frames)
+        self.imgsz = imgsz
+
+    def get_next(self):
+        frame = next(self.frames, None)
+        if frame is None:
+            return None
+        return {self.detector.input_name: self.detector._preprocess([frame], self.imgsz)}
+
+    def rewind(self):
+        pass
+
+
+def quantize_detector(weights_path, frames, imgsz=640, head_pattern="/model.23/", per_channel=True):
+    """
+    Build the INT8 ONNX model for a .pt weight file.
+
+    Args:
+        weights_path (str): Path to the .pt weights
+        frames (list[np.ndarray]): Calibration frames
+        imgsz (int): Inference size
+        head_pattern (str): Node-name fragment of the detection head, kept in FP32 ('' quantizes everything)
+        per_channel (bool): Per-channel weight scales (more accurate, slightly larger model)
+
+    Returns:
+        str: Path of the INT8 model
+    """
+    fp32_path = export_model(weights_path, "onnx", imgsz=imgsz)
+    int8_path = export_path(weights_path, "onnx_int8")
+    prepared_path = os.path.splitext(int8_path)[0] + "_prep.onnx"
+
+    # Shape inference and graph cleanup give the quantizer a more complete view of the graph
+    quant_pre_process(fp32_path, prepared_path, skip_symbolic_shape=True)
+    model = onnx.load(prepared_path)
+    excluded = [node.name for node in model.graph.node if head_pattern and head_pattern in node.name]
+
+    detector = OnnxDetector(fp32_path)
+    print(f"Calibrating on {len(frames)} frames ({len(excluded)} head nodes kept in FP32)")
+    quantize_static(
+        prepared_path,
+        int8_path,
+        _CalibrationReader(detector, frames, imgsz),
+        quant_format=QuantFormat.QDQ,
+        activation_type=QuantType.QUInt8,
+        weight_type=QuantType.QInt8,
+        per_channel=per_channel,
+        calibrate_method=CalibrationMethod.MinMax,
+        nodes_to_exclude=excluded
+    )
+    os.remove(prepared_path)
+
+    # Keep the class names and stride the detectors read from the model metadata
+    quantized = onnx.load(int8_path)
+    del quantized.metadata_props[:]
+    quantized.metadata_props.extend(onnx.load(fp32_path).metadata_props)
+    onnx.save(quantized, int8_path)
+
+    size_mb = os.path.getsize(int8_path) / (1 << 20)
+    print(f"INT8 model written to {int8_path} ({size_mb:.1f} MB, FP32 {os.path.getsize(fp32_path) / (1 << 20):.1f} MB)")
+    return int8_path
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Build the INT8 detector from sample walkthrough videos')
+    parser.add_argument('videos', nargs='+', help='Walkthrough videos to take calibration frames from')
+    parser.add_argument('--weights', default=DEFAULT_WEIGHTS, help='Weight file name in MODEL_DIR or a path')
+    parser.add_argument('--calibration-frames', type=int, default=300, help='Number of calibration frames')
+    parser.add_argument('--imgsz', type=int, default=640, help='Inference size')
+    parser.add_argument('--quantize-head', action='store_true', help='Also quantize the detection head')
+    args = parser.parse_args()
+
+    frames = sample_frames(args.videos, args.calibration_frames)
+    if not frames:
+        parser.error("No frames could be read from the calibration videos")
+    quantize_detector(ensure_weights(args.weights), frames, imgsz=args.imgsz,
+                      head_pattern='' if args.quantize_head else "/model.23/")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,242 @@
+"""
+Time-segment sharding for long videos.
+
+A single scan_video call keeps one core busy. For long walkthroughs the video
+is split into overlapping time segments that are scanned in parallel worker
+processes, each with its own tracker. Every segment records per-frame boxes
+inside the overlap windows it shares with its neighbours; tracks from
+adjacent segments whose boxes line up there are the same physical object and
+are merged, so each item is counted once in the stitched inventory.
+
+The overlap should be longer than it takes a track to be confirmed (a couple
+of seconds): an object crossing a boundary is then counted by at least one of
+the two segments.
+"""
+
+import os
+import threading
+import multiprocessing
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from InventoryAggregator import InventoryAggregator
+from SnapshotStore import SnapshotStore
+from TimeBudget import merge_reports
+
+# Size of the segment process pool shared by all jobs of the process
+SHARD_WORKERS = int(os.environ.get("SHARD_WORKERS", 0)) or (os.cpu_count() or 1)
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def _init_worker(threads_per_worker):
+    # Split the cores between the segment processes instead of letting each one
+    # size its thread pools for the whole machine
+    import cv2
+    import torch
+    torch.set_num_threads(threads_per_worker)
+    cv2.setNumThreads(threads_per_worker)
+    os.environ["DETECTOR_THREADS"] = str(threads_per_worker)
+
+    from ModelRegistry import model_registry
+    model_registry.preload()
+
+
+def get_pool():
+    """
+    Return the shared segment process pool of SHARD_WORKERS processes, creating it on first use.
+
+    The pool has a fixed size and is never replaced, so jobs scanning at the same time
+    share it (their segments queue up) instead of shutting it down under each other.
+    """
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            threads = max(1, (os.cpu_count() or 1) // SHARD_WORKERS)
+            # Spawn rather than fork: the API process runs Flask and worker threads
+            _pool = ProcessPoolExecutor(
+                max_workers=SHARD_WORKERS,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_init_worker,
+                initargs=(threads,)
+            )
+        return _pool
+
+
+def plan_segments(total_frames, shards, overlap_frames):
+    """
+    Split [1, total_frames] into shards segments that overlap by overlap_frames.
+
+    Returns:
+        list: (start_frame, end_frame) pairs; a segment processes frames start_frame+1 .. end_frame
+    """
+    bounds = np.linspace(0, total_frames, shards + 1).astype(int)
+    segments = []
+    for k in range(shards):
+        start = max(0, bounds[k] - overlap_frames) if k > 0 else 0
+        segments.append((int(start), int(bounds[k + 1])))
+    return segments
+
+
+def _scan_segment(video_path, start_frame, end_frame, record_windows, options):
+    import cv2
+    from VideoScanner import scan_video
+
+    cap = cv2.VideoCapture(video_path)
+    if not cap.isOpened():
+        raise IOError(f"Could not open video file '{video_path}'")
+    width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
+    height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+    fps = cap.get(cv2.CAP_PROP_FPS)
+    if start_frame:
+        cap.set(cv2.CAP_PROP_POS_FRAMES, start_frame)
+    try:
+        return scan_video(cap, fps, width, height, start_frame=start_frame, end_frame=end_frame,
+                          record_windows=record_windows, **options)
+    finally:
+        cap.release()
+
+
+def _box_iou(a, b):
+    x1, y1 = max(a[0], b[0]), max(a[1], b[1])
+    x2, y2 = min(a[2], b[2]), min(a[3], b[3])
+    inter = max(0, x2 - x1) * max(0, y2 - y1)
+    union = (a[2] - a[0]) * (a[3] - a[1]) + (b[2] - b[0]) * (b[3] - b[1]) - inter
+    return inter / union if union > 0 else 0.0
+
+
+def _match_tracks(left_boxes, right_boxes, window, min_iou, min_common):
+    """Greedily pair tracks from two segments by mean IoU over the frames both saw in a window."""
+    first, last = window
+    candidates = []
+    for left_id, left in left_boxes.items():
+        for right_id, right in right_boxes.items():
+            common = [f for f in left if first <= f <= last and f in right]
+            if len(common) < min_common:
+                continue
+            score = sum(_box_iou(left[f], right[f]) for f in common) / len(common)
+            if score >= min_iou:
+                candidates.append((score, left_id, right_id))
+
+    matched_left, matched_right, pairs = set(), set(), []
+    for score, left_id, right_id in sorted(candidates, reverse=True):
+        if left_id in matched_left or right_id in matched_right:
+            continue
+        matched_left.add(left_id)
+        matched_right.add(right_id)
+        pairs.append((left_id, right_id))
+    return pairs
+
+
+def stitch_segments(segments, scans, min_iou=0.5, min_common=2):
+    """
+    Merge per-segment scan results into one inventory.
+
+    Tracks are keyed by (segment, track_id) because track IDs are only unique
+    within a process. Matched tracks are unioned, each merged object is counted
+    once (keeping the metadata of its earliest count and its best snapshot),
+    and objects get fresh sequential track IDs in order of first count.
+
+    Returns:
+        dict: Same layout as scan_video's result
+    """
+    parent = {}
+
+    def find(key):
+        parent.setdefault(key, key)
+        while parent[key] != key:
+            parent[key] = parent[parent[key]]
+            key = parent[key]
+        return key
+
+    for k in range(len(segments) - 1):
+        window = (segments[k + 1][0] + 1, segments[k][1])
+        pairs = _match_tracks(scans[k]["window_boxes"], scans[k + 1]["window_boxes"], window, min_iou, min_common)
+        for left_id, right_id in pairs:
+            parent[find((k + 1, right_id))] = find((k, left_id))
+
+    # Tracks re-identified within a segment belong to the track their item was counted under
+    for k, scan in enumerate(scans):
+        inventory = scan["inventory"]
+        for track_id, item_id in inventory.tracks.items():
+            item_track = inventory.items[item_id]["track_id"]
+            if item_track != track_id:
+                parent[find((k, track_id))] = find((k, item_track))
+
+    # Group counted tracks by merged object
+    groups = defaultdict(list)
+    for k, scan in enumerate(scans):
+        for metadata in scan["inventory"].items.values():
+            key = (k, metadata["track_id"])
+            groups[find(key)].append((metadata["first_seen_frame"], key, metadata))
+
+    inventory = InventoryAggregator()
+    best_snapshots = {}
+    snapshots = SnapshotStore()
+    ordered = sorted(groups.values(), key=lambda members: min(m[0] for m in members))
+    for new_id, members in enumerate(ordered, start=1):
+        _, _, first = min(members, key=lambda m: m[0])
+        class_name = first["class"]
+        inventory.count_item(new_id, class_name, first["confidence"], first["first_seen_frame"])
+
+        candidates = [(scans[k]["best_snapshots"][track_id], k, track_id) for _, (k, track_id), _ in members
+                      if track_id in scans[k]["best_snapshots"]]
+        if candidates:
+            best, k, track_id = max(candidates, key=lambda candidate: candidate[0]["conf"])
+            best_snapshots[new_id] = dict(best, **{"class": class_name})
+            crop = scans[k]["snapshots"].get(track_id)
+            if crop is not None:
+                snapshots.put(new_id, crop)
+
+    sampling = {
+        'frames_seen': sum(scan["sampling"]['frames_seen'] for scan in scans),
+        'frames_sampled': sum(scan["sampling"]['frames_sampled'] for scan in scans)
+    }
+    sampling['reduction'] = sampling['frames_seen'] / sampling['frames_sampled'] if sampling['frames_sampled'] else 0.0
+
+    return {
+        "inventory": inventory,
+        "best_snapshots": best_snapshots,
+        "snapshots": snapshots,
+        "window_boxes": {},
+        "sampling": sampling,
+        "fidelity": merge_reports(scan.get("fidelity") for scan in scans)
+    }
+
+
+def scan_video_sharded(video_path, total_frames, shards, overlap_frames, **options):
+    """
+    Scan a local video file in overlapping segments on a process pool and stitch the results.
+
+    Args:
+        video_path (str): Local path of a fully downloaded video
+        total_frames (int): Number of frames in the video
+        shards (int): Number of time segments
+        overlap_frames (int): Frames shared by adjacent segments
+        **options: Extra keyword arguments for scan_video (batch_size, max_frame_stride, ...)
+
+    Returns:
+        dict: Same layout as scan_video's result
+    """
+    segments = plan_segments(total_frames, shards, overlap_frames)
+    print(f"Scanning {total_frames} frames in {len(segments)} segments on up to {SHARD_WORKERS} processes "
+          f"({overlap_frames} frames overlap)")
+
+    pool = get_pool()
+    futures = []
+    for k, (start, end) in enumerate(segments):
+        windows = []
+        if k > 0:
+            windows.append((start + 1, segments[k - 1][1]))
+        if k < len(segments) - 1:
+            windows.append((segments[k + 1][0] + 1, end))
+        futures.append(pool.submit(_scan_segment, video_path, start, end, windows, options))
+    scans = [future.result() for future in futures]
+
+    result = stitch_segments(segments, scans)
+    merged = sum(len(scan["inventory"]) for scan in scans) - len(result["inventory"])
+    print(f"Stitched {len(result['inventory'])} items across segments ({merged} boundary duplicates merged)")
+    return result
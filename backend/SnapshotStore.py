@@ -0,0 +1,163 @@
+"""
+Memory-bounded store for snapshot crops.
+
+A job keeps one crop per counted item until it has been uploaded and valued.
+Full-resolution crops of large furniture run to megabytes each, so on a
+cluttered high-resolution walkthrough the crops alone can outgrow a worker's
+share of memory. SnapshotStore keeps crops in RAM up to a byte budget
+(SNAPSHOT_MEMORY_MB per job) and, when a new crop takes it over budget,
+spills the largest in-memory crops to .npy files that are memory-mapped back
+on access, so small crops stay in RAM and the resident size stays flat.
+Spill files live in a per-store temporary directory removed by close().
+
+The store pickles with its crops inline (checkpoints and results of sharded
+segment workers), and re-applies its budget when unpickled.
+
+encode_snapshot turns a crop into the one JPEG that is both uploaded and sent
+to Gemini: downscaled to the size the valuation model works at and encoded
+within a byte budget.
+"""
+
+import os
+import shutil
+import tempfile
+import weakref
+import threading
+from typing import Dict, Hashable, Optional
+
+import cv2
+import numpy as np
+
+# In-memory budget for the crops of one job
+SNAPSHOT_MEMORY_MB = float(os.environ.get("SNAPSHOT_MEMORY_MB", 128))
+# Where spilled crops are written (defaults to the system temporary directory)
+SNAPSHOT_SPILL_DIR = os.environ.get("SNAPSHOT_SPILL_DIR") or None
+# Longest side of encoded snapshots (Gemini downsamples larger images to tiles of about this size anyway)
+SNAPSHOT_MAX_SIDE = int(os.environ.get("SNAPSHOT_MAX_SIDE", 768))
+SNAPSHOT_JPEG_QUALITY = int(os.environ.get("SNAPSHOT_JPEG_QUALITY", 90))
+# Byte budget of an encoded snapshot; the quality is lowered until it fits
+SNAPSHOT_MAX_KB = float(os.environ.get("SNAPSHOT_MAX_KB", 150))
+
+
+def encode_snapshot(crop: np.ndarray, max_side: int = SNAPSHOT_MAX_SIDE, quality: int = SNAPSHOT_JPEG_QUALITY,
+                    max_kb: float = SNAPSHOT_MAX_KB, min_quality: int = 50) -> Optional[bytes]:
+    """
+    Encode a crop once for both storage and valuation.
+
+    Args:
+        crop (np.ndarray): BGR crop
+        max_side (int): Longest side after downscaling (0 keeps the crop's size)
+        quality (int): JPEG quality tried first
+        max_kb (float): Byte budget; the quality drops in steps of 10 (not below min_quality) until it fits
+        min_quality (int): Lowest quality used
+
+    Returns:
+        Optional[bytes]: The JPEG, or None if it cannot be encoded
+    """
+    height, width = crop.shape[:2]
+    scale = max_side / max(height, width) if max_side else 1.0
+    if scale < 1.0:
+        crop = cv2.resize(crop, (max(1, int(round(width * scale))), max(1, int(round(height * scale)))),
+                          interpolation=cv2.INTER_AREA)
+    while True:
+        ok, buffer = cv2.imencode('.jpg', crop, [cv2.IMWRITE_JPEG_QUALITY, quality])
+        if not ok:
+            return None
+        if buffer.size <= max_kb * 1024 or quality <= min_quality:
+            return buffer.tobytes()
+        quality = max(min_quality, quality - 10)
+
+
+class SnapshotStore:
+    def __init__(self, memory_budget_mb: float = SNAPSHOT_MEMORY_MB, spill_dir: Optional[str] = SNAPSHOT_SPILL_DIR):
+        """
+        Initialize an empty store.
+
+        Args:
+            memory_budget_mb (float): Crops kept in RAM before the largest ones are spilled to disk
+            spill_dir (Optional[str]): Parent directory of the store's spill directory
+        """
+        self.memory_budget = int(memory_budget_mb * (1 << 20))
+        self.spill_parent = spill_dir
+        self.spill_path = None  # created on the first spill
+        self.in_memory: Dict[Hashable, np.ndarray] = {}
+        self.spilled: Dict[Hashable, str] = {}
+        self.memory_bytes = 0
+        self.spill_count = 0
+        self.cleanup = None
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.in_memory) + len(self.spilled)
+
+    def __contains__(self, key):
+        return key in self.in_memory or key in self.spilled
+
+    def put(self, key: Hashable, crop: np.ndarray):
+        """Store a crop (replacing any earlier crop under the key), spilling the largest crops if over budget."""
+        with self.lock:
+            self._remove(key)
+            self.in_memory[key] = crop
+            self.memory_bytes += crop.nbytes
+            if self.memory_bytes > self.memory_budget:
+                self._spill()
+
+    def get(self, key: Hashable) -> Optional[np.ndarray]:
+        """Return the crop for key (memory-mapped read-only if spilled), or None."""
+        with self.lock:
+            crop = self.in_memory.get(key)
+            if crop is not None:
+                return crop
+            path = self.spilled.get(key)
+        return np.load(path, mmap_mode='r') if path is not None else None
+
+    def discard(self, key: Hashable):
+        """Drop the crop for key, if any (e.g. once it has been uploaded)."""
+        with self.lock:
+            self._remove(key)
+
+    def _remove(self, key):
+        crop = self.in_memory.pop(key, None)
+        if crop is not None:
+            self.memory_bytes -= crop.nbytes
+        path = self.spilled.pop(key, None)
+        if path is not None and os.path.exists(path):
+            os.remove(path)
+
+    def _spill(self):
+        if self.spill_path is None:
+            self.spill_path = tempfile.mkdtemp(prefix="snapshots-", dir=self.spill_parent)
+            # Spill files of a store that is dropped without close() (e.g. a failed job) are removed with it
+            self.cleanup = weakref.finalize(self, shutil.rmtree, self.spill_path, True)
+        for key in sorted(self.in_memory, key=lambda key: self.in_memory[key].nbytes, reverse=True):
+            if self.memory_bytes <= self.memory_budget:
+                break
+            crop = self.in_memory.pop(key)
+            self.spill_count += 1
+            path = os.path.join(self.spill_path, f"{self.spill_count}.npy")
+            np.save(path, np.ascontiguousarray(crop))
+            self.spilled[key] = path
+            self.memory_bytes -= crop.nbytes
+
+    def close(self):
+        """Drop all crops and delete the spill files."""
+        with self.lock:
+            self.in_memory.clear()
+            self.spilled.clear()
+            self.memory_bytes = 0
+            if self.cleanup is not None:
+                self.cleanup()
+                self.cleanup = None
+            self.spill_path = None
+
+    def __getstate__(self):
+        with self.lock:
+            crops = dict(self.in_memory)
+            crops.update((key, np.load(path)) for key, path in self.spilled.items())
+        return {'memory_budget': self.memory_budget, 'spill_parent': self.spill_parent, 'crops': crops}
+
+    def __setstate__(self, state):
+        self.__init__(spill_dir=state['spill_parent'])
+        self.memory_budget = state['memory_budget']
+        for key, crop in state['crops'].items():
+            self.put(key, crop)
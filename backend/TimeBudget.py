@@ -0,0 +1,144 @@
+"""
+Wall-clock budget for a scan.
+
+TimeBudgetController watches how fast the scan moves through the source video
+and, when the frames left cannot be processed before the deadline at the
+current pace, steps down a ladder of fidelity levels: first a larger minimum
+frame stride for the sampler, then a smaller inference size (only for
+detectors that accept a variable input size). When the scan is comfortably
+ahead again it steps back up. If the deadline passes anyway the scan stops
+there. report() records the fidelity actually used, so a budgeted job's
+result can say what it traded for its turnaround.
+"""
+
+import time
+from collections import defaultdict
+from typing import Any, Dict, Optional
+
+# (minimum frame stride, inference size), from full fidelity down
+FIDELITY_LEVELS = ((1, 640), (2, 640), (2, 512), (3, 512), (4, 416), (6, 416), (8, 320), (12, 320), (16, 320))
+
+
+class TimeBudgetController:
+    def __init__(self, deadline: float, start_frame: int, last_frame: int, sampler, imgsz: int = 640,
+                 fixed_imgsz: bool = False, interval: float = 2.0, headroom: float = 1.15):
+        """
+        Initialize the controller for one scan.
+
+        Args:
+            deadline (float): time.time() by which the scan has to be finished
+            start_frame (int): Frame the scan starts after
+            last_frame (int): Last frame of the scan (0 if unknown: the deadline is then only enforced)
+            sampler (AdaptiveFrameSampler): The scan's sampler; its strides are raised while behind
+            imgsz (int): Full-fidelity inference size
+            fixed_imgsz (bool): The detector only accepts imgsz (exported graphs)
+            interval (float): Seconds between pace checks
+            headroom (float): Required margin of the measured pace over the pace needed
+        """
+        self.deadline = deadline
+        self.last_frame = last_frame
+        self.sampler = sampler
+        self.base_min_stride = sampler.min_stride
+        self.base_max_stride = sampler.max_stride
+        self.interval = interval
+        self.headroom = headroom
+
+        levels = []
+        for stride, size in FIDELITY_LEVELS:
+            level = (max(stride, self.base_min_stride), imgsz if fixed_imgsz else min(size, imgsz))
+            if level not in levels:
+                levels.append(level)
+        self.levels = levels
+        self.level = 0
+        self.imgsz = levels[0][1]
+
+        self.started = time.time()
+        self.window_time = time.monotonic()
+        self.window_frame = start_frame
+        self.start_frame = start_frame
+        self.frame_number = start_frame
+        self.frames_by_level = defaultdict(int)
+        self.lowest_level = 0
+        self.expired = False
+
+    def _apply(self, level: int):
+        self.level = level
+        self.lowest_level = max(self.lowest_level, level)
+        stride, self.imgsz = self.levels[level]
+        # The sampler runs on the decoder thread; plain attribute writes take effect a few frames later
+        self.sampler.max_stride = max(self.base_max_stride, stride)
+        self.sampler.min_stride = stride
+        self.window_time = time.monotonic()
+        self.window_frame = self.frame_number
+
+    def update(self, frame_number: int) -> bool:
+        """
+        Account for a processed frame and adjust the fidelity now and then.
+
+        Returns:
+            bool: False once the deadline has passed and the scan should stop
+        """
+        self.frame_number = frame_number
+        self.frames_by_level[self.level] += 1
+        now = time.monotonic()
+        if now - self.window_time < self.interval:
+            return True
+
+        remaining_time = self.deadline - time.time()
+        if remaining_time <= 0:
+            self.expired = True
+            return False
+        if self.last_frame <= 0:
+            return True
+
+        # Source frames per second at the current level versus the pace the deadline needs
+        pace = (frame_number - self.window_frame) / (now - self.window_time)
+        needed = (self.last_frame - frame_number) / remaining_time
+        if pace < needed * self.headroom and self.level < len(self.levels) - 1:
+            self._apply(self.level + 1)
+            print(f"Behind the time budget ({pace:.1f} < {needed:.1f} frames/s): "
+                  f"stride {self.sampler.min_stride}, inference size {self.imgsz}")
+        elif pace > needed * self.headroom * 2 and self.level > 0:
+            self._apply(self.level - 1)
+            print(f"Ahead of the time budget ({pace:.1f} > {needed:.1f} frames/s): "
+                  f"stride {self.sampler.min_stride}, inference size {self.imgsz}")
+        else:
+            self.window_time = now
+            self.window_frame = frame_number
+        return True
+
+    def report(self) -> Dict[str, Any]:
+        """The fidelity the scan actually ran at."""
+        frames = sum(self.frames_by_level.values())
+        scanned = self.frame_number - self.start_frame
+        total = self.last_frame - self.start_frame
+        return {
+            'scan_budget_seconds': round(self.deadline - self.started, 1),
+            'scan_seconds': round(time.time() - self.started, 1),
+            'finished_in_budget': not self.expired,
+            'coverage': round(scanned / total, 4) if total > 0 else None,
+            'last_frame_scanned': self.frame_number,
+            'max_min_stride': self.levels[self.lowest_level][0],
+            'min_imgsz': self.levels[self.lowest_level][1],
+            # Share of processed frames per (minimum stride, inference size)
+            'levels': [
+                {'min_stride': self.levels[level][0], 'imgsz': self.levels[level][1],
+                 'share': round(count / frames, 4)}
+                for level, count in sorted(self.frames_by_level.items())
+            ] if frames else []
+        }
+
+
+def merge_reports(reports) -> Optional[Dict[str, Any]]:
+    """Combine the fidelity reports of the segments of a sharded scan."""
+    reports = [report for report in reports if report is not None]
+    if not reports:
+        return None
+    return {
+        'scan_budget_seconds': max(report['scan_budget_seconds'] for report in reports),
+        'scan_seconds': max(report['scan_seconds'] for report in reports),
+        'finished_in_budget': all(report['finished_in_budget'] for report in reports),
+        'max_min_stride': max(report['max_min_stride'] for report in reports),
+        'min_imgsz': min(report['min_imgsz'] for report in reports),
+        'segments': reports
+    }
@@ -0,0 +1,160 @@
+"""
+Appearance-based re-identification of counted tracks.
+
+The tracker forgets a track after it has been missing for a few frames, so an
+object that leaves the view (occlusion, the camera panning away and back) comes
+back under a new track ID and would be counted, uploaded and valued again.
+Every counted track gets a compact appearance embedding; when a new track is
+about to be counted it is compared against the counted tracks of the same
+class that were no longer visible when it appeared, and a close enough match
+is treated as the same physical object instead of a new item.
+
+The embedding is a colour histogram (hue/saturation, robust to viewpoint)
+concatenated with a tiny grayscale thumbnail (coarse shape), L2-normalised so
+a single matrix-vector product scores a query against the whole index.
+
+The match only looks at class, appearance and non-overlapping lifetimes, not
+at where the object is, so identical items seen one after another (a row of
+matching chairs or bar stools in a pan) can be merged into one and the
+inventory undercounts. Re-identification is therefore opt-in (REID_THRESHOLD)
+and best suited to walkthroughs without sets of identical furniture.
+"""
+
+import cv2
+import numpy as np
+
+HIST_BINS = (16, 8)  # hue, saturation
+THUMB_SIZE = 16
+
+
+def appearance_embedding(crop):
+    """
+    Compute the appearance embedding of an object crop.
+
+    Args:
+        crop (np.ndarray): BGR crop of the object
+
+    Returns:
+        np.ndarray: (D,) float32 unit vector, or None for an empty crop
+    """
+    if crop is None or crop.size == 0:
+        return None
+
+    hsv = cv2.cvtColor(crop, cv2.COLOR_BGR2HSV)
+    hist = cv2.calcHist([hsv], [0, 1], None, HIST_BINS, [0, 180, 0, 256]).ravel()
+    # Square root (Hellinger) so a dominant colour does not swamp the rest
+    hist = np.sqrt(hist / max(hist.sum(), 1.0))
+
+    gray = cv2.cvtColor(crop, cv2.COLOR_BGR2GRAY)
+    thumb = cv2.resize(gray, (THUMB_SIZE, THUMB_SIZE), interpolation=cv2.INTER_AREA).astype(np.float32).ravel()
+    thumb -= thumb.mean()
+
+    # Both halves unit length, each weighted 1/sqrt(2): cosine similarity is the
+    # average of the colour and the shape similarity
+    parts = []
+    for part in (hist, thumb):
+        norm = np.linalg.norm(part)
+        parts.append(part / norm if norm > 0 else part)
+    return (np.concatenate(parts) / np.sqrt(2.0)).astype(np.float32)
+
+
+class TrackDeduplicator:
+    def __init__(self, threshold=0.9, max_gap_frames=None, capacity=64):
+        """
+        Initialize an empty index.
+
+        Args:
+            threshold (float): Minimum cosine similarity for two tracks to be the same object
+            max_gap_frames (Optional[int]): Only match tracks last seen at most this many frames ago
+            capacity (int): Initial number of rows; grows by doubling
+        """
+        self.threshold = threshold
+        self.max_gap_frames = max_gap_frames
+        self.dim = HIST_BINS[0] * HIST_BINS[1] + THUMB_SIZE * THUMB_SIZE
+        self.size = 0
+        self.embeddings = np.zeros((capacity, self.dim), dtype=np.float32)
+        self.classes = np.full(capacity, -1, dtype=np.int32)
+        self.last_seen = np.zeros(capacity, dtype=np.int64)
+        self.views = np.zeros(capacity, dtype=np.int32)
+        self.track_ids = np.zeros(capacity, dtype=np.int64)
+        self.merged = 0
+
+    def _grow(self):
+        capacity = len(self.classes) * 2
+        for name in ('embeddings', 'classes', 'last_seen', 'views', 'track_ids'):
+            old = getattr(self, name)
+            new = np.zeros((capacity,) + old.shape[1:], dtype=old.dtype)
+            new[:self.size] = old[:self.size]
+            setattr(self, name, new)
+
+    def __len__(self):
+        return self.size
+
+    def add(self, track_id, cls_id, embedding, frame_number):
+        """
+        Index a newly counted track.
+
+        Returns:
+            int: Row of the track in the index
+        """
+        if self.size == len(self.classes):
+            self._grow()
+        row = self.size
+        self.size += 1
+        self.embeddings[row] = embedding if embedding is not None else 0
+        self.classes[row] = cls_id
+        self.last_seen[row] = frame_number
+        self.views[row] = 1 if embedding is not None else 0
+        self.track_ids[row] = track_id
+        return row
+
+    def touch(self, rows, frame_number):
+        """Mark indexed tracks as visible in this frame (rows may contain -1 for unindexed tracks)."""
+        rows = rows[rows >= 0]
+        if len(rows):
+            self.last_seen[rows] = frame_number
+
+    def match(self, cls_id, embedding, first_frame, frame_number):
+        """
+        Find the counted track a new track duplicates.
+
+        Candidates are indexed tracks of the same class that were last seen
+        before the new track first appeared: two tracks visible at the same
+        time are two different objects.
+
+        Args:
+            cls_id (int): Class of the new track
+            embedding (np.ndarray): Appearance embedding of the new track
+            first_frame (int): Frame in which the new track first appeared
+            frame_number (int): Current frame
+
+        Returns:
+            int: Row of the matching track, or -1
+        """
+        if embedding is None or self.size == 0:
+            return -1
+        n = self.size
+        candidates = (self.classes[:n] == cls_id) & (self.last_seen[:n] < first_frame) & (self.views[:n] > 0)
+        if self.max_gap_frames is not None:
+            candidates &= frame_number - self.last_seen[:n] <= self.max_gap_frames
+        if not candidates.any():
+            return -1
+
+        scores = self.embeddings[:n] @ embedding
+        scores[~candidates] = -1.0
+        row = int(scores.argmax())
+        if scores[row] < self.threshold:
+            return -1
+        return row
+
+    def merge(self, row, embedding, frame_number):
+        """Fold a re-identified track into an indexed one, averaging in the new view."""
+        self.merged += 1
+        self.last_seen[row] = frame_number
+        if embedding is None:
+            return
+        views = self.views[row]
+        blended = (self.embeddings[row] * views + embedding) / (views + 1)
+        norm = np.linalg.norm(blended)
+        self.embeddings[row] = blended / norm if norm > 0 else embedding
+        self.views[row] = views + 1
@@ -0,0 +1,140 @@
+"""
+Struct-of-arrays track bookkeeping.
+
+Replaces the per-track dicts (class-count defaultdicts plus a box_history list
+that was re-sliced every frame) with preallocated NumPy arrays indexed by
+slot. A frame's observations are applied in one vectorized update and stale
+tracks are found and evicted in bulk, so per-frame cost no longer grows with
+Python-level work per live track.
+"""
+
+import numpy as np
+
+
+class TrackStore:
+    def __init__(self, num_classes, capacity=256, history=10):
+        """
+        Initialize an empty store.
+
+        Args:
+            num_classes (int): Number of detector classes (width of the class-vote table)
+            capacity (int): Initial number of track slots; grows by doubling
+            history (int): Length of the per-track box ring buffer
+        """
+        self.num_classes = num_classes
+        self.history = history
+        self.slots = {}  # track_id -> slot
+        self.free = []
+        self._allocate(capacity)
+
+    def _allocate(self, capacity):
+        self.capacity = capacity
+        self.track_ids = np.full(capacity, -1, dtype=np.int64)
+        self.active = np.zeros(capacity, dtype=bool)
+        self.frames_seen = np.zeros(capacity, dtype=np.int32)
+        self.misses = np.zeros(capacity, dtype=np.int32)
+        self.class_votes = np.zeros((capacity, self.num_classes), dtype=np.int32)
+        self.boxes = np.zeros((capacity, self.history, 4), dtype=np.int32)
+        self.box_pos = np.zeros(capacity, dtype=np.int32)
+        self.counted = np.zeros(capacity, dtype=bool)
+        self.first_frame = np.zeros(capacity, dtype=np.int64)
+        self.dedup_row = np.full(capacity, -1, dtype=np.int64)  # row in the TrackDeduplicator index
+        self.free = list(range(capacity - 1, -1, -1))
+
+    _ARRAYS = ('track_ids', 'active', 'frames_seen', 'misses', 'class_votes', 'boxes', 'box_pos', 'counted',
+               'first_frame', 'dedup_row')
+
+    def _grow(self):
+        old = self.capacity
+        arrays = [getattr(self, name) for name in self._ARRAYS]
+        self._allocate(old * 2)
+        for name, current in zip(self._ARRAYS, arrays):
+            getattr(self, name)[:old] = current
+        self.free = list(range(self.capacity - 1, old - 1, -1))
+
+    def __len__(self):
+        return len(self.slots)
+
+    def __contains__(self, track_id):
+        return int(track_id) in self.slots
+
+    def slots_for(self, track_ids, frame_number=0):
+        """Return the slots of the given tracks, allocating fresh slots for unseen IDs."""
+        slots = np.empty(len(track_ids), dtype=np.int64)
+        for i, track_id in enumerate(track_ids):
+            track_id = int(track_id)
+            slot = self.slots.get(track_id)
+            if slot is None:
+                if not self.free:
+                    self._grow()
+                slot = self.free.pop()
+                self.slots[track_id] = slot
+                self.track_ids[slot] = track_id
+                self.active[slot] = True
+                self.frames_seen[slot] = 0
+                self.misses[slot] = 0
+                self.class_votes[slot] = 0
+                self.box_pos[slot] = 0
+                self.counted[slot] = False
+                self.first_frame[slot] = frame_number
+                self.dedup_row[slot] = -1
+            slots[i] = slot
+        return slots
+
+    def observe(self, track_ids, cls_ids, boxes, frame_number=0):
+        """
+        Record one frame's detections.
+
+        Args:
+            track_ids (np.ndarray): (N,) unique track IDs seen in the frame
+            cls_ids (np.ndarray): (N,) class index of each detection
+            boxes (np.ndarray): (N, 4) xyxy boxes
+            frame_number (int): Current frame, recorded as the first frame of new tracks
+
+        Returns:
+            np.ndarray: (N,) slots of the observed tracks, aligned with the inputs
+        """
+        slots = self.slots_for(track_ids, frame_number)
+        if len(slots) == 0:
+            return slots
+        self.frames_seen[slots] += 1
+        self.misses[slots] = 0
+        np.add.at(self.class_votes, (slots, np.asarray(cls_ids, dtype=np.int64)), 1)
+        self.boxes[slots, self.box_pos[slots] % self.history] = boxes
+        self.box_pos[slots] += 1
+        return slots
+
+    def majority_class(self, slots):
+        """Most-voted class index for each slot (ties go to the lowest class index)."""
+        return self.class_votes[slots].argmax(axis=1)
+
+    def end_frame(self, observed_slots, max_misses):
+        """
+        Age every live track that was not observed this frame and evict the stale ones.
+
+        Args:
+            observed_slots (np.ndarray): Slots returned by observe() for this frame
+            max_misses (int): Tracks missing for more than this many consecutive frames are evicted
+
+        Returns:
+            list: (track_id, counted) for each evicted track
+        """
+        missed = self.active.copy()
+        missed[observed_slots] = False
+        self.misses[missed] += 1
+        stale = np.flatnonzero(missed & (self.misses > max_misses))
+        evicted = []
+        for slot in stale:
+            track_id = int(self.track_ids[slot])
+            evicted.append((track_id, bool(self.counted[slot])))
+            del self.slots[track_id]
+            self.active[slot] = False
+            self.track_ids[slot] = -1
+            self.free.append(int(slot))
+        return evicted
+
+    def recent_boxes(self, slot):
+        """Return the slot's box history, oldest first."""
+        count = min(int(self.box_pos[slot]), self.history)
+        order = (np.arange(int(self.box_pos[slot]) - count, int(self.box_pos[slot]))) % self.history
+        return self.boxes[slot, order]
@@ -0,0 +1,217 @@
+"""
+Persistent valuation cache shared across jobs.
+
+Users re-upload walkthroughs of the same rooms, so the same sofa gets valued
+again and again. The cache keys each valuation by a 64-bit perceptual hash
+(DCT hash) of the crop plus the detected class, and a crop whose hash is
+within max_distance bits of a cached crop of the same class reuses that
+(name, price) instead of calling Gemini. Entries live in a SQLite file
+(VALUATION_CACHE_PATH) so they survive restarts and are shared by the worker
+processes of a host; they expire after VALUATION_CACHE_TTL_DAYS and the least
+recently used ones are evicted beyond VALUATION_CACHE_MAX_ENTRIES.
+
+Lookups use multi-index hashing rather than scanning the class: each hash is
+split into four 16-bit bands stored in indexed columns. Two hashes within
+max_distance bits agree to within max_distance // 4 bits on at least one band,
+so only entries whose band matches one of those few neighbouring values are
+read and compared.
+"""
+
+import os
+import time
+import sqlite3
+import logging
+import threading
+from itertools import combinations
+from typing import List, Optional, Tuple
+
+import cv2
+import numpy as np
+
+from Metrics import registry
+
+VALUATION_CACHE_PATH = os.environ.get(
+    "VALUATION_CACHE_PATH",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "cache", "valuations.sqlite3")
+)
+VALUATION_CACHE_TTL_DAYS = float(os.environ.get("VALUATION_CACHE_TTL_DAYS", 30))
+VALUATION_CACHE_MAX_ENTRIES = int(os.environ.get("VALUATION_CACHE_MAX_ENTRIES", 50000))
+# Hamming distance (bits out of 64) within which two crops count as the same item
+VALUATION_CACHE_MAX_DISTANCE = int(os.environ.get("VALUATION_CACHE_MAX_DISTANCE", 6))
+
+_BANDS = 4
+_BAND_BITS = 16
+_BAND_MASK = (1 << _BAND_BITS) - 1
+# Largest per-band distance probed through the index (137 values per band); beyond it lookups scan the class
+_MAX_BAND_RADIUS = 2
+
+_LOOKUPS = registry.counter('insurefire_valuation_cache_total', 'Valuation cache lookups by result', ('result',))
+_HITS = _LOOKUPS.labels(result='hit')
+_MISSES = _LOOKUPS.labels(result='miss')
+
+
+def perceptual_hash(image) -> Optional[int]:
+    """
+    64-bit DCT perceptual hash of an image.
+
+    Args:
+        image: JPEG/PNG bytes, a BGR or grayscale ndarray, or a PIL Image
+
+    Returns:
+        Optional[int]: The hash as an unsigned integer, None if the image cannot be decoded
+    """
+    if isinstance(image, (bytes, bytearray)):
+        gray = cv2.imdecode(np.frombuffer(image, dtype=np.uint8), cv2.IMREAD_GRAYSCALE)
+    elif isinstance(image, np.ndarray):
+        gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY) if image.ndim == 3 else image
+    else:
+        gray = np.asarray(image.convert('L'))
+    if gray is None or gray.size == 0:
+        return None
+    small = cv2.resize(gray, (32, 32), interpolation=cv2.INTER_AREA).astype(np.float32)
+    # Lowest 8x8 frequencies without the DC term, thresholded at their median
+    low = cv2.dct(small)[:8, :8].flatten()[1:]
+    bits = low > np.median(low)
+    return int(sum(1 << i for i, bit in enumerate(bits) if bit))
+
+
+def _to_signed(value: int) -> int:
+    # SQLite integers are signed 64-bit
+    return value - (1 << 64) if value >= 1 << 63 else value
+
+
+def _bands(phash: int) -> List[int]:
+    return [(phash >> (_BAND_BITS * i)) & _BAND_MASK for i in range(_BANDS)]
+
+
+def _neighbours(value: int, radius: int) -> List[int]:
+    """Every band value within radius bits of value."""
+    values = [value]
+    for flips in range(1, radius + 1):
+        for bits in combinations(range(_BAND_BITS), flips):
+            values.append(value ^ sum(1 << bit for bit in bits))
+    return values
+
+
+def _hamming(a: np.ndarray, b: int) -> np.ndarray:
+    x = a ^ np.uint64(b)
+    return np.unpackbits(x.view(np.uint8).reshape(-1, 8), axis=1).sum(axis=1)
+
+
+class ValuationCache:
+    def __init__(self, path: str = VALUATION_CACHE_PATH, ttl_days: float = VALUATION_CACHE_TTL_DAYS,
+                 max_entries: int = VALUATION_CACHE_MAX_ENTRIES, max_distance: int = VALUATION_CACHE_MAX_DISTANCE):
+        """
+        Open (or create) the cache.
+
+        Args:
+            path (str): SQLite file
+            ttl_days (float): Age after which an entry is no longer used
+            max_entries (int): Entries kept before the least recently used are evicted
+            max_distance (int): Largest Hamming distance between hashes of the same item
+        """
+        self.ttl = ttl_days * 24 * 3600
+        self.max_entries = max_entries
+        self.max_distance = max_distance
+        self.lock = threading.Lock()
+        self.inserts = 0
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.db = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        with self.lock, self.db:
+            self.db.execute("PRAGMA journal_mode=WAL")
+            self.db.execute("""
+                CREATE TABLE IF NOT EXISTS valuations (
+                    phash INTEGER NOT NULL,
+                    class TEXT NOT NULL,
+                    name TEXT NOT NULL,
+                    price INTEGER NOT NULL,
+                    created_at REAL NOT NULL,
+                    last_used REAL NOT NULL
+                )
+            """)
+            # Band columns, added to (and filled in for) caches created before the index existed
+            columns = {row[1] for row in self.db.execute("PRAGMA table_info(valuations)")}
+            for i in range(_BANDS):
+                if f"band{i}" not in columns:
+                    self.db.execute(f"ALTER TABLE valuations ADD COLUMN band{i} INTEGER")
+                    self.db.execute(f"UPDATE valuations SET band{i} = (phash >> {_BAND_BITS * i}) & {_BAND_MASK}")
+                self.db.execute(f"CREATE INDEX IF NOT EXISTS valuations_band{i} ON valuations (class, band{i})")
+            self.db.execute("CREATE INDEX IF NOT EXISTS valuations_class ON valuations (class)")
+            self.db.execute("CREATE INDEX IF NOT EXISTS valuations_last_used ON valuations (last_used)")
+        self._evict()
+
+    def get(self, phash: Optional[int], class_name: Optional[str]) -> Optional[Tuple[str, int]]:
+        """Return the cached (name, price) of the nearest fresh entry within max_distance, or None."""
+        if phash is None:
+            return None
+        now = time.time()
+        select = "SELECT rowid, phash, name, price FROM valuations WHERE class = ? AND created_at >= ?"
+        radius = self.max_distance // _BANDS
+        if radius <= _MAX_BAND_RADIUS:
+            # Only entries that agree with the hash to within radius bits on some band, one indexed
+            # lookup per band
+            queries, params = [], []
+            for i, band in enumerate(_bands(phash)):
+                values = _neighbours(band, radius)
+                queries.append(f"{select} AND band{i} IN ({', '.join('?' * len(values))})")
+                params.extend([class_name or '', now - self.ttl, *values])
+            query = " UNION ".join(queries)
+        else:
+            query, params = select, [class_name or '', now - self.ttl]
+        with self.lock:
+            rows = self.db.execute(query, params).fetchall()
+            if rows:
+                distances = _hamming(np.array([row[1] for row in rows], dtype=np.int64).view(np.uint64), phash)
+                best = int(distances.argmin())
+                if distances[best] <= self.max_distance:
+                    rowid, _, name, price = rows[best]
+                    with self.db:
+                        self.db.execute("UPDATE valuations SET last_used = ? WHERE rowid = ?", (now, rowid))
+                    _HITS.inc()
+                    return name, price
+        _MISSES.inc()
+        return None
+
+    def put(self, phash: Optional[int], class_name: Optional[str], name: str, price: int):
+        """Store a valuation."""
+        if phash is None or price is None:
+            return
+        now = time.time()
+        with self.lock:
+            with self.db:
+                self.db.execute(
+                    "INSERT INTO valuations (phash, class, name, price, created_at, last_used, "
+                    "band0, band1, band2, band3) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    (_to_signed(phash), class_name or '', name, int(price), now, now, *_bands(phash))
+                )
+            self.inserts += 1
+            evict = self.inserts % 100 == 0
+        if evict:
+            self._evict()
+
+    def _evict(self):
+        """Drop expired entries and the least recently used ones beyond max_entries."""
+        try:
+            with self.lock, self.db:
+                self.db.execute("DELETE FROM valuations WHERE created_at < ?", (time.time() - self.ttl,))
+                self.db.execute(
+                    "DELETE FROM valuations WHERE rowid IN (SELECT rowid FROM valuations "
+                    "ORDER BY last_used DESC LIMIT -1 OFFSET ?)", (self.max_entries,)
+                )
+        except sqlite3.Error as e:
+            logging.warning(f"Valuation cache eviction failed: {str(e)}")
+
+
+def open_cache() -> Optional[ValuationCache]:
+    """The configured cache, or None if VALUATION_CACHE_PATH is empty or the file cannot be opened."""
+    if not VALUATION_CACHE_PATH:
+        return None
+    try:
+        return ValuationCache()
+    except sqlite3.Error as e:
+        logging.warning(f"Valuation cache disabled, could not open {VALUATION_CACHE_PATH}: {str(e)}")
+        return None
+
+
+# Shared by every job in the process
+valuation_cache = open_cache()
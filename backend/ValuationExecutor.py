@@ -0,0 +1,169 @@
+"""
+Concurrent, rate-limited execution of Gemini valuation calls.
+
+Valuation used to be a sequential loop of blocking Gemini calls, so its
+duration was the sum of all calls. Batches are now submitted to a shared
+thread pool (valuation_executor) and their results gathered back by the job,
+so valuation takes roughly as long as the slowest call. Every request to
+Gemini goes through gemini_limiter, which is shared by all jobs of the
+process because the quota belongs to the API key:
+  - a token bucket caps the request rate (GEMINI_RATE per second, GEMINI_BURST)
+  - an AIMD concurrency limit grows by one slot per limit's worth of fast
+    successful calls and halves on a 429 or a call slower than
+    GEMINI_TARGET_LATENCY (at most once per second)
+  - rate-limit and transient errors are retried with full-jitter exponential
+    backoff, up to GEMINI_MAX_ATTEMPTS attempts
+"""
+
+import os
+import time
+import random
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from Metrics import registry, EXTERNAL_CALLS_TOTAL
+
+GEMINI_RATE = float(os.environ.get("GEMINI_RATE", 4))
+GEMINI_BURST = int(os.environ.get("GEMINI_BURST", 4))
+GEMINI_MAX_CONCURRENCY = int(os.environ.get("GEMINI_MAX_CONCURRENCY", 8))
+GEMINI_MAX_ATTEMPTS = int(os.environ.get("GEMINI_MAX_ATTEMPTS", 4))
+# Calls slower than this (seconds) count as a sign of overload
+GEMINI_TARGET_LATENCY = float(os.environ.get("GEMINI_TARGET_LATENCY", 20))
+
+_TRANSIENT_CODES = {408, 429, 500, 502, 503, 504}
+_TRANSIENT_NAMES = {'ResourceExhausted', 'TooManyRequests', 'ServiceUnavailable', 'InternalServerError',
+                    'DeadlineExceeded', 'GatewayTimeout', 'BadGateway'}
+
+
+def is_rate_limited(error: Exception) -> bool:
+    """True for quota / 429 errors (google.api_core's ResourceExhausted and the like)."""
+    return getattr(error, 'code', None) == 429 or type(error).__name__ in ('ResourceExhausted', 'TooManyRequests')
+
+
+def is_transient(error: Exception) -> bool:
+    """True for errors worth retrying: rate limits, server errors, timeouts and dropped connections."""
+    return (getattr(error, 'code', None) in _TRANSIENT_CODES or type(error).__name__ in _TRANSIENT_NAMES
+            or isinstance(error, (TimeoutError, ConnectionError)))
+
+
+class TokenBucket:
+    def __init__(self, rate: float, burst: int):
+        """
+        Args:
+            rate (float): Tokens added per second (0 disables the limit)
+            burst (int): Bucket capacity
+        """
+        self.rate = rate
+        self.capacity = max(1, burst)
+        self.tokens = float(self.capacity)
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        """Take a token, sleeping until one is available."""
+        if self.rate <= 0:
+            return
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+class AdaptiveLimiter:
+    def __init__(self, rate: float = GEMINI_RATE, burst: int = GEMINI_BURST,
+                 max_concurrency: int = GEMINI_MAX_CONCURRENCY, max_attempts: int = GEMINI_MAX_ATTEMPTS,
+                 target_latency: float = GEMINI_TARGET_LATENCY, backoff_base: float = 1.0,
+                 backoff_max: float = 30.0):
+        """
+        Initialize the limiter.
+
+        Args:
+            rate (float): Requests per second
+            burst (int): Requests that may be sent back to back
+            max_concurrency (int): Upper bound of the adaptive concurrency limit
+            max_attempts (int): Attempts per call for rate-limit and transient errors
+            target_latency (float): Successful calls slower than this shrink the concurrency limit
+            backoff_base (float): First retry waits up to this many seconds, doubling per attempt
+            backoff_max (float): Cap of the retry wait
+        """
+        self.bucket = TokenBucket(rate, burst)
+        self.max_concurrency = max(1, max_concurrency)
+        self.limit = float(max(1, self.max_concurrency // 2))
+        self.max_attempts = max(1, max_attempts)
+        self.target_latency = target_latency
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.in_flight = 0
+        self.last_decrease = 0.0
+        self.changed = threading.Condition()
+
+    def _acquire(self):
+        with self.changed:
+            self.changed.wait_for(lambda: self.in_flight < int(self.limit))
+            self.in_flight += 1
+        self.bucket.acquire()
+
+    def _release(self, overloaded: bool, succeeded: bool):
+        with self.changed:
+            self.in_flight -= 1
+            now = time.monotonic()
+            if overloaded:
+                # Multiplicative decrease, once per burst of 429s rather than once per failed call
+                if now - self.last_decrease >= 1.0:
+                    self.limit = max(1.0, self.limit / 2)
+                    self.last_decrease = now
+            elif succeeded:
+                # Additive increase: about one slot per limit's worth of successful calls
+                self.limit = min(float(self.max_concurrency), self.limit + 1 / self.limit)
+            self.changed.notify_all()
+
+    def call(self, fn, *args, **kwargs):
+        """
+        Call fn within the rate and concurrency limits, retrying rate-limit and transient errors.
+
+        Returns:
+            Whatever fn returns; the last error is raised once the attempts are used up
+        """
+        for attempt in range(1, self.max_attempts + 1):
+            self._acquire()
+            started = time.monotonic()
+            try:
+                result = fn(*args, **kwargs)
+            except Exception as e:
+                throttled = is_rate_limited(e)
+                self._release(overloaded=throttled, succeeded=False)
+                if attempt == self.max_attempts or not is_transient(e):
+                    raise
+                delay = random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** (attempt - 1)))
+                print(f"Gemini call failed ({type(e).__name__}), retrying in {delay:.1f}s "
+                      f"(attempt {attempt}/{self.max_attempts}, concurrency limit {int(self.limit)})")
+                EXTERNAL_CALLS_TOTAL.inc(service='gemini', outcome='retry')
+                time.sleep(delay)
+                continue
+            self._release(overloaded=time.monotonic() - started > self.target_latency, succeeded=True)
+            return result
+
+
+class ValuationExecutor:
+    def __init__(self, max_workers: int = GEMINI_MAX_CONCURRENCY):
+        """Thread pool that runs valuation tasks of all jobs; the limiter decides how many calls are in flight."""
+        self.pool = ThreadPoolExecutor(max_workers=max(1, max_workers), thread_name_prefix="valuation")
+
+    def submit(self, fn, *args, **kwargs):
+        """Run fn in the pool and return its Future."""
+        return self.pool.submit(fn, *args, **kwargs)
+
+
+# Shared by every job in the process (the Gemini quota is per API key)
+gemini_limiter = AdaptiveLimiter()
+valuation_executor = ValuationExecutor()
+
+registry.gauge('insurefire_gemini_concurrency_limit', 'Current adaptive limit of concurrent Gemini calls',
+               lambda: int(gemini_limiter.limit))
+registry.gauge('insurefire_gemini_in_flight', 'Gemini calls in flight', lambda: gemini_limiter.in_flight)
@@ -0,0 +1,349 @@
+"""
+Upload and valuation of counted items while the scan is still running.
+
+The scan hands over an item as soon as its best snapshot is final (its track
+aged out, or the snapshot stopped improving). A per-job worker thread crops
+the snapshot from the full-resolution video if the scan only recorded where
+it is, encodes it once, uploads that JPEG and collects the same bytes into
+batched Gemini requests on the shared valuation executor. Finished items
+come back through poll(), which the scan loop calls once per frame, so the
+inventory and the checkpoint are only ever touched from the job's own
+thread. The worker does read and add crops in the snapshot store, which
+locks around every access. Every handed-over item comes back, as a failure
+if need be (even if the worker itself dies), so finish() always returns.
+With a deadline (a time-budgeted job) the worker stops uploading and
+valuing once it passes, and finish() stops waiting: the items it did not
+reach come back unvalued.
+Job latency becomes roughly the longer of scanning and valuation rather than
+their sum; whatever is left when the scan ends goes through the same
+pipeline.
+"""
+
+import time
+import queue
+import threading
+from typing import Any, Callable, Dict, Optional
+
+import cv2
+
+from FramePipeline import read_frames_at
+from FurniturePriceEstimator import GEMINI_BATCH_SIZE
+from Metrics import STAGE_SECONDS
+from SnapshotStore import encode_snapshot
+from ValuationExecutor import valuation_executor
+
+_STOP = 'stop'
+_RELEASE = 'release'
+
+
+class ValuationPipeline:
+    def __init__(self, price_estimator, upload: Callable, checkpoint=None, job_progress=None,
+                 batch_size: int = GEMINI_BATCH_SIZE, flush_after: float = 2.0, deadline: Optional[float] = None):
+        """
+        Initialize the pipeline of one job.
+
+        Args:
+            price_estimator (FurniturePriceEstimator): Shared estimator
+            upload (callable): upload(image_bytes, track_id, snapshot_info, item_count) -> public URL
+            checkpoint (Optional[JobCheckpoint]): Where finished valuations are saved
+            job_progress (Optional[JobProgress]): Throttled publisher for the job's progress stream
+            batch_size (int): Most crops per Gemini request
+            flush_after (float): Seconds a partial batch waits for more items before it is sent
+            deadline (Optional[float]): time.time() after which items are no longer uploaded or valued
+        """
+        self.price_estimator = price_estimator
+        self.upload = upload
+        self.checkpoint = checkpoint
+        self.job_progress = job_progress
+        self.batch_size = max(1, batch_size)
+        self.flush_after = flush_after
+        self.deadline = deadline
+
+        self.tasks = queue.Queue()
+        self.results = queue.Queue()  # (track_id, item_id, snapshot_info, public_url, estimate)
+        self.outstanding = set()  # track IDs of submitted items whose result has not been applied yet
+        self.completed = 0
+        self.expired = 0  # items the worker gave up on at the deadline (written by the worker only)
+        self.source = None
+        self.source_ready = None
+        self.cap = None
+        self.worker = None
+        self.batch = []  # uploaded items waiting to be sent to Gemini
+
+    def crop_from(self, video_path: str, ready: Optional[Callable] = None):
+        """
+        Let the worker crop snapshots that were recorded as (frame number, box) from a video file.
+
+        Args:
+            video_path (str): Full-resolution video
+            ready (Optional[callable]): Blocks until the file can be read (e.g. a spool's wait);
+                it must return or raise once the source is abandoned, or release_source() blocks
+        """
+        self.source = video_path
+        self.source_ready = ready
+
+    @property
+    def can_crop(self) -> bool:
+        return self.source is not None
+
+    def submit(self, track_id: int, item_id: str, item_count: int, snapshot_info: Dict[str, Any], snapshots) -> bool:
+        """
+        Hand over a counted item whose best snapshot is final.
+
+        Args:
+            snapshots (SnapshotStore): Holds the item's crop, unless it is to be cropped from the video
+
+        Returns:
+            bool: False if the crop is neither in the store nor can be cropped from the video
+        """
+        if track_id not in snapshots and not self.can_crop:
+            return False
+        if self.worker is None:
+            self.worker = threading.Thread(target=self._run, name="valuation-pipeline", daemon=True)
+            self.worker.start()
+        self.outstanding.add(track_id)
+        self.tasks.put((track_id, item_id, item_count, snapshot_info, snapshots))
+        return True
+
+    def poll(self, inventory, snapshots):
+        """Apply the items that have finished since the last call."""
+        applied = False
+        while True:
+            try:
+                result = self.results.get_nowait()
+            except queue.Empty:
+                break
+            self._apply(result, inventory, snapshots)
+            applied = True
+        if applied and self.job_progress is not None:
+            self.job_progress.update(valuations_completed=self.completed, total_value=inventory.total_value)
+
+    def release_source(self):
+        """Wait until every item handed over so far is cropped, then close the video file."""
+        if self.worker is None:
+            self.source = None
+            return
+        done = threading.Event()
+        self.tasks.put((_RELEASE, done))
+        done.wait()
+
+    def close(self):
+        """Send the last partial batch, close the video file and stop the worker (items in flight still finish)."""
+        if self.worker is None:
+            return
+        done = threading.Event()
+        self.tasks.put((_STOP, done))
+        done.wait()
+        self.worker = None
+
+    def finish(self, inventory, snapshots) -> int:
+        """
+        Send the last partial batch and apply every outstanding item, waiting for them as needed.
+
+        Returns:
+            int: Number of items left unvalued because the deadline passed
+        """
+        self.close()
+        while self.outstanding:
+            try:
+                if self.deadline is None:
+                    result = self.results.get()
+                else:
+                    result = self.results.get(timeout=max(0.0, self.deadline - time.time()))
+            except queue.Empty:
+                break
+            self._apply(result, inventory, snapshots)
+        # Valuations still in flight at the deadline are not waited for; their crops stay in the store
+        expired = self.expired + len(self.outstanding)
+        self.outstanding.clear()
+        if expired:
+            print(f"Time budget exhausted: {expired} items left unvalued")
+        if self.job_progress is not None:
+            self.job_progress.update(valuations_completed=self.completed, total_value=inventory.total_value)
+        return expired
+
+    def restore(self, track_id: int, item_id: str, snapshot_info: Dict[str, Any], saved: Dict[str, Any],
+                inventory, snapshots):
+        """Apply a valuation saved to the checkpoint by an earlier attempt at the job."""
+        self._apply((track_id, item_id, snapshot_info, saved["public_url"],
+                     (saved["estimated_name"], saved["estimated_price"])), inventory, snapshots, save=False)
+
+    def _apply(self, result, inventory, snapshots, save=True):
+        track_id, item_id, snapshot_info, public_url, estimate = result
+        self.outstanding.discard(track_id)
+        if public_url is None:
+            # Not uploaded; the crop stays in the store so it can be retried
+            return
+
+        if estimate is not None:
+            estimated_name, estimated_price = estimate
+        else:
+            estimated_name, estimated_price = snapshot_info["class"], None
+        snapshot_info.update(saved=True, public_url=public_url, estimated_name=estimated_name,
+                             estimated_price=estimated_price)
+        inventory.attach_snapshot(item_id, public_url, snapshot_info["conf"], snapshot_info["frame_number"])
+        inventory.set_valuation(item_id, estimated_name, estimated_price)
+        if save and self.checkpoint is not None:
+            self.checkpoint.save_valuation(track_id, {
+                "public_url": public_url,
+                "estimated_name": estimated_name,
+                "estimated_price": estimated_price
+            })
+        # Uploaded: the crop is not needed any more
+        snapshots.discard(track_id)
+        self.completed += 1
+        if estimated_price is not None:
+            print(f"Estimated price of {snapshot_info['class']} (ID: {track_id}): "
+                  f"${estimated_price:,.2f} ({estimated_name})")
+
+    def _run(self):
+        try:
+            self._work()
+            return
+        except Exception as e:
+            print(f"Valuation worker failed, failing the items still in the pipeline: {str(e)}")
+        # Uploaded items come back unvalued; the rest of the queue is failed as it arrives, so
+        # every outstanding item is released and release_source(), close() and finish() return
+        for track_id, item_id, snapshot_info, public_url, _ in self.batch:
+            self.results.put((track_id, item_id, snapshot_info, public_url, None))
+        self.batch = []
+        if self.cap is not None:
+            self.cap.release()
+            self.cap = None
+        while True:
+            task = self.tasks.get()
+            if task[0] in (_STOP, _RELEASE):
+                task[1].set()
+                if task[0] == _STOP:
+                    return
+                continue
+            track_id, item_id, _, snapshot_info, _ = task
+            self.results.put((track_id, item_id, snapshot_info, None, None))
+
+    def _work(self):
+        while True:
+            try:
+                task = self.tasks.get(timeout=self.flush_after if self.batch else None)
+            except queue.Empty:
+                self._send(self.batch)
+                self.batch = []
+                continue
+            if task[0] in (_STOP, _RELEASE):
+                if self.cap is not None:
+                    self.cap.release()
+                    self.cap = None
+                if task[0] == _STOP:
+                    self._send(self.batch)
+                    self.batch = []
+                    task[1].set()
+                    return
+                self.source = None
+                task[1].set()
+                continue
+
+            if self._expired():
+                # Past the deadline: fail the rest of the queue instead of uploading it
+                track_id, item_id, _, snapshot_info, _ = task
+                self.expired += 1
+                self.results.put((track_id, item_id, snapshot_info, None, None))
+                continue
+
+            try:
+                entry = self._prepare(*task)
+            except Exception as e:
+                track_id, item_id, _, snapshot_info, _ = task
+                print(f"Error processing snapshot for {snapshot_info['class']} (ID: {track_id}): {str(e)}")
+                self.results.put((track_id, item_id, snapshot_info, None, None))
+                entry = None
+            if entry is not None:
+                self.batch.append(entry)
+                if len(self.batch) >= self.batch_size:
+                    self._send(self.batch)
+                    self.batch = []
+
+    def _expired(self) -> bool:
+        return self.deadline is not None and time.time() >= self.deadline
+
+    def _crop(self, track_id, snapshot_info, snapshots):
+        """The item's crop from the store, or cropped from the video (and kept in the store)."""
+        crop = snapshots.get(track_id)
+        if crop is not None or self.source is None:
+            return crop
+        try:
+            if self.cap is None:
+                if self.source_ready is not None:
+                    self.source_ready()
+                self.cap = cv2.VideoCapture(self.source)
+            with STAGE_SECONDS.time(stage='snapshot_reseek'):
+                for _, frame in read_frames_at(self.cap, [snapshot_info["frame_number"]]):
+                    x1, y1, x2, y2 = snapshot_info["box"]
+                    crop = frame[y1:y2, x1:x2].copy()
+        except Exception as e:
+            print(f"Error cropping snapshot of {snapshot_info['class']} (ID: {track_id}): {str(e)}")
+            return None
+        if crop is None or crop.size == 0:
+            return None
+        snapshots.put(track_id, crop)
+        return crop
+
+    def _prepare(self, track_id, item_id, item_count, snapshot_info, snapshots):
+        """Crop, encode and upload one item; returns its batch entry, or None once its result is out."""
+        class_name = snapshot_info["class"]
+        crop = self._crop(track_id, snapshot_info, snapshots)
+        if crop is None:
+            print(f"No snapshot available for {class_name} (ID: {track_id}), skipping")
+            self.results.put((track_id, item_id, snapshot_info, None, None))
+            return None
+
+        # One JPEG for the upload and the valuation
+        with STAGE_SECONDS.time(stage='jpeg_encode'):
+            image_bytes = encode_snapshot(crop)
+        if image_bytes is None:
+            print(f"Error processing snapshot for {class_name} (ID: {track_id}): "
+                  f"Failed to encode image to JPEG format")
+            self.results.put((track_id, item_id, snapshot_info, None, None))
+            return None
+
+        try:
+            public_url = self.upload(image_bytes, track_id, snapshot_info, item_count)
+        except Exception as e:
+            print(f"Error processing snapshot for {class_name} (ID: {track_id}): {str(e)}")
+            self.results.put((track_id, item_id, snapshot_info, None, None))
+            return None
+        print(f"Uploaded snapshot of {class_name} (ID: {track_id}) to Supabase")
+        print(f"Public URL: {public_url}")
+        return track_id, item_id, snapshot_info, public_url, image_bytes
+
+    def _send(self, batch):
+        """Value a batch as one Gemini request on the shared valuation executor."""
+        if not batch:
+            return
+        if self._expired():
+            # Uploaded in time, but there is no time left to value them
+            self.expired += len(batch)
+            for track_id, item_id, snapshot_info, public_url, _ in batch:
+                self.results.put((track_id, item_id, snapshot_info, public_url, None))
+            return
+        try:
+            future = valuation_executor.submit(
+                self.price_estimator.analyze_items_with_gemini,
+                [image_bytes for *_, image_bytes in batch],
+                labels=[snapshot_info["class"] for _, _, snapshot_info, _, _ in batch]
+            )
+        except Exception as e:
+            # e.g. the executor is shutting down: the items are uploaded, just not valued
+            print(f"Error estimating prices for a batch of {len(batch)} items: {str(e)}")
+            for track_id, item_id, snapshot_info, public_url, _ in batch:
+                self.results.put((track_id, item_id, snapshot_info, public_url, None))
+            return
+        future.add_done_callback(lambda future: self._valued(batch, future))
+
+    def _valued(self, batch, future):
+        try:
+            estimates = future.result()
+        except Exception as e:
+            print(f"Error estimating prices for a batch of {len(batch)} items: {str(e)}")
+            estimates = []
+        estimates = list(estimates) + [None] * (len(batch) - len(estimates))
+        for (track_id, item_id, snapshot_info, public_url, _), estimate in zip(batch, estimates):
+            self.results.put((track_id, item_id, snapshot_info, public_url, estimate))
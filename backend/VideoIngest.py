@@ -0,0 +1,226 @@
+"""
+Streaming ingest for remote videos.
+
+VideoSpool downloads an uploaded video into a local spool file on a background
+thread, using ranged requests so a dropped connection resumes where it left
+off instead of starting over. StreamingCapture reads frames from the spool
+while it is still being written: when the decoder reaches the end of the bytes
+downloaded so far it waits for more data, reopens the file and seeks back to
+the next frame. Detection therefore starts as soon as the first frames are
+decodable instead of after the whole file has been transferred.
+
+Files whose index (moov atom) sits at the end cannot be opened until the
+download finishes; those simply fall back to decode-after-download.
+"""
+
+import os
+import time
+import tempfile
+import threading
+from urllib.parse import urlparse
+
+import cv2
+import requests
+
+
+def is_remote(video_path):
+    """Return True if the video path is an http(s) URL."""
+    return urlparse(str(video_path)).scheme in ('http', 'https')
+
+
+def is_transient(error):
+    """True for download errors worth retrying: dropped connections, timeouts, 429 and 5xx responses."""
+    if isinstance(error, requests.HTTPError):
+        status = error.response.status_code if error.response is not None else None
+        return status is None or status == 429 or status >= 500
+    return isinstance(error, (requests.ConnectionError, requests.Timeout, requests.exceptions.ChunkedEncodingError))
+
+
+class VideoSpool:
+    def __init__(self, url, spool_dir=None, chunk_size=1 << 20, max_retries=5, timeout=30):
+        """
+        Start downloading a remote video into a local spool file.
+
+        Args:
+            url (str): Public URL of the video
+            spool_dir (Optional[str]): Directory for the spool file (defaults to the system temp dir)
+            chunk_size (int): Bytes per read from the response stream
+            max_retries (int): Consecutive transient failures tolerated before giving up (other errors,
+                e.g. a 404 or 403, fail the download right away)
+            timeout (float): Per-request connect/read timeout in seconds
+        """
+        self.url = url
+        self.chunk_size = chunk_size
+        self.max_retries = max_retries
+        self.timeout = timeout
+
+        suffix = os.path.splitext(urlparse(url).path)[1] or '.mp4'
+        fd, self.path = tempfile.mkstemp(prefix='video-spool-', suffix=suffix, dir=spool_dir)
+        os.close(fd)
+
+        self.bytes_written = 0
+        self.total_bytes = None
+        self.complete = False
+        self.error = None
+        self.cancelled = False
+        self.progress = threading.Condition()
+        self.thread = threading.Thread(target=self._download, name="video-spool", daemon=True)
+        self.thread.start()
+
+    def _download(self):
+        retries = 0
+        try:
+            with open(self.path, 'wb') as f:
+                while not self.complete and not self.cancelled:
+                    try:
+                        self._fetch(f)
+                        retries = 0
+                    except requests.RequestException as e:
+                        retries += 1
+                        if retries > self.max_retries or not is_transient(e):
+                            raise
+                        print(f"Video download interrupted at {self.bytes_written} bytes ({str(e)}), resuming...")
+                        time.sleep(min(2 ** retries, 30))
+        except Exception as e:
+            self.error = e
+        finally:
+            with self.progress:
+                self.complete = self.error is None and not self.cancelled
+                self.progress.notify_all()
+
+    def _fetch(self, f):
+        headers = {'Range': f'bytes={self.bytes_written}-'} if self.bytes_written else {}
+        with requests.get(self.url, headers=headers, stream=True, timeout=self.timeout) as response:
+            response.raise_for_status()
+            if self.bytes_written and response.status_code != 206:
+                # Server ignored the range request: start over from the beginning
+                f.seek(0)
+                f.truncate()
+                self.bytes_written = 0
+
+            if self.total_bytes is None:
+                content_range = response.headers.get('Content-Range')
+                if content_range and '/' in content_range and not content_range.endswith('/*'):
+                    self.total_bytes = int(content_range.rsplit('/', 1)[1])
+                elif response.headers.get('Content-Length'):
+                    self.total_bytes = int(response.headers['Content-Length'])
+
+            for chunk in response.iter_content(chunk_size=self.chunk_size):
+                if self.cancelled:
+                    return
+                if not chunk:
+                    continue
+                f.write(chunk)
+                f.flush()
+                with self.progress:
+                    self.bytes_written += len(chunk)
+                    self.progress.notify_all()
+
+        if self.total_bytes is None or self.bytes_written >= self.total_bytes:
+            with self.progress:
+                self.complete = True
+                self.progress.notify_all()
+        else:
+            raise requests.ConnectionError(f"Connection closed after {self.bytes_written} of {self.total_bytes} bytes")
+
+    @property
+    def finished(self):
+        """True once the download has ended, successfully or not."""
+        return self.complete or self.error is not None or self.cancelled
+
+    def wait_for(self, min_bytes, timeout=None):
+        """
+        Block until at least min_bytes are on disk or the download has ended.
+
+        Returns:
+            bool: True if min_bytes are available
+        """
+        with self.progress:
+            self.progress.wait_for(lambda: self.bytes_written >= min_bytes or self.finished, timeout)
+            if self.error is not None:
+                raise IOError(f"Failed to download video: {str(self.error)}")
+            return self.bytes_written >= min_bytes
+
+    def wait(self):
+        """Block until the whole video is on disk."""
+        self.wait_for(float('inf'))
+        if not self.complete:
+            raise IOError("Video download was cancelled")
+
+    def cancel(self):
+        """Stop the download; threads blocked in wait() or wait_for() return (or raise) right away."""
+        with self.progress:
+            self.cancelled = True
+            self.progress.notify_all()
+
+    def close(self):
+        """Stop the download and delete the spool file."""
+        self.cancel()
+        self.thread.join()
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+
+class StreamingCapture:
+    def __init__(self, spool, open_bytes=2 << 20, reopen_bytes=4 << 20):
+        """
+        Open a capture over a spool file that may still be downloading.
+
+        Args:
+            spool (VideoSpool): The spool being filled
+            open_bytes (int): Bytes to wait for before the first open attempt
+            reopen_bytes (int): New bytes to wait for before reopening after hitting the end of the data
+        """
+        self.spool = spool
+        self.reopen_bytes = reopen_bytes
+        self.frames_read = 0
+        self.cap = None
+
+        want = open_bytes
+        while True:
+            self.spool.wait_for(want)
+            finished = self.spool.finished
+            self.cap = cv2.VideoCapture(self.spool.path)
+            if self.cap.isOpened() or finished:
+                break
+            # Container index not downloaded yet (or not at the front of the file)
+            self.cap.release()
+            want = self.spool.bytes_written + self.reopen_bytes
+
+    def isOpened(self):
+        return self.cap is not None and self.cap.isOpened()
+
+    def get(self, prop):
+        return self.cap.get(prop)
+
+    def read(self):
+        while True:
+            finished = self.spool.finished
+            ret, frame = self.cap.read()
+            if ret:
+                self.frames_read += 1
+                return ret, frame
+            if finished:
+                # The whole file was on disk before this read: real end of video
+                return False, None
+
+            # Ran past the downloaded bytes: wait for more, reopen and seek back
+            self.spool.wait_for(self.spool.bytes_written + self.reopen_bytes)
+            self.cap.release()
+            self.cap = cv2.VideoCapture(self.spool.path)
+            if not self.cap.isOpened():
+                return False, None
+            if self.frames_read:
+                self.cap.set(cv2.CAP_PROP_POS_FRAMES, self.frames_read)
+
+    def skip(self, frames):
+        """Read past frames without returning them (e.g. to resume mid-video); False if the video ended first."""
+        for _ in range(frames):
+            ret, _ = self.read()
+            if not ret:
+                return False
+        return True
+
+    def release(self):
+        if self.cap is not None:
+            self.cap.release()
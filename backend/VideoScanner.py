@@ -0,0 +1,464 @@
+"""
+Detection, tracking and counting over a video.
+
+scan_video is the per-job scan loop: it runs the detector over sampled frames,
+tracks and counts the objects and picks each item's best snapshot. It lives
+apart from app.py, which connects to Supabase on import, so segment worker
+processes and offline tools such as DetectorBenchmark can run it without
+database credentials.
+"""
+
+import os
+import copy
+import time
+from collections import defaultdict
+
+import cv2
+import numpy as np
+
+from ModelRegistry import model_registry, CASCADE_WEIGHTS
+from FramePipeline import FramePrefetcher, read_frames, read_frames_at, batched
+from FrameSampler import AdaptiveFrameSampler
+from PreviewEncoder import annotate_frame, COLOR_NEW, COLOR_COUNTED
+from TrackStore import TrackStore
+from InventoryAggregator import InventoryAggregator
+from SnapshotStore import SnapshotStore
+from TimeBudget import TimeBudgetController
+from TrackDeduplicator import TrackDeduplicator, appearance_embedding
+from Metrics import STAGE_SECONDS, ITEMS_COUNTED_TOTAL
+
+# Width frames are downscaled to for detection and tracking (0 keeps the source resolution);
+# snapshots are still cropped from full-resolution frames
+DETECT_WIDTH = int(os.environ.get("DETECT_WIDTH", 960))
+# Appearance similarity above which a lost object's new track is merged into the item it was counted
+# as (unset: re-identification is off, see TrackDeduplicator for why it can undercount)
+REID_THRESHOLD = float(os.environ.get("REID_THRESHOLD", 0)) or None
+
+
+def snapshot_box(box, scale, width, height):
+    """Map a detection box to the full-resolution frame and add a 10% margin, clipped to the frame."""
+    x1, y1, x2, y2 = (v / scale for v in box)
+    margin_x = (x2 - x1) * 0.1
+    margin_y = (y2 - y1) * 0.1
+    return [max(0, int(x1 - margin_x)), max(0, int(y1 - margin_y)),
+            min(width, int(x2 + margin_x)), min(height, int(y2 + margin_y))]
+
+
+def crop_snapshots(video_path, best_snapshots, snapshots):
+    """
+    Crop the snapshots that were recorded as (frame number, box) from the full-resolution video
+    into the snapshot store.
+
+    Each frame holding a best view is decoded once, in file order, however many items it shows.
+    Snapshots whose frame cannot be read are left out of the store, uploaded ones are skipped.
+    """
+    pending = defaultdict(list)
+    for track_id, snapshot_info in best_snapshots.items():
+        if track_id not in snapshots and not snapshot_info["saved"]:
+            pending[snapshot_info["frame_number"]].append((track_id, snapshot_info["box"]))
+    if not pending:
+        return
+
+    cap = cv2.VideoCapture(video_path)
+    if not cap.isOpened():
+        print(f"Could not reopen '{video_path}' to crop {len(pending)} snapshot frames")
+        return
+    try:
+        with STAGE_SECONDS.time(stage='snapshot_reseek'):
+            for frame_number, frame in read_frames_at(cap, pending):
+                for track_id, (x1, y1, x2, y2) in pending.pop(frame_number):
+                    snapshot = frame[y1:y2, x1:x2].copy()
+                    if snapshot.size > 0:
+                        snapshots.put(track_id, snapshot)
+    finally:
+        cap.release()
+    if pending:
+        print(f"Could not read {len(pending)} snapshot frames back from the video")
+
+def scan_video(cap, fps, width, height, start_frame=0, end_frame=None, pipelined=True, batch_size=4,
+               prefetch_size=32, max_frame_stride=8, preview=None, show_display=False, record_windows=(),
+               reid_threshold=REID_THRESHOLD, reid_max_gap_seconds=60.0, detector_backend=None, checkpoint=None,
+               checkpoint_key=None, resume_state=None, job_progress=None, live=None, detect_width=None,
+               cascade_weights=None, deadline=None, valuation=None, snapshot_plateau_seconds=5.0, detector=None):
+    """
+    Run detection and tracking over a video (or a frame range of it) and collect the counted items.
+
+    Args:
+        cap: Opened capture, positioned at start_frame
+        fps (float): Source frame rate
+        width (int), height (int): Source frame size
+        start_frame (int): Number of frames already consumed before the capture position
+        end_frame (Optional[int]): Last frame number to process (inclusive), None for the whole video
+        pipelined (bool): Decode on a background thread and run the detector on micro-batches
+        batch_size (int): Frames per detector call when pipelined
+        prefetch_size (int): Decoded frames buffered ahead of the detector
+        max_frame_stride (int): Largest frame stride used while the view is static (1 disables adaptive sampling)
+        preview (Optional[PreviewEncoder]): Background encoder for the annotated preview
+        show_display (bool): Show the annotated frames in a window
+        record_windows (list): (first, last) frame ranges in which per-frame track boxes are recorded
+        reid_threshold (Optional[float]): Appearance similarity above which a new track is merged into
+            an earlier counted one (defaults to env REID_THRESHOLD; None or 0 disables re-identification).
+            Off by default: identical items filmed one after another (a row of matching chairs) look alike
+            and would be merged, undercounting the inventory
+        reid_max_gap_seconds (float): Longest time an object can be out of view and still be re-identified
+        detector_backend (Optional[str]): Detector inference backend (defaults to env DETECTOR_BACKEND)
+        detector (Optional[BaseDetector]): Detector to use instead of the registry's (no cascade is built
+            around it; detector_backend and cascade_weights are then ignored)
+        cascade_weights (Optional[str]): Small model run on every frame, with the large model only on
+            escalated frames (defaults to env CASCADE_WEIGHTS, '' runs the large model on every frame)
+        deadline (Optional[float]): time.time() by which the scan has to finish; frame stride and
+            inference size are adapted to meet it and the scan stops there if it cannot
+        valuation (Optional[ValuationPipeline]): Gets each counted item as soon as its best snapshot is
+            final (its track aged out or the snapshot has not improved for snapshot_plateau_seconds), so
+            uploads and valuations run while the scan goes on; the snapshot of a handed-over item is frozen
+        snapshot_plateau_seconds (float): Time after which a tracked item's best snapshot counts as final
+        checkpoint (Optional[JobCheckpoint]): Where to periodically save the scan state
+        checkpoint_key (Optional[str]): Video path recorded with the checkpoints
+        resume_state (Optional[dict]): Scan state from a checkpoint; scanning continues after start_frame
+        job_progress (Optional[JobProgress]): Throttled publisher for the job's progress stream
+        live (Optional[LiveFramePublisher]): Throttled publisher of annotated frames for the live view
+        detect_width (Optional[int]): Width frames are downscaled to for detection and tracking
+            (defaults to env DETECT_WIDTH, 0 disables). When downscaling, snapshots are recorded as
+            (frame number, box) and cropped from the full-resolution video by crop_snapshots
+
+    Returns:
+        dict: inventory (InventoryAggregator), best_snapshots, snapshots (SnapshotStore with the crops),
+            window_boxes, sampling stats and fidelity (the time budget report, None without a deadline)
+    """
+    hide_display = not show_display
+    always_annotate = preview is not None or not hide_display
+
+    # Shared detector weights; tracking state below is per job
+    if cascade_weights is None:
+        cascade_weights = CASCADE_WEIGHTS
+    cascade = None
+    if detector is None:
+        if cascade_weights:
+            # Per-job cascade state around the shared small and large detectors
+            cascade = model_registry.create_cascade(cascade_weights, backend=detector_backend)
+            detector = cascade
+        else:
+            detector = model_registry.get_detector(backend=detector_backend)
+
+    # Track history for filtering
+    min_frames_to_count = 3  # Minimum number of frames an object must appear in to be counted
+    max_consecutive_misses = 5  # Maximum number of consecutive frames an object can be missing before being forgotten
+    confidence_threshold = 0.55  # Confidence threshold for detection
+    iou_threshold = 0.45  # IoU threshold for tracking
+    snapshot_confidence_threshold = 0.55  # Minimum confidence for taking a snapshot
+
+    # Classes to exclude (don't track these)
+    excluded_classes = ['person']
+
+    class_names = detector.names
+    excluded_class_ids = [cls_id for cls_id, name in class_names.items() if name in excluded_classes]
+
+    # Everything the scan accumulates lives in one picklable state so it can be
+    # checkpointed and a restarted job can pick up where it stopped
+    state = resume_state
+    if state is None:
+        # Appearance index of counted tracks, so objects that are lost and picked up
+        # again under a new track ID are not counted (and uploaded and valued) twice
+        deduplicator = None
+        if reid_threshold:
+            deduplicator = TrackDeduplicator(threshold=reid_threshold,
+                                             max_gap_frames=int(reid_max_gap_seconds * (fps or 30)))
+        state = {
+            # Sample frames densely while the camera moves and sparsely while the view is static
+            'sampler': AdaptiveFrameSampler(min_stride=1, max_stride=max_frame_stride),
+            # Tracker state lives outside the model so the detector can run on micro-batches
+            'tracker': model_registry.create_tracker(fps),
+            # Per-track frames seen, misses, class votes and recent boxes, kept in flat arrays
+            'track_store': TrackStore(num_classes=len(class_names), history=10),
+            'deduplicator': deduplicator,
+            'item_tracks': {},  # re-identified track_id -> track_id the item was counted under
+            # Counted items with their stable IDs and per-class counts
+            'inventory': InventoryAggregator(),
+            'best_snapshots': {},  # {track_id: {"conf", "saved", "class", "box", "frame_number", "final"}}
+            # Crops of the best snapshots, within a memory budget
+            'snapshots': SnapshotStore(),
+            'window_boxes': defaultdict(dict),  # boxes inside record_windows, {track_id: {frame_number: box}}
+            'processed_count': 0
+        }
+    else:
+        print(f"Resuming scan after frame {start_frame}")
+    sampler = state['sampler']
+    tracker = state['tracker']
+    track_store = state['track_store']
+    deduplicator = state['deduplicator']
+    item_tracks = state['item_tracks']
+    inventory = state['inventory']
+    best_snapshots = state['best_snapshots']
+    snapshots = state['snapshots']
+    window_boxes = state['window_boxes']
+    print(f"Processing every {sampler.min_stride}-{sampler.max_stride} frames depending on camera motion")
+
+    last_frame = end_frame or int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+
+    # Detect and track on downscaled frames; boxes stay in their coordinates
+    if detect_width is None:
+        detect_width = DETECT_WIDTH
+    detect_scale = min(1.0, detect_width / width) if detect_width and width else 1.0
+    detect_size = None
+    if detect_scale < 1.0:
+        detect_size = (int(round(width * detect_scale)), int(round(height * detect_scale)))
+        print(f"Detecting on {detect_size[0]}x{detect_size[1]} frames, cropping snapshots at {width}x{height}")
+
+    # Frame source: decode on a background thread when pipelined, inline otherwise
+    def should_process(frame_number, frame):
+        # Frames inside a recording window are always processed so neighbouring
+        # segments see the same frames there when their tracks are stitched
+        process = sampler.should_process(frame_number, frame)
+        return process or any(first <= frame_number <= last for first, last in record_windows)
+
+    if pipelined:
+        frames = FramePrefetcher(cap, queue_size=prefetch_size, frame_filter=should_process,
+                                 start_frame=start_frame, end_frame=end_frame, resize=detect_size)
+    else:
+        frames = read_frames(cap, frame_filter=should_process, start_frame=start_frame, end_frame=end_frame,
+                             resize=detect_size)
+
+    # Trade frame stride and inference size for time when the scan has a deadline
+    budget = None
+    if deadline is not None:
+        budget = TimeBudgetController(deadline, start_frame, last_frame, sampler, imgsz=640,
+                                      fixed_imgsz=detector.fixed_shape)
+
+    # A tracked item whose best view is this old is handed to the valuation pipeline
+    plateau_frames = int(snapshot_plateau_seconds * (fps or 30))
+
+    def finalize(item_track):
+        """Hand a counted item whose best snapshot can no longer change to the valuation pipeline."""
+        snapshot_info = best_snapshots.get(item_track)
+        if valuation is None or snapshot_info is None or snapshot_info.get("final") or snapshot_info["saved"]:
+            return
+        item_id, item_count = inventory.item_for_track(item_track)
+        if item_id is not None and valuation.submit(item_track, item_id, item_count, snapshot_info, snapshots):
+            snapshot_info["final"] = True
+
+    # Stage timers, bound once outside the per-frame loop
+    track_seconds = STAGE_SECONDS.labels(stage='track')
+    reid_seconds = STAGE_SECONDS.labels(stage='reid')
+    crop_seconds = STAGE_SECONDS.labels(stage='snapshot_crop')
+    checkpoint_seconds = STAGE_SECONDS.labels(stage='checkpoint')
+
+    def detect_and_track(frames):
+        """Run the detector on micro-batches and apply tracker updates in frame order."""
+        for batch in batched(frames, batch_size if pipelined else 1):
+            imgsz = budget.imgsz if budget is not None else 640
+            results = detector.detect(
+                [frame for _, frame in batch],
+                conf=confidence_threshold,
+                iou=iou_threshold,
+                imgsz=imgsz
+            )
+            for i, ((frame_number, frame), detections) in enumerate(zip(batch, results)):
+                if cascade is not None:
+                    # A track that got close to being counted on the previous frame gets the large model now
+                    detections = cascade.take_pending(i, frame, detections, conf=confidence_threshold,
+                                                      iou=iou_threshold, imgsz=imgsz)
+                with track_seconds.time():
+                    tracks = tracker.update(detections.xyxy, detections.conf, detections.cls, frame, frame_number)
+                yield frame_number, frame, tracks
+
+    # Process the video
+    processed_count = state['processed_count']
+    scan_started = time.monotonic()
+    resumed_count = processed_count
+    try:
+        for frame_count, frame, (boxes, track_ids, cls_ids, confs) in detect_and_track(frames):
+            processed_count += 1
+        
+            # Display progress
+            if processed_count % 10 == 0 and last_frame > 0:
+                progress = (frame_count / last_frame) * 100
+                print(f"Processing: {progress:.1f}% (frame {frame_count}/{last_frame})")
+        
+            annotations = []
+            # The live view only needs the overlay on the frames it publishes
+            annotate = always_annotate or (live is not None and live.due())
+
+            # Drop excluded classes (like person) and record the frame in the track store in one update
+            keep = ~np.isin(cls_ids, excluded_class_ids)
+            boxes, track_ids, cls_ids, confs = boxes[keep], track_ids[keep], cls_ids[keep], confs[keep]
+            slots = track_store.observe(track_ids, cls_ids, boxes, frame_count)
+
+            # Determine the most likely class for each track
+            majority_classes = track_store.majority_class(slots)
+            frames_seen = track_store.frames_seen[slots]
+
+            # A track one observation away from being counted gets the large model's view next
+            if cascade is not None and np.any((frames_seen == min_frames_to_count - 1) & ~track_store.counted[slots]):
+                cascade.escalate_next()
+
+            # Process each tracked detection
+            for box, track_id, slot, majority_class, seen, conf in zip(boxes, track_ids, slots, majority_classes,
+                                                                       frames_seen, confs):
+                track_id = int(track_id)
+                most_common_class = class_names[majority_class]
+
+                # Keep per-frame boxes near segment boundaries for stitching
+                if record_windows and any(first <= frame_count <= last for first, last in record_windows):
+                    window_boxes[track_id][frame_count] = [int(v) for v in box]
+
+                # Count the object if it has been seen in enough frames and hasn't been counted yet
+                if seen >= min_frames_to_count and not track_store.counted[slot]:
+                    track_store.counted[slot] = True
+                    row = -1
+                    # Re-identification is opt-in: without it no embedding is computed
+                    if deduplicator is not None:
+                        x1, y1, x2, y2 = box
+                        with reid_seconds.time():
+                            embedding = appearance_embedding(frame[max(0, y1):y2, max(0, x1):x2])
+                            row = deduplicator.match(majority_class, embedding, track_store.first_frame[slot],
+                                                     frame_count)
+                    if row >= 0:
+                        # Re-identified: the object was counted before under another track ID
+                        deduplicator.merge(row, embedding, frame_count)
+                        item_track = int(deduplicator.track_ids[row])
+                        item_tracks[track_id] = item_track
+                        inventory.add_track(track_id, item_track)
+                        print(f"Track #{track_id} re-identified as {most_common_class} #{item_track}")
+                    else:
+                        if deduplicator is not None:
+                            row = deduplicator.add(track_id, majority_class, embedding, frame_count)
+                        inventory.count_item(track_id, most_common_class, conf, frame_count)
+                        ITEMS_COUNTED_TOTAL.inc()
+                    track_store.dedup_row[slot] = row
+
+                # Snapshots and labels belong to the item, i.e. to the first track of a re-identified object
+                item_track = item_tracks.get(track_id, track_id)
+            
+                # Check if this is a good frame for a snapshot (high confidence and object has been tracked for a while);
+                # an item already handed to the valuation pipeline keeps its snapshot
+                snapshot_info = best_snapshots.get(item_track)
+                if (snapshot_info is None or (not snapshot_info.get("final") and conf > snapshot_info["conf"])) and \
+                conf >= snapshot_confidence_threshold and \
+                seen >= min_frames_to_count:
+                
+                    # The object region with a small margin, in full-resolution coordinates
+                    x1, y1, x2, y2 = snapshot_box(box, detect_scale, width, height)
+                
+                    # Only proceed if the snapshot is not empty
+                    if x2 > x1 and y2 > y1:
+                        # Crop right away when scanning at full resolution; otherwise only remember
+                        # where the best view is and crop it from the full-resolution video afterwards
+                        if detect_size is None:
+                            with crop_seconds.time():
+                                snapshots.put(item_track, frame[y1:y2, x1:x2].copy())
+                        else:
+                            snapshots.discard(item_track)
+                        # Update best snapshot for this track
+                        best_snapshots[item_track] = {
+                            "conf": conf,
+                            "saved": False,
+                            "class": most_common_class,
+                            "box": [x1, y1, x2, y2],
+                            "frame_number": frame_count,
+                            "final": False
+                        }
+                elif snapshot_info is not None and frame_count - snapshot_info["frame_number"] >= plateau_frames:
+                    # The snapshot has stopped improving
+                    finalize(item_track)
+            
+                # Collect the overlay with different colors based on track stability
+                if annotate:
+                    color = COLOR_COUNTED  # Default green
+                    if seen < min_frames_to_count:
+                        color = COLOR_NEW  # Orange for new tracks
+                    elif track_store.counted[slot]:
+                        color = COLOR_COUNTED  # Green for counted tracks
+            
+                    # Display class name, track ID, confidence and frame count
+                    label = f"{most_common_class} #{item_track} {conf:.2f} ({seen})"
+                    annotations.append((box, label, color))
+    
+            if deduplicator is not None:
+                deduplicator.touch(track_store.dedup_row[slots], frame_count)
+
+            # Age tracks not seen in this frame and drop the ones missing for too many consecutive frames,
+            # together with any snapshot of a dropped track that was never counted; a counted item whose
+            # track is gone has its final snapshot
+            for track_id, counted in track_store.end_frame(slots, max_consecutive_misses):
+                if not counted:
+                    best_snapshots.pop(track_id, None)
+                    snapshots.discard(track_id)
+                else:
+                    finalize(item_tracks.get(track_id, track_id))
+
+            # Record the uploads and valuations that finished in the background
+            if valuation is not None:
+                valuation.poll(inventory, snapshots)
+
+            if job_progress is not None and job_progress.due():
+                elapsed = max(time.monotonic() - scan_started, 1e-6)
+                job_progress.update(
+                    stage='scanning',
+                    frame=frame_count,
+                    total_frames=last_frame,
+                    percent=round(100 * frame_count / last_frame, 1) if last_frame > 0 else None,
+                    frames_processed=processed_count,
+                    fps=round((processed_count - resumed_count) / elapsed, 1),
+                    source_fps=round((frame_count - start_frame) / elapsed, 1),
+                    items_counted=len(inventory)
+                )
+
+            # Everything up to this frame is reflected in the state: checkpoint it now and then
+            if checkpoint is not None and checkpoint.due():
+                state['processed_count'] = processed_count
+                # The decoder thread runs the sampler ahead of this loop; save a copy that
+                # lets the first frame after the checkpoint through, so none are skipped on resume
+                saved_sampler = copy.copy(sampler)
+                saved_sampler.last_frame_number = None
+                if budget is not None:
+                    # A resumed job starts over with its own budget, at full fidelity
+                    saved_sampler.min_stride, saved_sampler.max_stride = budget.base_min_stride, budget.base_max_stride
+                with checkpoint_seconds.time():
+                    checkpoint.save_scan(checkpoint_key, frame_count, dict(state, sampler=saved_sampler))
+        
+            # Hand the untouched frame to the preview encoder; it draws on its own downscaled copy
+            if preview is not None:
+                preview.submit(frame, annotations, inventory.counts, frame_count)
+            if live is not None:
+                live.submit(frame, annotations, inventory.counts, frame_count)
+
+            # Display the annotated frame and object counts
+            if not hide_display:
+                display_frame = frame.copy() if preview is not None or live is not None else frame
+                annotate_frame(display_frame, annotations, inventory.counts, frame_count)
+                cv2.imshow('Insurance Item Tracking', display_frame)
+        
+                if cv2.waitKey(1) & 0xFF == ord('q'):
+                    break
+
+            if budget is not None and not budget.update(frame_count):
+                print(f"Time budget used up at frame {frame_count}/{last_frame}, stopping the scan")
+                break
+    finally:
+        # Also after an error: the decoder thread must not keep reading a capture the caller releases
+        if pipelined:
+            frames.stop()
+        if not hide_display:
+            cv2.destroyAllWindows()
+
+    if cascade is not None:
+        cascade_stats = cascade.stats()
+        print(f"Cascade escalated {cascade_stats['escalated']} of {cascade_stats['frames']} frames "
+              f"({cascade_stats['escalation_rate']:.1%}) to the large model {cascade_stats['reasons']}; "
+              f"the small model handled the rest alone")
+
+    if deduplicator is not None:
+        print(f"Re-identification merged {deduplicator.merged} tracks into earlier items")
+
+    sampling = sampler.stats()
+    print(f"Ran detection on {sampling['frames_sampled']} of {sampling['frames_seen']} frames "
+          f"({sampling['reduction']:.1f}x fewer inference calls)")
+
+    return {
+        "inventory": inventory,
+        "best_snapshots": best_snapshots,
+        "snapshots": snapshots,
+        "window_boxes": dict(window_boxes),
+        "sampling": sampling,
+        "fidelity": budget.report() if budget is not None else None
+    }
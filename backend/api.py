@@ -1,13 +1,17 @@
-from flask import Flask, request, jsonify, send_file
+from flask import Flask, Response, request, jsonify, send_file, stream_with_context
 from flask_cors import CORS
 import os
 import sys
 import json
+import math
 import logging
 from datetime import datetime
-from app import process_video  # Import your main processing function
 from supaDB import SupaDB
-import threading
+from JobQueue import JobQueue, QueueFullError, JobClaimedError
+from JobCheckpoint import valid_job_id
+from ProgressBroker import progress_broker
+from Metrics import registry as metrics_registry
+from LiveView import live_view, BOUNDARY
 import time
 import base64
 from VoiceAgent import VoiceAgent
@@ -28,23 +32,39 @@ CORS(app, resources={r"/api/*": {"origins": "*"}})  # Enable CORS for all routes
 # Initialize database client
 db = SupaDB()
 
+# Background workers that run process_video (VIDEO_WORKERS controls concurrency);
+# started by start_job_queue() in the serving process, not on import
+job_queue = JobQueue(db)
+metrics_registry.gauge('insurefire_jobs_pending', 'Jobs waiting in the queue', lambda: job_queue.jobs.qsize())
+metrics_registry.gauge('insurefire_jobs_active', 'Jobs being processed', lambda: len(job_queue.active_jobs))
+
 # Voice agent cache - store instances by job_id
 voice_agents = {}
 
-# Create frames directory if it doesn't exist
-FRAMES_DIR = os.path.join(os.path.dirname(__file__), 'frames')
-os.makedirs(FRAMES_DIR, exist_ok=True)
-
-# Global variable to track the latest frame
-latest_frame_path = None
-frame_lock = threading.Lock()
+# Reduced-resolution annotated previews rendered by the workers on request
+PREVIEW_DIR = os.path.join(os.path.dirname(__file__), 'previews')
+os.makedirs(PREVIEW_DIR, exist_ok=True)
 
 @app.route('/api/latest-frame', methods=['GET'])
 def get_latest_frame():
-    frame_path = os.path.join(FRAMES_DIR, 'displayFrame.jpg')
-    if os.path.exists(frame_path):
-        return send_file(frame_path, mimetype='image/jpeg')
-    return jsonify({'error': 'No frame available'}), 404
+    # Newest annotated frame of the given job (or of the most recently active one), from memory
+    latest = live_view.latest(request.args.get('job_id'))
+    if latest is None:
+        return jsonify({'error': 'No frame available'}), 404
+    frame_number, jpeg = latest
+    return Response(jpeg, mimetype='image/jpeg',
+                    headers={'Cache-Control': 'no-store', 'X-Frame-Number': str(frame_number)})
+
+@app.route('/api/job/<job_id>/live', methods=['GET'])
+def stream_job_live(job_id):
+    """MJPEG stream of the job's annotated frames while it is being scanned."""
+    if not live_view.has_job(job_id):
+        return jsonify({'error': 'No live view for this job', 'status': 'error'}), 404
+    return Response(
+        stream_with_context(live_view.stream(job_id)),
+        mimetype=f'multipart/x-mixed-replace; boundary={BOUNDARY}',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
 
 @app.route('/api/create-job', methods=['POST'])
 def create_job():
@@ -73,12 +93,14 @@ def handle_video_processing():
         video_url = data.get('fileUrl')
         job_id = data.get('job_id')
         show_display = data.get('show_display', False)  # Default to False if not specified
+        render_preview = data.get('preview', False)  # Background-encoded annotated preview video
+        time_budget = data.get('time_budget')  # Optional wall-clock budget for the job, in seconds
 
-        db.update_video_address(job_id, video_url)
-        
         logging.info(f"Processing request for job_id: {job_id}")
         logging.info(f"Video URL: {video_url}")
         logging.info(f"Show display: {show_display}")
+        logging.info(f"Render preview: {render_preview}")
+        logging.info(f"Time budget: {time_budget}")
         
         if not video_url or not job_id:
             logging.error("Missing required parameters in request")
@@ -87,24 +109,57 @@ def handle_video_processing():
                 'status': 'error'
             }), 400
 
-        logging.info("Updating job status to 'processing'...")
-        db.update_job_status(job_id, 'processing')
-        
-        try:
-            logging.info("Starting video processing...")
-            process_video(video_url, job_id, db, show_display)
+        # The job ID names the checkpoint directory and the preview file
+        if not valid_job_id(job_id):
+            logging.error(f"Invalid job_id in request: {job_id!r}")
+            return jsonify({
+                'error': 'Invalid job_id',
+                'status': 'error'
+            }), 400
 
-            logging.info("Processing completed successfully")
+        # A positive number of seconds, checked before the job is queued
+        if time_budget is not None:
+            try:
+                if isinstance(time_budget, bool):
+                    raise ValueError(time_budget)
+                time_budget = float(time_budget)
+            except (TypeError, ValueError):
+                time_budget = None
+            if time_budget is None or not math.isfinite(time_budget) or time_budget <= 0:
+                logging.error(f"Invalid time_budget in request: {data.get('time_budget')!r}")
+                return jsonify({
+                    'error': 'Invalid time_budget',
+                    'status': 'error'
+                }), 400
+
+        db.update_video_address(job_id, video_url)
+
+        try:
+            options = {}
+            if render_preview:
+                options['preview_path'] = os.path.join(PREVIEW_DIR, f"{job_id}.mp4")
+            if time_budget is not None:
+                options['time_budget'] = time_budget
+            position = job_queue.submit(job_id, video_url, show_display, **options)
+        except QueueFullError as queue_error:
+            logging.warning(f"Rejecting job {job_id}: {str(queue_error)}")
             return jsonify({
-                'status': 'success',
-                'job_id': job_id
-            })
-            
-        except Exception as processing_error:
-            logging.error(f"Error during video processing: {str(processing_error)}")
-            logging.info("Updating job status to 'failed'...")
-            db.update_job_status(job_id, 'failed')
-            raise processing_error
+                'error': str(queue_error),
+                'status': 'error'
+            }), 503
+        except JobClaimedError as claimed_error:
+            logging.warning(f"Rejecting job {job_id}: {str(claimed_error)}")
+            return jsonify({
+                'error': str(claimed_error),
+                'status': 'error'
+            }), 409
+
+        logging.info(f"Job {job_id} queued ({position} jobs ahead)")
+        return jsonify({
+            'status': 'queued',
+            'job_id': job_id,
+            'queue_position': position
+        }), 202
 
     except Exception as e:
         logging.error(f"Unexpected error in process-video endpoint: {str(e)}")
@@ -115,9 +170,8 @@ def handle_video_processing():
 
 @app.route('/api/job/<job_id>', methods=['GET'])
 def get_job_status(job_id):
-    logging.info(f"=== GET JOB STATUS API CALLED for job_id: {job_id} ===")
+    logging.debug(f"=== GET JOB STATUS API CALLED for job_id: {job_id} ===")
     try:
-        logging.info(f"Fetching job data for job_id: {job_id}")
         job_data = db.get_job_by_id(job_id)
         
         if not job_data:
@@ -127,7 +181,7 @@ def get_job_status(job_id):
                 'status': 'error'
             }), 404
             
-        logging.info(f"Job data retrieved successfully: {json.dumps(job_data, indent=2)}")
+        logging.debug(f"Job {job_id} status: {job_data.get('status')}")
         return jsonify({
             'status': 'success',
             'job': job_data
@@ -140,6 +194,41 @@ def get_job_status(job_id):
             'status': 'error'
         }), 500
 
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    """Prometheus scrape endpoint: per-stage latency histograms and counters."""
+    return Response(metrics_registry.render(), mimetype='text/plain; version=0.0.4; charset=utf-8')
+
+@app.route('/api/job/<job_id>/events', methods=['GET'])
+def stream_job_events(job_id):
+    """Server-sent events with the job's progress, until it completes or fails."""
+    if progress_broker.state(job_id) is None:
+        # Not queued or run by this process (or finished a while ago): report the stored status once
+        try:
+            job_data = db.get_job_by_id(job_id)
+        except Exception as e:
+            logging.error(f"Error fetching job status: {str(e)}")
+            return jsonify({'error': str(e), 'status': 'error'}), 500
+        if not job_data:
+            return jsonify({'error': 'Job not found', 'status': 'error'}), 404
+        state = {'job_id': job_id, 'status': job_data.get('status')}
+        return Response(f"event: status\ndata: {json.dumps(state)}\n\n", mimetype='text/event-stream')
+
+    return Response(
+        stream_with_context(progress_broker.stream(job_id)),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+@app.route('/api/job/<job_id>/preview', methods=['GET'])
+def get_job_preview(job_id):
+    if not valid_job_id(job_id):
+        return jsonify({'error': 'Invalid job_id', 'status': 'error'}), 400
+    preview_path = os.path.join(PREVIEW_DIR, f"{job_id}.mp4")
+    if os.path.exists(preview_path):
+        return send_file(preview_path, mimetype='video/mp4')
+    return jsonify({'error': 'No preview available'}), 404
+
 @app.route('/api/voice/initialize/<job_id>', methods=['GET'])
 def initialize_voice_agent(job_id):
     """Initialize a voice agent for a specific job"""
@@ -250,6 +339,17 @@ def process_voice_input():
         logging.error(f"Error processing voice input: {str(e)}")
         return jsonify({'error': str(e)}), 500
 
+def start_job_queue():
+    """Requeue interrupted jobs and start the video workers (they load and warm the detector)."""
+    # Jobs interrupted by a restart continue from their last checkpoint
+    job_queue.recover()
+    job_queue.start()
+
 if __name__ == '__main__':
     logging.info("=== API SERVER STARTING ===")
-    app.run(host='0.0.0.0', port=8080, debug=True)
+    debug = True
+    # With the reloader this block runs in a supervising parent and again in the serving child;
+    # only the child takes jobs
+    if not debug or os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        start_job_queue()
+    app.run(host='0.0.0.0', port=8080, debug=debug)
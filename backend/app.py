@@ -1,11 +1,18 @@
-import sys
 import os
-from ultralytics import YOLO
 import cv2
-from collections import defaultdict
 import json
+import time
 import shutil
-from FurniturePriceEstimator import FurniturePriceEstimator
+from ModelRegistry import model_registry
+from VideoIngest import VideoSpool, StreamingCapture, is_remote
+from PreviewEncoder import PreviewEncoder
+from ShardedProcessor import scan_video_sharded
+from ValuationPipeline import ValuationPipeline
+from VideoScanner import scan_video, crop_snapshots
+from JobCheckpoint import JobCheckpoint
+from ProgressBroker import progress_broker
+from LiveView import live_view
+from Metrics import track_call
 from supabase import create_client, Client
 import uuid
 from datetime import datetime
@@ -26,14 +33,119 @@ supabase: Client = create_client(
     SUPABASE_KEY
 )
 
-def process_video(video_path, job_id, db, show_display):
+# Share of a job's time budget given to the scan; the rest is kept for uploads and valuation
+BUDGET_SCAN_SHARE = float(os.environ.get("BUDGET_SCAN_SHARE", 0.75))
+
+
+def scan_source(video_path, show_display=False, pipelined=True, batch_size=4, prefetch_size=32,
+                adaptive_sampling=True, max_frame_stride=8, preview_path=None, preview_scale=0.5,
+                shards=None, shard_overlap_seconds=2.0, checkpoint=None, saved_scan=None, job_progress=None,
+                live=None, deadline=None, valuation=None):
+    """
+    Open a video (streaming remote uploads) and scan it, resuming from a checkpoint if one is given.
+    Snapshots recorded on downscaled frames are cropped from the full-resolution video before returning,
+    except for those the valuation pipeline (if given) has already taken over during the scan.
+
+    Returns:
+        dict: scan_video's result
+    """
+    # Remote uploads are streamed into a local spool file so detection starts mid-download
+    spool = VideoSpool(video_path) if is_remote(video_path) else None
+    cap = StreamingCapture(spool) if spool is not None else cv2.VideoCapture(video_path)
+    try:
+        if not cap.isOpened():
+            print(f"Error: Could not open video file '{video_path}'.")
+            print("Tips:")
+            print(" - Try converting your video to .mp4 (H.264) format.")
+            print(" - Check permissions and file integrity.")
+            print(" - Try a different video file.")
+            raise IOError(f"Could not open video file '{video_path}'")
+
+        # Get video properties
+        width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
+        height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+        fps = cap.get(cv2.CAP_PROP_FPS)
+        total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+
+        print(f"Original video: {width}x{height}, {fps} FPS, {total_frames} frames")
+
+        if shards is None:
+            shards = int(os.environ.get("VIDEO_SHARDS", 1))
+        max_frame_stride = max_frame_stride if adaptive_sampling else 1
+        overlap_frames = int(round(shard_overlap_seconds * (fps or 30)))
+
+        if saved_scan is None and shards > 1 and total_frames >= shards * overlap_frames * 4:
+            # Long video: scan overlapping time segments in parallel processes and stitch the tracks
+            cap.release()
+            if spool is not None:
+                spool.wait()
+            if job_progress is not None:
+                job_progress.update(force=True, stage='scanning', total_frames=total_frames, segments=shards)
+            scan = scan_video_sharded(
+                spool.path if spool is not None else video_path, total_frames, shards, overlap_frames,
+                batch_size=batch_size, prefetch_size=prefetch_size, max_frame_stride=max_frame_stride,
+                deadline=deadline
+            )
+            crop_snapshots(spool.path if spool is not None else video_path, scan["best_snapshots"],
+                           scan["snapshots"])
+            return scan
+
+        # Continue after the last checkpointed frame
+        start_frame = saved_scan['frame_number'] if saved_scan is not None else 0
+        if start_frame:
+            if spool is not None:
+                cap.skip(start_frame)
+            else:
+                cap.set(cv2.CAP_PROP_POS_FRAMES, start_frame)
+
+        # Items handed over during the scan are cropped from the full-resolution video by the pipeline;
+        # a remote upload can only be read back once it is completely on disk
+        if valuation is not None:
+            valuation.crop_from(spool.path if spool is not None else video_path,
+                                ready=spool.wait if spool is not None else None)
+
+        # Optionally, render a reduced-resolution annotated preview on a background thread
+        preview = PreviewEncoder(preview_path, fps, scale=preview_scale) if preview_path else None
+        try:
+            scan = scan_video(
+                cap, fps, width, height, start_frame=start_frame, pipelined=pipelined, batch_size=batch_size,
+                prefetch_size=prefetch_size, max_frame_stride=max_frame_stride, preview=preview,
+                show_display=show_display, checkpoint=checkpoint, checkpoint_key=video_path,
+                resume_state=saved_scan['state'] if saved_scan is not None else None, job_progress=job_progress,
+                live=live, deadline=deadline, valuation=valuation
+            )
+        finally:
+            if preview is not None:
+                preview.close()
+        cap.release()
+        if spool is not None:
+            spool.wait()
+        if valuation is not None:
+            valuation.release_source()
+        if job_progress is not None:
+            job_progress.update(force=True, stage='cropping')
+        crop_snapshots(spool.path if spool is not None else video_path, scan["best_snapshots"], scan["snapshots"])
+        return scan
+    finally:
+        cap.release()
+        if spool is not None:
+            # After a scan error the pipeline may be waiting for the rest of the download
+            spool.cancel()
+        if valuation is not None:
+            valuation.release_source()
+        if spool is not None:
+            spool.close()
+
+
+def process_video(video_path, job_id, db, show_display=False, pipelined=True, batch_size=4, prefetch_size=32,
+                  adaptive_sampling=True, max_frame_stride=8, preview_path=None, preview_scale=0.5,
+                  shards=None, shard_overlap_seconds=2.0, time_budget=None):
     print(f"process_video: {video_path}")
+    job_started = time.time()
+    job_deadline = job_started + time_budget if time_budget else None
 
-    # Configuration variables that can be imported from other files
-    hide_display = not show_display  # Set to True to hide bounding boxes, labels, and inventory display
-    hide_display = False
-    # Initialize FurniturePriceEstimator
-    price_estimator = FurniturePriceEstimator()
+    # Shared, already-warm models from the per-process registry
+    price_estimator = model_registry.get_price_estimator()
 
     # Parse command line arguments
     #parser = argparse.ArgumentParser(description='Object detection and tracking from video')
@@ -50,355 +162,102 @@ def process_video(video_path, job_id, db, show_display):
     #     print(f"Error: File '{video_path}' does not exist.")
     #     sys.exit(1)
 
-    cap = cv2.VideoCapture(video_path)
-    if not cap.isOpened():
-        print(f"Error: Could not open video file '{video_path}'.")
-        print("Tips:")
-        print(" - Try converting your video to .mp4 (H.264) format.")
-        print(" - Check permissions and file integrity.")
-        print(" - Try a different video file.")
-        sys.exit(1)
-
-    # Load YOLO model
-    model = YOLO('yolo11l.pt')
-
-    # Get video properties
-    width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
-    height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
-    fps = cap.get(cv2.CAP_PROP_FPS)
-    total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
-
-    # Process every 2nd frame
-    frame_skip = 1  # Process every 2nd frame
-    new_fps = fps / frame_skip
-
-    print(f"Original video: {width}x{height}, {fps} FPS, {total_frames} frames")
-    print(f"Processing at: {new_fps:.1f} FPS (every {frame_skip} frames)")
-
-    # Optionally, save output
-    fourcc = cv2.VideoWriter_fourcc(*'mp4v')
-    out = cv2.VideoWriter('fullOutputVideo.mp4', fourcc, fps, (width, height))
-
-    # Dictionary to store unique object counts
-    object_counts = defaultdict(int)
-    tracked_objects = {}
-
-    # Track history for filtering
-    track_history = {}  # {track_id: {frames_seen: int, consecutive_misses: int, class_counts: {class: count}}}
-    min_frames_to_count = 3  # Minimum number of frames an object must appear in to be counted
-    max_consecutive_misses = 5  # Maximum number of consecutive frames an object can be missing before being forgotten
-    confidence_threshold = 0.55  # Confidence threshold for detection
-    iou_threshold = 0.45  # IoU threshold for tracking
-    snapshot_confidence_threshold = 0.55  # Minimum confidence for taking a snapshot
-
-    # Dictionary to store best snapshots for each object
-    best_snapshots = {}  # {track_id: {"conf": conf, "saved": False, "class": class_name, "path": path}}
-
-    # Classes to exclude (don't track these)
-    excluded_classes = ['person']
-
-    # Metadata for items (to be used with Gemini API)
-    item_metadata = {}
-
-    # Function to calculate IoU between two bounding boxes
-    def calculate_iou(box1, box2):
-        x1_1, y1_1, x2_1, y2_1 = box1
-        x1_2, y1_2, x2_2, y2_2 = box2
-        area1 = (x2_1 - x1_1) * (y2_1 - y1_1)
-        area2 = (x2_2 - x1_2) * (y2_2 - y1_2)
-        x1_i = max(x1_1, x1_2)
-        y1_i = max(y1_1, y1_2)
-        x2_i = min(x2_1, x2_2)
-        y2_i = min(y2_1, y2_2)
-        if x2_i <= x1_i or y2_i <= y1_i:
-            return 0.0
-        area_i = (x2_i - x1_i) * (y2_i - y1_i)
-        return area_i / (area1 + area2 - area_i)
-
-    # Process the video
-    frame_count = 0
-    processed_count = 0
-    while cap.isOpened():
-        ret, frame = cap.read()
-        if not ret:
-            break
-        print(f"frame_count: {frame_count}")
-        frame_count += 1
-        
-        # Skip frames to speed up processing
-        if (frame_count - 1) % frame_skip != 0:
-            continue
-            
-        processed_count += 1
-        
-        # Display progress
-        if processed_count % 10 == 0:
-            progress = (frame_count / total_frames) * 100
-            print(f"Processing: {progress:.1f}% (frame {frame_count}/{total_frames})")
-        
-        # Run YOLOv8 tracking on the frame with improved parameters
-        results = model.track(
-            frame, 
-            persist=True, 
-            conf=confidence_threshold, 
-            iou=iou_threshold, 
-            imgsz=640
-        )
-        
-        # Current frame's tracked objects
-        current_tracks = set()
-        
-        # Get the boxes and track IDs
-        if results[0].boxes is not None and hasattr(results[0].boxes, 'id') and results[0].boxes.id is not None:
-            boxes = results[0].boxes.xyxy.cpu().numpy().astype(int)
-            track_ids = results[0].boxes.id.cpu().numpy().astype(int)
-            cls_ids = results[0].boxes.cls.cpu().numpy().astype(int)
-            confs = results[0].boxes.conf.cpu().numpy()
-            
-            # Get class names
-            class_names = results[0].names
-            
-            # Process each detection
-            for i, (box, track_id, cls_id, conf) in enumerate(zip(boxes, track_ids, cls_ids, confs)):
-                class_name = class_names[cls_id]
-                
-                # Skip excluded classes (like person)
-                if class_name in excluded_classes:
-                    continue
-                
-                current_tracks.add(track_id)
-                
-                # Initialize or update track history
-                if track_id not in track_history:
-                    track_history[track_id] = {
-                        'frames_seen': 0,
-                        'consecutive_misses': 0,
-                        'class_counts': defaultdict(int),
-                        'counted': False,
-                        'box_history': []
-                    }
-                
-                # Update track history
-                track_history[track_id]['frames_seen'] += 1
-                track_history[track_id]['consecutive_misses'] = 0
-                track_history[track_id]['class_counts'][class_name] += 1
-                track_history[track_id]['box_history'].append(box)
-                
-                # Keep only the last 10 boxes for trajectory analysis
-                if len(track_history[track_id]['box_history']) > 10:
-                    track_history[track_id]['box_history'] = track_history[track_id]['box_history'][-10:]
-                
-                # Determine the most likely class for this track
-                most_common_class = max(track_history[track_id]['class_counts'].items(), key=lambda x: x[1])[0]
-                
-                # Count the object if it has been seen in enough frames and hasn't been counted yet
-                if track_history[track_id]['frames_seen'] >= min_frames_to_count and not track_history[track_id]['counted']:
-                    track_history[track_id]['counted'] = True
-                    tracked_objects[track_id] = most_common_class
-                    object_counts[most_common_class] += 1
-                    
-                    # Initialize item metadata
-                    item_id = f"{most_common_class}_{object_counts[most_common_class]}"
-                    item_metadata[item_id] = {
-                        "class": most_common_class,
-                        "track_id": int(track_id),
-                        "confidence": float(conf),
-                        "first_seen_frame": frame_count,
-                        "snapshot_path": None,
-                        "estimated_value": None
-                    }
-                
-                # Check if this is a good frame for a snapshot (high confidence and object has been tracked for a while)
-                if (track_id not in best_snapshots or conf > best_snapshots[track_id]["conf"]) and \
-                conf >= snapshot_confidence_threshold and \
-                track_history[track_id]['frames_seen'] >= min_frames_to_count:
-                    
-                    # Extract the object region with a small margin
-                    x1, y1, x2, y2 = box
-                    # Add margin (10% of width/height)
-                    margin_x = int((x2 - x1) * 0.1)
-                    margin_y = int((y2 - y1) * 0.1)
-                    # Ensure coordinates are within frame boundaries
-                    x1_margin = max(0, x1 - margin_x)
-                    y1_margin = max(0, y1 - margin_y)
-                    x2_margin = min(width, x2 + margin_x)
-                    y2_margin = min(height, y2 + margin_y)
-                    
-                    # Extract the object snapshot
-                    object_snapshot = frame[y1_margin:y2_margin, x1_margin:x2_margin].copy()
-                    
-                    # Only proceed if the snapshot is not empty
-                    if object_snapshot.size > 0:
-                        # Update best snapshot for this track
-                        best_snapshots[track_id] = {
-                            "conf": conf,
-                            "saved": False,
-                            "class": most_common_class,
-                            "snapshot": object_snapshot,
-                            "frame_number": frame_count
-                        }
-                
-                # Draw bounding box with different colors based on track stability
-                if not hide_display:
-                    color = (0, 255, 0)  # Default green
-                    if track_history[track_id]['frames_seen'] < min_frames_to_count:
-                        color = (0, 165, 255)  # Orange for new tracks
-                    elif track_history[track_id]['counted']:
-                        color = (0, 255, 0)  # Green for counted tracks
-                
-                    x1, y1, x2, y2 = box
-                    cv2.rectangle(frame, (x1, y1), (x2, y2), color, 2)
-                
-                    # Display class name, track ID, confidence and frame count
-                    label = f"{most_common_class} #{track_id} {conf:.2f} ({track_history[track_id]['frames_seen']})"
-                    cv2.putText(frame, label, (x1, y1 - 10), cv2.FONT_HERSHEY_SIMPLEX, 0.5, color, 2)
-        
-        # Update consecutive misses for tracks not seen in this frame
-        tracks_to_remove = []
-        for track_id in track_history:
-            if track_id not in current_tracks:
-                track_history[track_id]['consecutive_misses'] += 1
-                
-                # Remove tracks that have been missing for too many consecutive frames
-                if track_history[track_id]['consecutive_misses'] > max_consecutive_misses:
-                    tracks_to_remove.append(track_id)
-        
-        # Remove stale tracks
-        for track_id in tracks_to_remove:
-            del track_history[track_id]
-        
-        # Display object counts on the frame
-        if not hide_display:
-            y_pos = 30
-            cv2.putText(frame, f"Frame: {frame_count}", (10, y_pos), cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 0, 255), 2)
-            y_pos += 30
-            
-            cv2.putText(frame, "Items Inventory:", (10, y_pos), cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 0, 255), 2)
-            y_pos += 30
-        
-            for cls, count in sorted(object_counts.items()):
-                cv2.putText(frame, f"{cls}: {count}", (10, y_pos), cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 0, 255), 2)
-                y_pos += 30
-        
-            # Show and save the frame
-            cv2.imshow('Insurance Item Tracking', frame)
-            out.write(frame)
-        
-            if cv2.waitKey(1) & 0xFF == ord('q'):
-                break
-
-    # Save snapshots for each tracked object
+    # Progress pushed to clients of the job's event stream
+    job_progress = progress_broker.job(job_id)
+    job_progress.update(force=True, stage='scanning')
+
+    # Pick up where a previous attempt at this job stopped
+    checkpoint = JobCheckpoint(job_id)
+    saved_scan = checkpoint.load_scan(video_path)
+
+    # Uploads and batched valuations run in the background, starting while the video is still being scanned
+    def upload(image_bytes, track_id, snapshot_info, item_count):
+        return upload_snapshot_to_supabase(image_bytes, snapshot_info["class"], track_id, snapshot_info["conf"],
+                                           snapshot_info["frame_number"], item_count, job_id)
+
+    # Uploads and valuations stop at the job's deadline; the scan gets BUDGET_SCAN_SHARE of the budget
+    valuation = ValuationPipeline(price_estimator, upload, checkpoint=checkpoint, job_progress=job_progress,
+                                  deadline=job_deadline)
+
+    if saved_scan is not None and saved_scan['complete']:
+        print("Scan finished before the job was interrupted, continuing with the uploads")
+        scan = saved_scan['state']
+    else:
+        # Annotated frames for /api/latest-frame and the job's MJPEG live stream
+        live = live_view.publisher(job_id)
+        try:
+            scan = scan_source(
+                video_path, show_display=show_display, pipelined=pipelined, batch_size=batch_size,
+                prefetch_size=prefetch_size, adaptive_sampling=adaptive_sampling, max_frame_stride=max_frame_stride,
+                preview_path=preview_path, preview_scale=preview_scale, shards=shards,
+                shard_overlap_seconds=shard_overlap_seconds, checkpoint=checkpoint, saved_scan=saved_scan,
+                job_progress=job_progress, live=live,
+                deadline=job_started + time_budget * BUDGET_SCAN_SHARE if time_budget else None,
+                valuation=valuation
+            )
+        finally:
+            live.close()
+            # Sends the last partial batch; valuations in flight still finish
+            valuation.close()
+        checkpoint.save_scan(video_path, -1, scan, complete=True)
+    valuations = checkpoint.load_valuations()
+
+    inventory = scan["inventory"]
+    best_snapshots = scan["best_snapshots"]
+    snapshots = scan["snapshots"]
+    valuation.poll(inventory, snapshots)
+    valuations_total = sum(1 for track_id in best_snapshots if inventory.item_for_track(track_id)[0] is not None)
+    job_progress.update(force=True, stage='valuing', items_counted=len(inventory),
+                        valuations_completed=valuation.completed, valuations_total=valuations_total)
+
+    # Upload and value the items still tracked when the scan ended (and all of them for sharded scans)
     print("\nUploading best snapshots of detected items to Supabase...")
     for track_id, snapshot_info in best_snapshots.items():
-        if track_id in tracked_objects and not snapshot_info["saved"]:
-            class_name = snapshot_info["class"]
-            item_count = sum(1 for t_id, cls in tracked_objects.items() if cls == class_name and t_id <= track_id)
-            
-            try:
-                # Upload snapshot to Supabase
-                public_url = upload_snapshot_to_supabase(
-                    snapshot_info["snapshot"],
-                    class_name,
-                    track_id,
-                    snapshot_info['conf'],
-                    snapshot_info['frame_number'],
-                    item_count,
-                    job_id
-                )
-                snapshot_info["saved"] = True
-                snapshot_info["public_url"] = public_url
-                
-                # Estimate price for the item using in-memory image data
-                try:
-                    # Convert OpenCV image to bytes
-                    _, buffer = cv2.imencode('.jpg', snapshot_info["snapshot"])
-                    if buffer is None:
-                        raise ValueError("Failed to encode image to JPEG format")
-                    image_bytes = buffer.tobytes()
-                    
-                    name, price = price_estimator.analyze_item_with_gemini(image_bytes)
-                    snapshot_info["estimated_name"] = name
-                    snapshot_info["estimated_price"] = price
-                except Exception as e:
-                    print(f"Error estimating price for {class_name} (ID: {track_id}): {str(e)}")
-                    snapshot_info["estimated_name"] = class_name
-                    snapshot_info["estimated_price"] = None
-                
-                # Update metadata
-                item_id = f"{class_name}_{item_count}"
-                if item_id in item_metadata:
-                    item_metadata[item_id]["public_url"] = public_url
-                    item_metadata[item_id]["best_confidence"] = float(snapshot_info["conf"])
-                    item_metadata[item_id]["snapshot_frame"] = int(snapshot_info["frame_number"])
-                    item_metadata[item_id]["estimated_name"] = snapshot_info["estimated_name"]
-                    item_metadata[item_id]["estimated_price"] = snapshot_info["estimated_price"]
-                
-                print(f"Uploaded snapshot of {class_name} (ID: {track_id}) to Supabase")
-                print(f"Public URL: {public_url}")
-                if snapshot_info["estimated_price"] is not None:
-                    print(f"Estimated price: ${snapshot_info['estimated_price']:,.2f} ({snapshot_info['estimated_name']})")
-                    
-            except Exception as e:
-                print(f"Error processing snapshot for {class_name} (ID: {track_id}): {str(e)}")
-                continue
-
-    # Filter metadata to only include items with snapshots
-    filtered_metadata = {}
-    for item_id, data in item_metadata.items():
-        if data.get("public_url") is not None:
-            filtered_metadata[item_id] = data
+        item_id, item_count = inventory.item_for_track(track_id)
+        if item_id is None or snapshot_info["saved"] or track_id in valuation.outstanding:
+            continue
+
+        # Uploaded and valued before the job was interrupted
+        if track_id in valuations:
+            valuation.restore(track_id, item_id, snapshot_info, valuations[track_id], inventory, snapshots)
+            continue
+
+        # The full-resolution frame of the best view could not be read back
+        if not valuation.submit(track_id, item_id, item_count, snapshot_info, snapshots):
+            print(f"No snapshot available for {snapshot_info['class']} (ID: {track_id}), skipping")
+        valuation.poll(inventory, snapshots)
+    items_unvalued = valuation.finish(inventory, snapshots)
+    valuations_completed = valuation.completed
+
+    # Only items with snapshots are reported
+    filtered_metadata = inventory.listed_items()
+    total_value = inventory.total_value
 
     # Print final inventory
-    print("\nFinal Items Inventory:")
-    snapshot_count = 0
-    class_counts = defaultdict(int)
-    total_value = 0.0  # Initialize as float
-
-    # Count only items with snapshots
-    for item_id, data in filtered_metadata.items():
-        class_name = data["class"]
-        class_counts[class_name] += 1
-        snapshot_count += 1
-        if data.get("estimated_price") is not None:
-            total_value += float(data["estimated_price"] or 0)  # Convert to float and handle None
-
-    # Print counts by class with prices
-    for class_name, count in sorted(class_counts.items()):
-        items = [item for item in filtered_metadata.values() if item["class"] == class_name]
-        # Calculate average price only for items with valid prices
-        valid_prices = [float(item.get("estimated_price", 0)) for item in items if item.get("estimated_price") is not None]
-        avg_price = sum(valid_prices) / len(valid_prices) if valid_prices else 0
-        print(f"{class_name}: {count} items")
-        for item in items:
-            price = item.get("estimated_price")
-            if price is not None:
-                print(f"  - {item['estimated_name']}: ${float(price):,.2f}")
-            else:
-                print(f"  - {item['estimated_name']}: Price not available")
+    inventory.print_report()
 
-    print(f"\nTotal unique items with snapshots: {snapshot_count}")
-    print(f"Total estimated value: ${total_value:,.2f}")
-    print(f"Snapshots uploaded: {snapshot_count}")
+    # What a time-budgeted job traded for its turnaround
+    fidelity = scan.get("fidelity")
+    if fidelity is not None:
+        job_seconds = time.time() - job_started
+        fidelity = dict(fidelity, time_budget_seconds=time_budget, job_seconds=round(job_seconds, 1),
+                        overrun_seconds=round(max(0.0, job_seconds - time_budget), 1) if time_budget else 0.0,
+                        items_unvalued=items_unvalued)
+        print(f"Fidelity used for the time budget: {json.dumps(fidelity)}")
 
-    cap.release()
-    out.release()
-    cv2.destroyAllWindows()
+    job_progress.update(force=True, valuations_completed=valuations_completed, total_value=total_value,
+                        items_with_snapshots=len(filtered_metadata), fidelity=fidelity)
 
     # update job on supabase
-    db.complete_job(job_id, total_value, len(filtered_metadata), filtered_metadata)
+    db.complete_job(job_id, total_value, len(filtered_metadata), filtered_metadata, fidelity=fidelity)
+    checkpoint.clear()
+    snapshots.close()
 
     return
 
-def upload_snapshot_to_supabase(snapshot, class_name, track_id, conf, frame_number, item_count, job_id):
-    """Upload a snapshot to Supabase storage and return the public URL."""
+def upload_snapshot_to_supabase(file_data, class_name, track_id, conf, frame_number, item_count, job_id):
+    """Upload a JPEG-encoded snapshot (see encode_snapshot) to Supabase storage and return the public URL."""
     try:
-        # Convert OpenCV image to bytes
-        _, buffer = cv2.imencode('.jpg', snapshot)
-        if buffer is None:
-            raise ValueError("Failed to encode image to JPEG format")
-            
-        file_data = buffer.tobytes()
-        
         # Generate unique filename
         unique_prefix = f"{int(datetime.now().timestamp())}-{uuid.uuid4().hex[:7]}"
         snapshot_filename = f"{class_name}_{item_count}_id{track_id}_conf{conf:.2f}_frame{frame_number}.jpg"
@@ -411,14 +270,15 @@ def upload_snapshot_to_supabase(snapshot, class_name, track_id, conf, frame_numb
         # Upload to Supabase Storage
         bucket_name = "file-upload"
         try:
-            storage_response = supabase.storage.from_(bucket_name).upload(
-                file_path,
-                file_data,
-                {
-                    "cache-control": "3600",
-                    "content-type": "image/jpeg"
-                }
-            )
+            with track_call('supabase_storage', 'supabase_upload'):
+                storage_response = supabase.storage.from_(bucket_name).upload(
+                    file_path,
+                    file_data,
+                    {
+                        "cache-control": "3600",
+                        "content-type": "image/jpeg"
+                    }
+                )
         except Exception as e:
             raise Exception(f"Failed to upload to Supabase storage: {str(e)}")
         
@@ -430,17 +290,18 @@ def upload_snapshot_to_supabase(snapshot, class_name, track_id, conf, frame_numb
         
         # Save file metadata to database
         try:
-            table_response = supabase.table('file_uploads').insert({
-                'user_id': "66274d9c-6ece-4eeb-a8ed-19051a8a2103",  # Placeholder user ID
-                'file_name': unique_filename,
-                'original_name': snapshot_filename,
-                'file_size': len(file_data),
-                'file_type': 'image/jpeg',
-                'file_path': file_path,
-                'public_url': public_url,
-                'data_type': 'photo',
-                'job_id': job_id
-            }).execute()
+            with track_call('supabase_db', 'db_insert_file_upload'):
+                table_response = supabase.table('file_uploads').insert({
+                    'user_id': "66274d9c-6ece-4eeb-a8ed-19051a8a2103",  # Placeholder user ID
+                    'file_name': unique_filename,
+                    'original_name': snapshot_filename,
+                    'file_size': len(file_data),
+                    'file_type': 'image/jpeg',
+                    'file_path': file_path,
+                    'public_url': public_url,
+                    'data_type': 'photo',
+                    'job_id': job_id
+                }).execute()
         except Exception as e:
             raise Exception(f"Failed to save metadata to database: {str(e)}")
         
@@ -7,8 +7,11 @@ from collections import defaultdict
 import json
 import shutil
 from FurniturePriceEstimator import FurniturePriceEstimator
+from FramePipeline import read_frames
+from FrameSampler import AdaptiveFrameSampler
+from ObjectTracker import ObjectTracker
 
-def process_video(video_path):
+def process_video(video_path, max_frame_stride=8):
     print(f"process_video: {video_path}")
 
     # Configuration variables that can be imported from other files
@@ -41,12 +44,11 @@ def process_video(video_path):
     fps = cap.get(cv2.CAP_PROP_FPS)
     total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
 
-    # Process every 2nd frame
-    frame_skip = 1  # Process every 2nd frame
-    new_fps = fps / frame_skip
+    # Sample frames densely while the camera moves and sparsely while the view is static
+    sampler = AdaptiveFrameSampler(min_stride=1, max_stride=max_frame_stride)
 
     print(f"Original video: {width}x{height}, {fps} FPS, {total_frames} frames")
-    print(f"Processing at: {new_fps:.1f} FPS (every {frame_skip} frames)")
+    print(f"Processing every {sampler.min_stride}-{sampler.max_stride} frames depending on camera motion")
 
     # Optionally, save output
     fourcc = cv2.VideoWriter_fourcc(*'mp4v')
@@ -88,20 +90,14 @@ def process_video(video_path):
         area_i = (x2_i - x1_i) * (y2_i - y1_i)
         return area_i / (area1 + area2 - area_i)
 
+    # Tracker state lives outside the model so skipped frames keep consistent timestamps
+    tracker = ObjectTracker(frame_rate=fps)
+    class_names = model.names
+
     # Process the video
-    frame_count = 0
     processed_count = 0
-    while cap.isOpened():
-        ret, frame = cap.read()
-        if not ret:
-            break
+    for frame_count, frame in read_frames(cap, frame_filter=sampler.should_process):
         print(f"frame_count: {frame_count}")
-        frame_count += 1
-        
-        # Skip frames to speed up processing
-        if (frame_count - 1) % frame_skip != 0:
-            continue
-            
         processed_count += 1
         
         # Display progress
@@ -109,122 +105,115 @@ def process_video(video_path):
             progress = (frame_count / total_frames) * 100
             print(f"Processing: {progress:.1f}% (frame {frame_count}/{total_frames})")
         
-        # Run YOLOv8 tracking on the frame with improved parameters
-        results = model.track(
+        # Run YOLO on the frame and associate detections with existing tracks
+        detections = model.predict(
             frame, 
-            persist=True, 
             conf=confidence_threshold, 
             iou=iou_threshold, 
-            imgsz=640
+            imgsz=640,
+            verbose=False
+        )[0].boxes.cpu().numpy()
+        boxes, track_ids, cls_ids, confs = tracker.update(
+            detections.xyxy, detections.conf, detections.cls, frame, frame_count
         )
         
         # Current frame's tracked objects
         current_tracks = set()
         
-        # Get the boxes and track IDs
-        if results[0].boxes is not None and hasattr(results[0].boxes, 'id') and results[0].boxes.id is not None:
-            boxes = results[0].boxes.xyxy.cpu().numpy().astype(int)
-            track_ids = results[0].boxes.id.cpu().numpy().astype(int)
-            cls_ids = results[0].boxes.cls.cpu().numpy().astype(int)
-            confs = results[0].boxes.conf.cpu().numpy()
+        # Process each tracked detection
+        for i, (box, track_id, cls_id, conf) in enumerate(zip(boxes, track_ids, cls_ids, confs)):
+            class_name = class_names[cls_id]
             
-            # Get class names
-            class_names = results[0].names
+            # Skip excluded classes (like person)
+            if class_name in excluded_classes:
+                continue
             
-            # Process each detection
-            for i, (box, track_id, cls_id, conf) in enumerate(zip(boxes, track_ids, cls_ids, confs)):
-                class_name = class_names[cls_id]
-                
-                # Skip excluded classes (like person)
-                if class_name in excluded_classes:
-                    continue
-                
-                current_tracks.add(track_id)
-                
-                # Initialize or update track history
-                if track_id not in track_history:
-                    track_history[track_id] = {
-                        'frames_seen': 0,
-                        'consecutive_misses': 0,
-                        'class_counts': defaultdict(int),
-                        'counted': False,
-                        'box_history': []
-                    }
+            current_tracks.add(track_id)
+            
+            # Initialize or update track history
+            if track_id not in track_history:
+                track_history[track_id] = {
+                    'frames_seen': 0,
+                    'consecutive_misses': 0,
+                    'class_counts': defaultdict(int),
+                    'counted': False,
+                    'box_history': []
+                }
+            
+            # Update track history
+            track_history[track_id]['frames_seen'] += 1
+            track_history[track_id]['consecutive_misses'] = 0
+            track_history[track_id]['class_counts'][class_name] += 1
+            track_history[track_id]['box_history'].append(box)
+            
+            # Keep only the last 10 boxes for trajectory analysis
+            if len(track_history[track_id]['box_history']) > 10:
+                track_history[track_id]['box_history'] = track_history[track_id]['box_history'][-10:]
+            
+            # Determine the most likely class for this track
+            most_common_class = max(track_history[track_id]['class_counts'].items(), key=lambda x: x[1])[0]
+            
+            # Count the object if it has been seen in enough frames and hasn't been counted yet
+            if track_history[track_id]['frames_seen'] >= min_frames_to_count and not track_history[track_id]['counted']:
+                track_history[track_id]['counted'] = True
+                tracked_objects[track_id] = most_common_class
+                object_counts[most_common_class] += 1
                 
-                # Update track history
-                track_history[track_id]['frames_seen'] += 1
-                track_history[track_id]['consecutive_misses'] = 0
-                track_history[track_id]['class_counts'][class_name] += 1
-                track_history[track_id]['box_history'].append(box)
+                # Initialize item metadata
+                item_id = f"{most_common_class}_{object_counts[most_common_class]}"
+                item_metadata[item_id] = {
+                    "class": most_common_class,
+                    "track_id": int(track_id),
+                    "confidence": float(conf),
+                    "first_seen_frame": frame_count,
+                    "estimated_value": None
+                }
+            
+            # Check if this is a good frame for a snapshot (high confidence and object has been tracked for a while)
+            if (track_id not in best_snapshots or conf > best_snapshots[track_id]["conf"]) and \
+            conf >= snapshot_confidence_threshold and \
+            track_history[track_id]['frames_seen'] >= min_frames_to_count:
                 
-                # Keep only the last 10 boxes for trajectory analysis
-                if len(track_history[track_id]['box_history']) > 10:
-                    track_history[track_id]['box_history'] = track_history[track_id]['box_history'][-10:]
+                # Extract the object region with a small margin
+                x1, y1, x2, y2 = box
+                # Add margin (10% of width/height)
+                margin_x = int((x2 - x1) * 0.1)
+                margin_y = int((y2 - y1) * 0.1)
+                # Ensure coordinates are within frame boundaries
+                x1_margin = max(0, x1 - margin_x)
+                y1_margin = max(0, y1 - margin_y)
+                x2_margin = min(width, x2 + margin_x)
+                y2_margin = min(height, y2 + margin_y)
                 
-                # Determine the most likely class for this track
-                most_common_class = max(track_history[track_id]['class_counts'].items(), key=lambda x: x[1])[0]
+                # Extract the object snapshot
+                object_snapshot = frame[y1_margin:y2_margin, x1_margin:x2_margin].copy()
                 
-                # Count the object if it has been seen in enough frames and hasn't been counted yet
-                if track_history[track_id]['frames_seen'] >= min_frames_to_count and not track_history[track_id]['counted']:
-                    track_history[track_id]['counted'] = True
-                    tracked_objects[track_id] = most_common_class
-                    object_counts[most_common_class] += 1
-                    
-                    # Initialize item metadata
-                    item_id = f"{most_common_class}_{object_counts[most_common_class]}"
-                    item_metadata[item_id] = {
+                # Only proceed if the snapshot is not empty
+                if object_snapshot.size > 0:
+                    # Update best snapshot for this track
+                    best_snapshots[track_id] = {
+                        "conf": conf,
+                        "saved": False,
                         "class": most_common_class,
-                        "track_id": int(track_id),
-                        "confidence": float(conf),
-                        "first_seen_frame": frame_count,
-                        "estimated_value": None
+                        "snapshot": object_snapshot,
+                        "frame_number": frame_count
                     }
-                
-                # Check if this is a good frame for a snapshot (high confidence and object has been tracked for a while)
-                if (track_id not in best_snapshots or conf > best_snapshots[track_id]["conf"]) and \
-                conf >= snapshot_confidence_threshold and \
-                track_history[track_id]['frames_seen'] >= min_frames_to_count:
-                    
-                    # Extract the object region with a small margin
-                    x1, y1, x2, y2 = box
-                    # Add margin (10% of width/height)
-                    margin_x = int((x2 - x1) * 0.1)
-                    margin_y = int((y2 - y1) * 0.1)
-                    # Ensure coordinates are within frame boundaries
-                    x1_margin = max(0, x1 - margin_x)
-                    y1_margin = max(0, y1 - margin_y)
-                    x2_margin = min(width, x2 + margin_x)
-                    y2_margin = min(height, y2 + margin_y)
-                    
-                    # Extract the object snapshot
-                    object_snapshot = frame[y1_margin:y2_margin, x1_margin:x2_margin].copy()
-                    
-                    # Only proceed if the snapshot is not empty
-                    if object_snapshot.size > 0:
-                        # Update best snapshot for this track
-                        best_snapshots[track_id] = {
-                            "conf": conf,
-                            "saved": False,
-                            "class": most_common_class,
-                            "snapshot": object_snapshot,
-                            "frame_number": frame_count
-                        }
-                
-                # Draw bounding box with different colors based on track stability
-                if not hide_display:
-                    color = (0, 255, 0)  # Default green
-                    if track_history[track_id]['frames_seen'] < min_frames_to_count:
-                        color = (0, 165, 255)  # Orange for new tracks
-                    elif track_history[track_id]['counted']:
-                        color = (0, 255, 0)  # Green for counted tracks
-                
-                    x1, y1, x2, y2 = box
-                    cv2.rectangle(frame, (x1, y1), (x2, y2), color, 2)
-                
-                    # Display class name, track ID, confidence and frame count
-                    label = f"{most_common_class} #{track_id} {conf:.2f} ({track_history[track_id]['frames_seen']})"
-                    cv2.putText(frame, label, (x1, y1 - 10), cv2.FONT_HERSHEY_SIMPLEX, 0.5, color, 2)
-        
+            
+            # Draw bounding box with different colors based on track stability
+            if not hide_display:
+                color = (0, 255, 0)  # Default green
+                if track_history[track_id]['frames_seen'] < min_frames_to_count:
+                    color = (0, 165, 255)  # Orange for new tracks
+                elif track_history[track_id]['counted']:
+                    color = (0, 255, 0)  # Green for counted tracks
+            
+                x1, y1, x2, y2 = box
+                cv2.rectangle(frame, (x1, y1), (x2, y2), color, 2)
+            
+                # Display class name, track ID, confidence and frame count
+                label = f"{most_common_class} #{track_id} {conf:.2f} ({track_history[track_id]['frames_seen']})"
+                cv2.putText(frame, label, (x1, y1 - 10), cv2.FONT_HERSHEY_SIMPLEX, 0.5, color, 2)
+    
         # Update consecutive misses for tracks not seen in this frame
         tracks_to_remove = []
         for track_id in track_history:
@@ -259,6 +248,10 @@ def process_video(video_path):
             if cv2.waitKey(1) & 0xFF == ord('q'):
                 break
 
+    sampling = sampler.stats()
+    print(f"Ran detection on {sampling['frames_sampled']} of {sampling['frames_seen']} frames "
+          f"({sampling['reduction']:.1f}x fewer inference calls)")
+
     # Save snapshots for each tracked object
     print("\nProcessing snapshots of detected items...")
     for track_id, snapshot_info in best_snapshots.items():
@@ -337,9 +330,11 @@ def process_video(video_path):
 def main():
     parser = argparse.ArgumentParser(description='Process a video file for object detection and tracking')
     parser.add_argument('video_path', help='Path to the video file to process')
+    parser.add_argument('--max-frame-stride', type=int, default=8,
+                        help='Largest frame stride used while the view is static (1 disables adaptive sampling)')
     args = parser.parse_args()
     
-    process_video(args.video_path)
+    process_video(args.video_path, max_frame_stride=args.max_frame_stride)
 
 if __name__ == "__main__":
     main()
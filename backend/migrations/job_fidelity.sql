@@ -0,0 +1,3 @@
+-- Fidelity report of time-budgeted jobs (frame stride and inference size actually used),
+-- written by SupaDB.complete_job. Jobs complete without it until this has been applied.
+alter table job add column if not exists fidelity jsonb;
@@ -5,6 +5,8 @@ from supabase import create_client, Client
 from typing import Optional, Dict, Any
 import json
 
+from Metrics import track_call
+
 class SupaDB:
     def __init__(self, client: Optional[Client] = None):
         """Initialize the Supabase client with credentials from environment variables or use provided client"""
@@ -34,14 +36,15 @@ class SupaDB:
             timestamp = datetime.now().isoformat()
             
             # Insert minimal data to create a row
-            response = self.client.from_('job').insert({
-                'created_at': timestamp,
-                'videoAddress': "",
-                'result': {},
-                'total value': 0.0,
-                'numItems': 0,
-                'status': 'pending'  # Add status field
-            }).execute()
+            with track_call('supabase_db', 'db_create_empty_job'):
+                response = self.client.from_('job').insert({
+                    'created_at': timestamp,
+                    'videoAddress': "",
+                    'result': {},
+                    'total value': 0.0,
+                    'numItems': 0,
+                    'status': 'pending'  # Add status field
+                }).execute()
             
             if hasattr(response, 'data') and response.data:
                 return response.data[0].get('id')
@@ -63,7 +66,8 @@ class SupaDB:
             Optional[Dict[str, Any]]: The job data if found, None otherwise
         """
         try:
-            response = self.client.from_('job').select('*').eq('id', job_id).execute()
+            with track_call('supabase_db', 'db_get_job_by_id'):
+                response = self.client.from_('job').select('*').eq('id', job_id).execute()
             
             if hasattr(response, 'data') and response.data:
                 return response.data[0]
@@ -90,7 +94,8 @@ class SupaDB:
             if result is not None:
                 update_data['result'] = result
                 
-            response = self.client.from_('job').update(update_data).eq('id', job_id).execute()
+            with track_call('supabase_db', 'db_update_job_status'):
+                response = self.client.from_('job').update(update_data).eq('id', job_id).execute()
             return bool(response.data)
             
         except Exception as e:
@@ -109,9 +114,10 @@ class SupaDB:
             bool: True if update was successful, False otherwise
         """
         try:
-            response = self.client.from_('job').update({
-                'result': result
-            }).eq('id', job_id).execute()
+            with track_call('supabase_db', 'db_update_job_result'):
+                response = self.client.from_('job').update({
+                    'result': result
+                }).eq('id', job_id).execute()
             
             return bool(response.data)
             
@@ -119,7 +125,8 @@ class SupaDB:
             print(f"Error updating job result for {job_id}: {str(e)}")
             raise
 
-    def complete_job(self, job_id: str, total_value: float, num_items: int, result: Dict[str, Any]) -> bool:
+    def complete_job(self, job_id: str, total_value: float, num_items: int, result: Dict[str, Any],
+                     fidelity: Optional[Dict[str, Any]] = None) -> bool:
         """
         Completes a job by updating its metrics, result, and status in a single call.
         
@@ -128,17 +135,33 @@ class SupaDB:
             total_value (float): The total value of all items
             num_items (int): The number of items
             result (Dict[str, Any]): The result data to store
+            fidelity (Optional[Dict[str, Any]]): Frame stride and inference size a time-budgeted
+                job actually used (stored in the 'fidelity' column, see migrations/job_fidelity.sql;
+                left out if it cannot be written, so the job still completes)
             
         Returns:
             bool: True if update was successful, False otherwise
         """
         try:
-            response = self.client.from_('job').update({
+            update = {
                 'total value': total_value,
                 'numItems': num_items,
                 'result': result,
                 'status': 'completed'
-            }).eq('id', job_id).execute()
+            }
+            if fidelity is not None:
+                try:
+                    with track_call('supabase_db', 'db_complete_job'):
+                        response = self.client.from_('job').update(
+                            dict(update, fidelity=fidelity)
+                        ).eq('id', job_id).execute()
+                    return bool(response.data)
+                except Exception as e:
+                    # e.g. the fidelity column has not been added to this database yet
+                    print(f"Could not store fidelity of job {job_id}, completing without it: {str(e)}")
+
+            with track_call('supabase_db', 'db_complete_job'):
+                response = self.client.from_('job').update(update).eq('id', job_id).execute()
             
             return bool(response.data)
             
@@ -158,9 +181,10 @@ class SupaDB:
             bool: True if update was successful, False otherwise
         """
         try:
-            response = self.client.from_('job').update({
-                'videoAddress': public_url
-            }).eq('id', job_id).execute()
+            with track_call('supabase_db', 'db_update_video_address'):
+                response = self.client.from_('job').update({
+                    'videoAddress': public_url
+                }).eq('id', job_id).execute()
             
             return bool(response.data)
             
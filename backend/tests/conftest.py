@@ -0,0 +1,15 @@
+"""Shared fixtures for the backend tests (run `python -m pytest` from backend/)."""
+
+import os
+import sys
+
+import numpy as np
+import pytest
+
+# The backend modules import each other as top-level modules
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture
+def rng():
+    return np.random.default_rng(0)
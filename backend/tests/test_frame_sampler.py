@@ -0,0 +1,33 @@
+import numpy as np
+
+from FrameSampler import AdaptiveFrameSampler
+
+
+def run(sampler, frames):
+    return [n for n, frame in enumerate(frames, start=1) if sampler.should_process(n, frame)]
+
+
+def test_fixed_stride_without_adaptation():
+    sampler = AdaptiveFrameSampler(min_stride=3, max_stride=3)
+    frame = np.zeros((48, 64, 3), dtype=np.uint8)
+    assert run(sampler, [frame] * 10) == [1, 4, 7, 10]
+
+
+def test_static_view_uses_max_stride():
+    sampler = AdaptiveFrameSampler(min_stride=1, max_stride=4)
+    frame = np.full((48, 64, 3), 128, dtype=np.uint8)
+    assert run(sampler, [frame] * 12) == [1, 5, 9]
+    assert sampler.stats() == {'frames_seen': 12, 'frames_sampled': 3, 'reduction': 4.0}
+
+
+def test_motion_uses_min_stride(rng):
+    sampler = AdaptiveFrameSampler(min_stride=1, max_stride=8)
+    frames = [rng.integers(0, 256, (48, 64, 3), dtype=np.uint8) for _ in range(10)]
+    assert run(sampler, frames) == list(range(1, 11))
+
+
+def test_stride_for_motion_interpolates():
+    sampler = AdaptiveFrameSampler(min_stride=1, max_stride=9, motion_low=2.0, motion_high=10.0)
+    assert sampler.stride_for_motion(0.0) == 9
+    assert sampler.stride_for_motion(6.0) == 5
+    assert sampler.stride_for_motion(50.0) == 1
@@ -0,0 +1,73 @@
+import json
+from types import SimpleNamespace
+
+import pytest
+
+import FurniturePriceEstimator as estimator_module
+
+
+@pytest.fixture
+def estimator(monkeypatch):
+    """An estimator whose Gemini responses are set by the test; the valuation cache is off."""
+    monkeypatch.setattr(estimator_module, 'valuation_cache', None)
+    estimator = estimator_module.FurniturePriceEstimator()
+    estimator.responses = []
+    estimator.requests = []
+
+    def generate(stage, contents, **kwargs):
+        estimator.requests.append(stage)
+        return SimpleNamespace(text=estimator.responses.pop(0))
+
+    estimator._generate = generate
+    return estimator
+
+
+IMAGES = [b"\xff\xd8one", b"\xff\xd8two", b"\xff\xd8three"]
+
+
+def test_batch_entries_are_matched_by_item_number(estimator):
+    estimator.responses.append(json.dumps([
+        {"item": 3, "name": "Oak bookshelf", "price": 120},
+        {"item": 1, "name": " Leather sofa ", "price": "499.6"},
+        {"item": 2, "name": "Desk lamp", "price": 25}
+    ]))
+    assert estimator.analyze_items_with_gemini(IMAGES, labels=['couch', 'lamp', 'shelf']) == [
+        ("Leather sofa", 500), ("Desk lamp", 25), ("Oak bookshelf", 120)
+    ]
+    assert estimator.requests == ['gemini_batch_valuation']
+
+
+def test_malformed_and_conflicting_entries_are_dropped(estimator):
+    estimator.responses.append("```json\n" + json.dumps([
+        {"item": 1, "name": "Sofa", "price": "a lot"},
+        {"item": 2, "name": "   ", "price": 10},
+        {"item": 3, "name": "Shelf", "price": 80},
+        {"item": 3, "name": "Bookcase", "price": 90},
+        {"item": 4, "name": "Phantom", "price": 1},
+        {"name": "No number", "price": 5}
+    ]) + "\n```")
+    assert estimator._analyze_batch(IMAGES) == {}
+
+    estimator.responses.append(json.dumps([{"item": 2, "name": "Lamp", "price": 25.2}]))
+    assert estimator._analyze_batch(IMAGES) == {1: ("Lamp", 25)}
+
+
+def test_items_missing_from_a_short_answer_are_valued_one_by_one(estimator):
+    estimator.responses += [
+        json.dumps([{"item": 2, "name": "Desk lamp", "price": 25}]),
+        '["Leather sofa", 450]',
+        '["Oak bookshelf", 120]'
+    ]
+    assert estimator.analyze_items_with_gemini(IMAGES) == [
+        ("Leather sofa", 450), ("Desk lamp", 25), ("Oak bookshelf", 120)
+    ]
+    assert estimator.requests == ['gemini_batch_valuation', 'gemini_valuation', 'gemini_valuation']
+
+
+def test_unparseable_batch_falls_back_to_single_items(estimator):
+    estimator.responses += [
+        json.dumps({"item": 1, "name": "Sofa", "price": 450}),
+        '["Leather sofa", 450]',
+        'not a list'
+    ]
+    assert estimator.analyze_items_with_gemini(IMAGES[:2]) == [("Leather sofa", 450), None]
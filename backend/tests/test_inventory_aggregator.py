@@ -0,0 +1,64 @@
+import pickle
+
+from InventoryAggregator import InventoryAggregator
+
+
+def listed(inventory, track_id, class_name, price):
+    item_id = inventory.count_item(track_id, class_name, 0.9, track_id)
+    inventory.attach_snapshot(item_id, f"https://example.com/{item_id}.jpg", 0.9, track_id)
+    inventory.set_valuation(item_id, class_name.title(), price)
+    return item_id
+
+
+def test_item_ids_are_per_class_sequential():
+    inventory = InventoryAggregator()
+    assert inventory.count_item(10, 'chair', 0.8, 1) == 'chair_1'
+    assert inventory.count_item(11, 'couch', 0.8, 2) == 'couch_1'
+    assert inventory.count_item(12, 'chair', 0.8, 3) == 'chair_2'
+    assert inventory.item_for_track(12) == ('chair_2', 2)
+    assert inventory.item_for_track(99) == (None, None)
+
+
+def test_only_items_with_snapshots_are_listed():
+    inventory = InventoryAggregator()
+    listed(inventory, 1, 'chair', 100)
+    inventory.count_item(2, 'chair', 0.9, 2)
+    assert list(inventory.listed_items()) == ['chair_1']
+    assert inventory.item_count == 1
+    assert inventory.total_value == 100
+
+
+def test_summary_statistics():
+    inventory = InventoryAggregator()
+    listed(inventory, 1, 'chair', 100)
+    listed(inventory, 2, 'chair', 300)
+    listed(inventory, 3, 'chair', None)
+    stats = inventory.summary()['classes']['chair']
+    assert (stats['items'], stats['priced']) == (3, 2)
+    assert stats['average_price'] == 200
+    assert (stats['min_price'], stats['max_price']) == (100, 300)
+
+
+def test_revaluation_recomputes_extremes():
+    inventory = InventoryAggregator()
+    cheap = listed(inventory, 1, 'chair', 100)
+    listed(inventory, 2, 'chair', 200)
+    dear = listed(inventory, 3, 'chair', 300)
+    inventory.set_valuation(cheap, 'Chair', 250)
+    inventory.set_valuation(dear, 'Chair', None)
+    stats = inventory.summary()['classes']['chair']
+    assert (stats['min_price'], stats['max_price']) == (200, 250)
+    assert inventory.total_value == 450
+
+
+def test_reidentified_track_maps_to_item():
+    inventory = InventoryAggregator()
+    item_id = inventory.count_item(1, 'lamp', 0.9, 1)
+    inventory.add_track(5, 1)
+    assert inventory.item_for_track(5) == (item_id, 1)
+
+
+def test_pickles():
+    inventory = InventoryAggregator()
+    listed(inventory, 1, 'chair', 100)
+    assert pickle.loads(pickle.dumps(inventory)).summary() == inventory.summary()
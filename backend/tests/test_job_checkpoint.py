@@ -0,0 +1,107 @@
+import os
+
+import pytest
+
+import JobCheckpoint as checkpoints
+from JobCheckpoint import JobCheckpoint, pending_jobs, valid_job_id
+
+
+def test_job_round_trip(tmp_path):
+    checkpoint = JobCheckpoint('job-1', directory=str(tmp_path))
+    checkpoint.save_job('https://example.com/video.mp4', False, {'time_budget': 60.0})
+    job = JobCheckpoint('job-1', directory=str(tmp_path)).load_job()
+    assert job['video_url'] == 'https://example.com/video.mp4'
+    assert job['options'] == {'time_budget': 60.0}
+    assert [job['job_id'] for job in pending_jobs(str(tmp_path))] == ['job-1']
+
+    checkpoint.release_job()
+    assert checkpoint.load_job() is None
+    assert pending_jobs(str(tmp_path)) == []
+
+
+def test_scan_round_trip_is_tied_to_the_video(tmp_path):
+    checkpoint = JobCheckpoint('job-1', directory=str(tmp_path))
+    checkpoint.save_scan('/videos/a.mp4', 120, {'processed_count': 40})
+    saved = JobCheckpoint('job-1', directory=str(tmp_path)).load_scan('/videos/a.mp4')
+    assert saved['frame_number'] == 120
+    assert saved['state'] == {'processed_count': 40}
+    assert not saved['complete']
+    assert checkpoint.load_scan('/videos/b.mp4') is None
+
+
+def test_incompatible_scan_is_ignored(tmp_path, monkeypatch):
+    JobCheckpoint('job-1', directory=str(tmp_path)).save_scan('/videos/a.mp4', 1, {})
+    monkeypatch.setattr(checkpoints, 'SCAN_VERSION', checkpoints.SCAN_VERSION + 1)
+    assert JobCheckpoint('job-1', directory=str(tmp_path)).load_scan('/videos/a.mp4') is None
+
+
+def test_valuations_round_trip_and_clear(tmp_path):
+    checkpoint = JobCheckpoint('job-1', directory=str(tmp_path))
+    valuation = {'public_url': 'https://example.com/1.jpg', 'estimated_name': 'Sofa', 'estimated_price': 500}
+    checkpoint.save_valuation(3, valuation)
+    assert JobCheckpoint('job-1', directory=str(tmp_path)).load_valuations() == {3: valuation}
+    checkpoint.clear()
+    assert not os.path.exists(checkpoint.path)
+
+
+@pytest.mark.parametrize('job_id', ['..', '../outside', 'a/b', '/etc', '.hidden', '', 'a' * 129, 'job 1'])
+def test_invalid_job_ids_are_rejected(tmp_path, job_id):
+    assert not valid_job_id(job_id)
+    with pytest.raises(ValueError):
+        JobCheckpoint(job_id, directory=str(tmp_path))
+
+
+def test_checkpoint_stays_under_root(tmp_path):
+    checkpoint = JobCheckpoint('2f1c4a8e-90b4-4c57-a3b5-6f0d8e1b7c21', directory=str(tmp_path))
+    assert os.path.dirname(checkpoint.path) == os.path.realpath(str(tmp_path))
+
+
+def test_pending_jobs_skips_foreign_entries(tmp_path):
+    (tmp_path / '.tmp-stray').mkdir()
+    (tmp_path / 'notes.txt').write_text('')
+    JobCheckpoint('job-1', directory=str(tmp_path)).save_job('video.mp4', False, {})
+    assert [job['job_id'] for job in pending_jobs(str(tmp_path))] == ['job-1']
+
+
+@pytest.mark.skipif(checkpoints.fcntl is None, reason="claims need fcntl")
+def test_claim_is_exclusive_until_released(tmp_path):
+    first = JobCheckpoint('job-1', directory=str(tmp_path))
+    second = JobCheckpoint('job-1', directory=str(tmp_path))
+    assert first.claim()
+    assert not second.claim()
+    first.release_claim()
+    assert second.claim()
+    second.release_claim()
+
+
+@pytest.mark.skipif(checkpoints.fcntl is None, reason="claims need fcntl")
+def test_clear_keeps_the_claim_until_it_is_released(tmp_path):
+    running = JobCheckpoint('job-1', directory=str(tmp_path))
+    assert running.claim()
+    running.save_job('video.mp4', False, {})
+    running.save_scan('video.mp4', 10, {})
+    running.clear()
+    assert os.listdir(running.path) == ['claim.lock']
+    # A resubmitted job cannot start while the finished run still holds it
+    resubmitted = JobCheckpoint('job-1', directory=str(tmp_path))
+    assert not resubmitted.claim()
+    running.release_claim()
+    assert not os.path.exists(running.path)
+    assert resubmitted.claim()
+    resubmitted.release_claim()
+
+
+@pytest.mark.skipif(checkpoints.fcntl is None, reason="claims need fcntl")
+def test_failed_job_keeps_its_checkpoint_after_release(tmp_path):
+    checkpoint = JobCheckpoint('job-1', directory=str(tmp_path))
+    assert checkpoint.claim()
+    checkpoint.save_scan('video.mp4', 10, {})
+    checkpoint.release_claim()
+    assert checkpoint.load_scan('video.mp4')['frame_number'] == 10
+
+
+def test_expired_checkpoints_are_removed(tmp_path, monkeypatch):
+    JobCheckpoint('job-1', directory=str(tmp_path)).save_scan('video.mp4', 10, {})
+    monkeypatch.setattr(checkpoints, 'CHECKPOINT_TTL', -1)
+    assert pending_jobs(str(tmp_path)) == []
+    assert not os.path.exists(tmp_path / 'job-1')
@@ -0,0 +1,84 @@
+import pytest
+
+import JobCheckpoint as checkpoints
+from JobCheckpoint import JobCheckpoint
+from JobQueue import JobQueue, QueueFullError, JobClaimedError
+
+
+class FakeDB:
+    def __init__(self):
+        self.statuses = []
+
+    def update_job_status(self, job_id, status, result=None):
+        self.statuses.append((job_id, status))
+        return True
+
+
+@pytest.fixture(autouse=True)
+def checkpoint_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(checkpoints, 'CHECKPOINT_DIR', str(tmp_path))
+    return tmp_path
+
+
+def test_submit_reports_position_and_records_the_job():
+    queue = JobQueue(FakeDB(), num_workers=1)
+    assert queue.submit('job-1', 'video.mp4') == 0
+    assert queue.submit('job-2', 'video.mp4', preview_path='p.mp4') == 1
+    assert JobCheckpoint('job-2').load_job()['options'] == {'preview_path': 'p.mp4'}
+
+
+def test_full_queue_rejects_and_releases_the_job():
+    queue = JobQueue(FakeDB(), num_workers=1, max_pending=1)
+    queue.submit('job-1', 'video.mp4')
+    with pytest.raises(QueueFullError):
+        queue.submit('job-2', 'video.mp4')
+    rejected = JobCheckpoint('job-2')
+    assert rejected.load_job() is None
+    assert rejected.claim()
+
+
+@pytest.mark.skipif(checkpoints.fcntl is None, reason="claims need fcntl")
+def test_claimed_job_is_not_queued_twice():
+    queue = JobQueue(FakeDB(), num_workers=1)
+    queue.submit('job-1', 'video.mp4')
+    with pytest.raises(JobClaimedError):
+        queue.submit('job-1', 'video.mp4')
+    # Another process sharing the checkpoint directory cannot take it either
+    with pytest.raises(JobClaimedError):
+        JobQueue(FakeDB(), num_workers=1).submit('job-1', 'video.mp4')
+
+
+def test_invalid_job_id_is_rejected():
+    with pytest.raises(ValueError):
+        JobQueue(FakeDB(), num_workers=1).submit('../job', 'video.mp4')
+
+
+def test_workers_run_jobs_and_release_their_claims():
+    ran = []
+
+    def process(video_url, job_id, db, show_display, **options):
+        if job_id == 'job-bad':
+            raise RuntimeError("decode failed")
+        ran.append((job_id, video_url, options))
+
+    db = FakeDB()
+    queue = JobQueue(db, num_workers=2, process=process)
+    queue.submit('job-1', 'a.mp4', time_budget=60.0)
+    queue.submit('job-bad', 'b.mp4')
+    queue.start()
+    queue.stop()
+
+    assert ran == [('job-1', 'a.mp4', {'time_budget': 60.0})]
+    assert ('job-bad', 'failed') in db.statuses
+    assert queue.stats()['active'] == []
+    # A failed job is not requeued on restart, and nobody holds either claim any more
+    assert JobCheckpoint('job-bad').load_job() is None
+    assert JobCheckpoint('job-1').claim()
+    assert JobCheckpoint('job-bad').claim()
+
+
+def test_recover_requeues_interrupted_jobs():
+    JobCheckpoint('job-1').save_job('a.mp4', False, {})
+    queue = JobQueue(FakeDB(), num_workers=1)
+    assert queue.recover() == 1
+    assert queue.jobs.get_nowait()['job_id'] == 'job-1'
@@ -0,0 +1,34 @@
+import threading
+import time
+
+from ProgressBroker import ProgressBroker
+
+
+def test_stream_sends_state_changes_until_the_job_finishes():
+    broker = ProgressBroker(interval=0, keepalive=1)
+    broker.publish('job-1', 'status', status='queued')
+    stream = broker.stream('job-1')
+    assert '"status": "queued"' in next(stream)
+    broker.publish('job-1', 'progress', frames_processed=10)
+    assert 'event: progress' in next(stream)
+    broker.publish('job-1', 'status', status='completed')
+    assert '"status": "completed"' in next(stream)
+    assert list(stream) == []
+
+
+def test_stream_of_unknown_job_ends_right_away():
+    assert list(ProgressBroker(keepalive=5).stream('job-1')) == []
+
+
+def test_stream_ends_when_the_job_expires():
+    broker = ProgressBroker(retention=0, keepalive=5)
+    broker.publish('job-1', 'progress', frames_processed=1)
+    stream = broker.stream('job-1')
+    next(stream)
+    # The job finishes on another stream's watch and is expired by a later publish
+    with broker.changed:
+        broker.jobs['job-1']['finished_at'] = time.monotonic() - 1
+    threading.Timer(0.05, broker.publish, ('job-2', 'status'), {'status': 'queued'}).start()
+    started = time.monotonic()
+    assert list(stream) == []
+    assert time.monotonic() - started < 1
@@ -0,0 +1,58 @@
+import numpy as np
+
+from InventoryAggregator import InventoryAggregator
+from ShardedProcessor import plan_segments, stitch_segments
+from SnapshotStore import SnapshotStore
+
+
+def segment_scan(tracks):
+    """A scan_video-like result; tracks is [(track_id, class, first frame, conf, {frame: box})]."""
+    inventory = InventoryAggregator()
+    best_snapshots = {}
+    snapshots = SnapshotStore()
+    window_boxes = {}
+    for track_id, class_name, first_frame, conf, boxes in tracks:
+        inventory.count_item(track_id, class_name, conf, first_frame)
+        best_snapshots[track_id] = {"class": class_name, "conf": conf, "frame_number": first_frame,
+                                    "saved": False}
+        snapshots.put(track_id, np.full((4, 4, 3), track_id, dtype=np.uint8))
+        window_boxes[track_id] = boxes
+    return {"inventory": inventory, "best_snapshots": best_snapshots, "snapshots": snapshots,
+            "window_boxes": window_boxes, "sampling": {'frames_seen': 10, 'frames_sampled': 5},
+            "fidelity": None}
+
+
+def test_plan_segments_overlap():
+    assert plan_segments(300, 3, 20) == [(0, 100), (80, 200), (180, 300)]
+    assert plan_segments(50, 1, 20) == [(0, 50)]
+
+
+def test_object_in_overlap_is_counted_once_with_best_snapshot():
+    segments = [(0, 100), (80, 200)]
+    box = [10, 10, 50, 50]
+    left = segment_scan([
+        (1, 'chair', 5, 0.6, {}),
+        (2, 'couch', 90, 0.7, {f: box for f in range(85, 101)}),
+    ])
+    right = segment_scan([
+        (1, 'couch', 82, 0.9, {f: box for f in range(81, 101)}),
+        (2, 'lamp', 150, 0.8, {}),
+    ])
+    scan = stitch_segments(segments, [left, right])
+
+    inventory = scan["inventory"]
+    assert sorted(inventory.counts.items()) == [('chair', 1), ('couch', 1), ('lamp', 1)]
+    assert [item["class"] for item in inventory.items.values()] == ['chair', 'couch', 'lamp']
+    couch_track = inventory.items['couch_1']["track_id"]
+    # Earliest count keeps its metadata, the best snapshot comes from either segment
+    assert inventory.items['couch_1']["first_seen_frame"] == 82
+    assert scan["best_snapshots"][couch_track]["conf"] == 0.9
+    assert scan["snapshots"].get(couch_track)[0, 0, 0] == 1
+    assert scan["sampling"] == {'frames_seen': 20, 'frames_sampled': 10, 'reduction': 2.0}
+
+
+def test_tracks_without_enough_common_frames_stay_separate():
+    segments = [(0, 100), (80, 200)]
+    left = segment_scan([(1, 'couch', 90, 0.7, {99: [10, 10, 50, 50]})])
+    right = segment_scan([(1, 'couch', 82, 0.9, {99: [10, 10, 50, 50]})])
+    assert stitch_segments(segments, [left, right])["inventory"].counts['couch'] == 2
@@ -0,0 +1,77 @@
+import os
+import pickle
+
+import cv2
+import numpy as np
+
+from SnapshotStore import SnapshotStore, encode_snapshot
+
+
+def crop(side, value):
+    return np.full((side, side, 3), value, dtype=np.uint8)
+
+
+def test_largest_crops_spill_to_disk_within_budget(tmp_path):
+    store = SnapshotStore(memory_budget_mb=0.05, spill_dir=str(tmp_path))  # ~52 KB
+    store.put('small', crop(20, 1))     # 1.2 KB
+    store.put('large', crop(120, 2))    # 43 KB
+    store.put('larger', crop(130, 3))   # 51 KB: over budget
+    assert 'larger' in store.spilled and 'small' in store.in_memory
+    assert store.memory_bytes <= store.memory_budget
+    assert len(store) == 3
+    spilled = store.get('larger')
+    assert isinstance(spilled, np.memmap)
+    assert spilled.shape == (130, 130, 3) and spilled[0, 0, 0] == 3
+
+
+def test_replace_discard_and_close_remove_spill_files(tmp_path):
+    store = SnapshotStore(memory_budget_mb=0, spill_dir=str(tmp_path))
+    store.put(1, crop(10, 1))
+    first = store.spilled[1]
+    store.put(1, crop(10, 2))
+    assert not os.path.exists(first)
+    assert store.get(1)[0, 0, 0] == 2
+    store.put(2, crop(10, 3))
+    store.discard(2)
+    assert 2 not in store and store.get(2) is None
+    spill_path = store.spill_path
+    store.close()
+    assert len(store) == 0
+    assert not os.path.exists(spill_path)
+
+
+def test_pickles_with_spilled_crops_inline(tmp_path):
+    store = SnapshotStore(memory_budget_mb=0.01, spill_dir=str(tmp_path))
+    for key in range(4):
+        store.put(key, crop(50, key))
+    assert store.spilled
+    copy = pickle.loads(pickle.dumps(store))
+    store.close()
+    assert sorted(key for key in range(4) if key in copy) == [0, 1, 2, 3]
+    assert [int(copy.get(key)[0, 0, 0]) for key in range(4)] == [0, 1, 2, 3]
+    assert copy.memory_bytes <= copy.memory_budget
+    copy.close()
+
+
+def decode(image_bytes):
+    assert image_bytes[:2] == b'\xff\xd8'
+    return cv2.imdecode(np.frombuffer(image_bytes, dtype=np.uint8), cv2.IMREAD_COLOR)
+
+
+def test_encode_downscales_to_max_side():
+    assert decode(encode_snapshot(np.zeros((1000, 2000, 3), dtype=np.uint8), max_side=768)).shape == (384, 768, 3)
+    # Smaller crops are never upscaled, and max_side=0 keeps any size
+    assert decode(encode_snapshot(np.zeros((100, 50, 3), dtype=np.uint8), max_side=768)).shape == (100, 50, 3)
+    assert decode(encode_snapshot(np.zeros((1000, 2000, 3), dtype=np.uint8), max_side=0)).shape == (1000, 2000, 3)
+
+
+def test_encode_lowers_quality_to_fit_the_byte_budget(rng):
+    noise = rng.integers(0, 256, (256, 256, 3), dtype=np.uint8)
+    full = encode_snapshot(noise, max_side=0, quality=90, max_kb=10000)
+    lowest = encode_snapshot(noise, max_side=0, quality=50, max_kb=10000)
+    budget_kb = (len(full) + len(lowest)) / 2 / 1024
+
+    fitted = encode_snapshot(noise, max_side=0, quality=90, max_kb=budget_kb, min_quality=50)
+    assert len(lowest) < len(fitted) <= budget_kb * 1024
+    # A budget that cannot be met stops at the lowest quality instead of failing
+    assert encode_snapshot(noise, max_side=0, quality=90, max_kb=1, min_quality=50) == lowest
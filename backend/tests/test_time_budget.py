@@ -0,0 +1,103 @@
+from types import SimpleNamespace
+
+import pytest
+
+import TimeBudget
+from TimeBudget import TimeBudgetController, merge_reports
+
+
+class Clock:
+    """Stands in for the time module so the controller's pace checks are deterministic."""
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def time(self):
+        return self.now
+
+    def monotonic(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(TimeBudget, 'time', clock)
+    return clock
+
+
+def sampler(min_stride=1, max_stride=8):
+    return SimpleNamespace(min_stride=min_stride, max_stride=max_stride)
+
+
+def test_steps_down_while_behind(clock):
+    frames = sampler()
+    controller = TimeBudgetController(clock.now + 100, 0, 10000, frames, interval=1.0)
+    # 10 frames/s while 10000 frames in 100 s need 100 frames/s
+    for frame_number in range(10, 40, 10):
+        clock.now += 1.0
+        assert controller.update(frame_number)
+    assert controller.level == 3
+    assert (frames.min_stride, controller.imgsz) == controller.levels[3] == (3, 512)
+    assert frames.max_stride == 8
+
+    report = controller.report()
+    assert report['finished_in_budget']
+    assert (report['max_min_stride'], report['min_imgsz']) == (3, 512)
+    assert [level['min_stride'] for level in report['levels']] == [1, 2, 2]
+
+
+def test_steps_back_up_when_ahead(clock):
+    frames = sampler()
+    controller = TimeBudgetController(clock.now + 100, 0, 1000, frames, interval=1.0)
+    controller._apply(2)
+    # 100 frames/s while 1000 frames in 100 s only need 10 frames/s
+    clock.now += 1.0
+    controller.update(100)
+    assert controller.level == 1
+    assert frames.min_stride == 2 and controller.imgsz == 640
+    # The lowest fidelity reached is still reported
+    assert controller.report()['min_imgsz'] == 512
+
+
+def test_fixed_imgsz_only_raises_the_stride(clock):
+    controller = TimeBudgetController(clock.now + 100, 0, 1000, sampler(min_stride=2), fixed_imgsz=True)
+    assert all(size == 640 for _, size in controller.levels)
+    assert [stride for stride, _ in controller.levels] == [2, 3, 4, 6, 8, 12, 16]
+
+
+def test_stops_at_the_deadline(clock):
+    controller = TimeBudgetController(clock.now + 10, 0, 1000, sampler(), interval=1.0)
+    clock.now += 5.0
+    assert controller.update(500)
+    clock.now += 6.0
+    assert not controller.update(600)
+
+    report = controller.report()
+    assert not report['finished_in_budget']
+    assert report['coverage'] == 0.6
+    assert report['last_frame_scanned'] == 600
+
+
+def test_unknown_length_only_enforces_the_deadline(clock):
+    frames = sampler()
+    controller = TimeBudgetController(clock.now + 10, 0, 0, frames, interval=1.0)
+    clock.now += 5.0
+    assert controller.update(1)
+    assert controller.level == 0 and frames.min_stride == 1
+    assert controller.report()['coverage'] is None
+
+
+def test_merge_reports_takes_the_worst_segment(clock):
+    reports = []
+    for level, expired in ((1, False), (4, True)):
+        controller = TimeBudgetController(clock.now + 10, 0, 100, sampler())
+        controller._apply(level)
+        controller.expired = expired
+        reports.append(controller.report())
+
+    merged = merge_reports(reports + [None])
+    assert not merged['finished_in_budget']
+    assert (merged['max_min_stride'], merged['min_imgsz']) == (4, 416)
+    assert merged['segments'] == reports
+    assert merge_reports([None]) is None
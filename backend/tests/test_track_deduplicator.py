@@ -0,0 +1,51 @@
+import numpy as np
+
+from TrackDeduplicator import TrackDeduplicator, appearance_embedding
+
+
+def crop(colour, pattern=0):
+    image = np.zeros((40, 40, 3), dtype=np.uint8)
+    image[:] = colour
+    image[pattern * 10:pattern * 10 + 10] = 255
+    return image
+
+
+def test_embedding_is_unit_length():
+    embedding = appearance_embedding(crop((20, 120, 200)))
+    assert np.isclose(np.linalg.norm(embedding), 1.0, atol=1e-5)
+    assert appearance_embedding(np.zeros((0, 0, 3), dtype=np.uint8)) is None
+
+
+def test_matches_same_object_after_it_left_view():
+    index = TrackDeduplicator(threshold=0.9)
+    row = index.add(1, 0, appearance_embedding(crop((20, 120, 200))), frame_number=10)
+    assert index.match(0, appearance_embedding(crop((20, 120, 200))), first_frame=20, frame_number=25) == row
+    index.merge(row, appearance_embedding(crop((20, 120, 200))), frame_number=25)
+    assert index.merged == 1
+    assert index.last_seen[row] == 25
+
+
+def test_no_match_for_overlapping_lifetimes_other_class_or_appearance():
+    index = TrackDeduplicator(threshold=0.9)
+    index.add(1, 0, appearance_embedding(crop((20, 120, 200))), frame_number=10)
+    same = appearance_embedding(crop((20, 120, 200)))
+    # Still visible when the new track appeared
+    assert index.match(0, same, first_frame=5, frame_number=12) == -1
+    assert index.match(1, same, first_frame=20, frame_number=25) == -1
+    assert index.match(0, appearance_embedding(crop((200, 30, 10), pattern=3)), first_frame=20,
+                       frame_number=25) == -1
+
+
+def test_max_gap_frames():
+    index = TrackDeduplicator(threshold=0.9, max_gap_frames=50)
+    index.add(1, 0, appearance_embedding(crop((20, 120, 200))), frame_number=10)
+    assert index.match(0, appearance_embedding(crop((20, 120, 200))), first_frame=100, frame_number=100) == -1
+
+
+def test_grows_and_touch_ignores_unindexed_rows():
+    index = TrackDeduplicator(capacity=1)
+    for track_id in range(5):
+        index.add(track_id, 0, None, frame_number=track_id)
+    assert len(index) == 5
+    index.touch(np.array([-1, 2]), frame_number=40)
+    assert index.last_seen[:5].tolist() == [0, 1, 40, 3, 4]
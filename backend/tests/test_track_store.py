@@ -0,0 +1,48 @@
+import numpy as np
+
+from TrackStore import TrackStore
+
+
+def boxes(n, offset=0):
+    return np.array([[offset + i, offset + i, offset + i + 10, offset + i + 10] for i in range(n)])
+
+
+def test_observe_counts_frames_and_class_votes():
+    store = TrackStore(num_classes=3, capacity=4)
+    for cls in (2, 1, 2):
+        slots = store.observe(np.array([7]), np.array([cls]), boxes(1), frame_number=5)
+    assert 7 in store
+    assert store.frames_seen[slots[0]] == 3
+    assert store.first_frame[slots[0]] == 5
+    assert store.majority_class(slots).tolist() == [2]
+
+
+def test_grows_past_capacity_and_keeps_state():
+    store = TrackStore(num_classes=2, capacity=2)
+    first = store.observe(np.array([1]), np.array([1]), boxes(1))
+    store.observe(np.arange(2, 6), np.zeros(4, dtype=int), boxes(4))
+    assert len(store) == 5
+    assert store.capacity >= 5
+    assert store.slots[1] == first[0]
+    assert store.majority_class(first).tolist() == [1]
+
+
+def test_end_frame_evicts_stale_tracks_and_reuses_slots():
+    store = TrackStore(num_classes=1, capacity=4)
+    slots = store.observe(np.array([1, 2]), np.array([0, 0]), boxes(2))
+    store.counted[slots[0]] = True
+    kept = store.observe(np.array([2]), np.array([0]), boxes(1))
+    assert store.end_frame(kept, max_misses=1) == []
+    kept = store.observe(np.array([2]), np.array([0]), boxes(1))
+    assert store.end_frame(kept, max_misses=1) == [(1, True)]
+    assert 1 not in store
+    new = store.observe(np.array([3]), np.array([0]), boxes(1))
+    assert new[0] == slots[0]
+    assert not store.counted[new[0]]
+
+
+def test_recent_boxes_wraps_oldest_first():
+    store = TrackStore(num_classes=1, capacity=1, history=3)
+    for offset in range(5):
+        slots = store.observe(np.array([1]), np.array([0]), boxes(1, offset))
+    assert store.recent_boxes(slots[0])[:, 0].tolist() == [2, 3, 4]
@@ -0,0 +1,77 @@
+import random
+import sqlite3
+import time
+
+import cv2
+import numpy as np
+import pytest
+
+from ValuationCache import ValuationCache, perceptual_hash, _to_signed
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return ValuationCache(str(tmp_path / "cache.sqlite3"), max_distance=6)
+
+
+def flip(value, bits):
+    for bit in bits:
+        value ^= 1 << bit
+    return value
+
+
+def test_perceptual_hash_is_stable_across_encodings(rng):
+    image = rng.integers(0, 256, (64, 64, 3), dtype=np.uint8)
+    image = np.repeat(np.repeat(image[::8, ::8], 8, axis=0), 8, axis=1)
+    ok, jpeg = cv2.imencode('.jpg', image, [cv2.IMWRITE_JPEG_QUALITY, 95])
+    assert ok
+    a, b = perceptual_hash(image), perceptual_hash(jpeg.tobytes())
+    assert 0 <= a < 1 << 64
+    assert bin(a ^ b).count('1') <= 4
+    assert perceptual_hash(b'not an image') is None
+
+
+def test_hit_within_distance_and_miss_beyond(cache):
+    phash = (1 << 63) | 0x1234_5678_9abc_def0
+    cache.put(phash, 'couch', 'Grey sofa', 800)
+    assert cache.get(flip(phash, [0, 17, 33, 50, 62, 63]), 'couch') == ('Grey sofa', 800)
+    assert cache.get(flip(phash, range(0, 64, 8)), 'couch') is None
+    assert cache.get(phash, 'chair') is None
+    assert cache.get(None, 'couch') is None
+
+
+def test_banded_lookup_finds_every_near_duplicate(cache):
+    generator = random.Random(1)
+    hashes = [generator.getrandbits(64) for _ in range(500)]
+    for i, phash in enumerate(hashes):
+        cache.put(phash, 'chair', f'chair {i}', i + 1)
+    for _ in range(300):
+        i = generator.randrange(len(hashes))
+        query = flip(hashes[i], generator.sample(range(64), generator.randint(0, 6)))
+        assert cache.get(query, 'chair') is not None
+
+
+def test_wide_distance_falls_back_to_scan(tmp_path):
+    cache = ValuationCache(str(tmp_path / "cache.sqlite3"), max_distance=20)
+    cache.put(0, 'table', 'Oak table', 300)
+    assert cache.get((1 << 20) - 1, 'table') == ('Oak table', 300)
+
+
+def test_expired_entries_are_ignored(tmp_path):
+    cache = ValuationCache(str(tmp_path / "cache.sqlite3"), ttl_days=0)
+    cache.put(42, 'lamp', 'Lamp', 40)
+    time.sleep(0.01)
+    assert cache.get(42, 'lamp') is None
+
+
+def test_old_cache_files_get_band_columns(tmp_path):
+    path = str(tmp_path / "cache.sqlite3")
+    phash = (1 << 63) | 99
+    db = sqlite3.connect(path)
+    db.execute("CREATE TABLE valuations (phash INTEGER NOT NULL, class TEXT NOT NULL, name TEXT NOT NULL, "
+               "price INTEGER NOT NULL, created_at REAL NOT NULL, last_used REAL NOT NULL)")
+    db.execute("INSERT INTO valuations VALUES (?, 'couch', 'Sofa', 500, ?, ?)",
+               (_to_signed(phash), time.time(), time.time()))
+    db.commit()
+    db.close()
+    assert ValuationCache(path).get(flip(phash, [1, 40]), 'couch') == ('Sofa', 500)
@@ -0,0 +1,121 @@
+from types import SimpleNamespace
+
+import pytest
+
+import ValuationExecutor
+from ValuationExecutor import AdaptiveLimiter, TokenBucket
+
+
+class Clock:
+    """Stands in for the time module: sleeping advances the clock instead of blocking."""
+
+    def __init__(self):
+        self.now = 1000.0
+        self.sleeps = []
+
+    def monotonic(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+class RateLimited(Exception):
+    code = 429
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(ValuationExecutor, 'time', clock)
+    # The longest wait the full-jitter backoff allows
+    monkeypatch.setattr(ValuationExecutor, 'random', SimpleNamespace(uniform=lambda low, high: high))
+    return clock
+
+
+def limiter(**kwargs):
+    # No token bucket unless a test sets a rate
+    options = dict(rate=0, max_concurrency=8, max_attempts=4, target_latency=20)
+    options.update(kwargs)
+    return AdaptiveLimiter(**options)
+
+
+def failing(*errors):
+    """A call that raises the given errors in turn, then returns 'ok'."""
+    errors = list(errors)
+
+    def call():
+        if errors:
+            raise errors.pop(0)
+        return 'ok'
+    return call
+
+
+def test_successful_calls_grow_the_limit_additively(clock):
+    gemini = limiter()
+    assert gemini.limit == 4
+    for _ in range(4):
+        assert gemini.call(lambda: 'ok') == 'ok'
+    assert 4.9 < gemini.limit < 5
+    for _ in range(100):
+        gemini.call(lambda: 'ok')
+    assert gemini.limit == 8
+    assert gemini.in_flight == 0
+
+
+def test_rate_limits_halve_the_limit_once_per_second(clock):
+    gemini = limiter(max_attempts=1)
+    for _ in range(3):
+        with pytest.raises(RateLimited):
+            gemini.call(failing(RateLimited()))
+    assert gemini.limit == 2
+    clock.now += 1.0
+    with pytest.raises(RateLimited):
+        gemini.call(failing(RateLimited()))
+    assert gemini.limit == 1
+    clock.now += 1.0
+    with pytest.raises(RateLimited):
+        gemini.call(failing(RateLimited()))
+    assert gemini.limit == 1
+    assert gemini.in_flight == 0
+
+
+def test_slow_calls_count_as_overload(clock):
+    gemini = limiter(target_latency=5)
+
+    def slow():
+        clock.now += 6
+        return 'ok'
+    assert gemini.call(slow) == 'ok'
+    assert gemini.limit == 2
+
+
+def test_transient_errors_are_retried_with_capped_backoff(clock):
+    gemini = limiter(max_attempts=5, backoff_base=1.0, backoff_max=3.0)
+    assert gemini.call(failing(RateLimited(), TimeoutError(), ConnectionError(), RateLimited())) == 'ok'
+    assert clock.sleeps == [1.0, 2.0, 3.0, 3.0]
+
+
+def test_attempts_are_bounded(clock):
+    gemini = limiter(max_attempts=3)
+    with pytest.raises(TimeoutError):
+        gemini.call(failing(*[TimeoutError()] * 5))
+    assert len(clock.sleeps) == 2
+    assert gemini.in_flight == 0
+
+
+def test_other_errors_are_not_retried(clock):
+    gemini = limiter()
+    with pytest.raises(ValueError):
+        gemini.call(failing(ValueError("bad request")))
+    assert clock.sleeps == []
+    # A failed call neither grows nor shrinks the limit
+    assert gemini.limit == 4
+
+
+def test_token_bucket_spaces_requests_after_the_burst(clock):
+    bucket = TokenBucket(rate=2, burst=2)
+    for _ in range(4):
+        bucket.acquire()
+    assert clock.sleeps == [0.5, 0.5]
@@ -0,0 +1,158 @@
+import threading
+import time
+
+import numpy as np
+
+from InventoryAggregator import InventoryAggregator
+from SnapshotStore import SnapshotStore
+import ValuationPipeline as pipeline_module
+from ValuationPipeline import ValuationPipeline
+
+
+class Estimator:
+    """Values every crop at 100, optionally holding the batch until released."""
+
+    def __init__(self, hold=None):
+        self.hold = hold
+        self.batches = []
+
+    def analyze_items_with_gemini(self, images, labels=None):
+        self.batches.append(list(labels))
+        if self.hold is not None:
+            self.hold.wait()
+        return [(label.title(), 100) for label in labels]
+
+
+class Uploads:
+    def __init__(self):
+        self.uploaded = []
+
+    def __call__(self, image_bytes, track_id, snapshot_info, item_count):
+        self.uploaded.append(track_id)
+        return f"https://example.com/{track_id}.jpg"
+
+
+def counted(inventory, snapshots, count=3):
+    """Count `count` chairs with crops in the store; returns (track_id, item_id, snapshot_info) per item."""
+    items = []
+    for track_id in range(1, count + 1):
+        item_id = inventory.count_item(track_id, 'chair', 0.9, track_id)
+        snapshots.put(track_id, np.full((32, 32, 3), track_id, dtype=np.uint8))
+        items.append((track_id, item_id, {"class": 'chair', "conf": 0.9, "frame_number": track_id, "saved": False}))
+    return items
+
+
+def submit_all(pipeline, items, snapshots):
+    for number, (track_id, item_id, snapshot_info) in enumerate(items, start=1):
+        assert pipeline.submit(track_id, item_id, number, snapshot_info, snapshots)
+
+
+def test_values_every_item_without_a_deadline():
+    inventory, snapshots, upload = InventoryAggregator(), SnapshotStore(), Uploads()
+    pipeline = ValuationPipeline(Estimator(), upload, batch_size=2)
+    items = counted(inventory, snapshots)
+    submit_all(pipeline, items, snapshots)
+
+    assert pipeline.finish(inventory, snapshots) == 0
+    assert pipeline.completed == 3 and not pipeline.outstanding
+    assert inventory.total_value == 300
+    assert len(snapshots) == 0
+
+
+def test_nothing_is_uploaded_past_the_deadline():
+    inventory, snapshots, upload = InventoryAggregator(), SnapshotStore(), Uploads()
+    pipeline = ValuationPipeline(Estimator(), upload, deadline=time.time() - 1)
+    items = counted(inventory, snapshots)
+    submit_all(pipeline, items, snapshots)
+
+    assert pipeline.finish(inventory, snapshots) == 3
+    assert upload.uploaded == [] and pipeline.completed == 0
+    # Not uploaded: the crops stay in the store
+    assert len(snapshots) == 3
+
+
+def test_finish_stops_waiting_at_the_deadline():
+    inventory, snapshots, upload = InventoryAggregator(), SnapshotStore(), Uploads()
+    hold = threading.Event()
+    pipeline = ValuationPipeline(Estimator(hold), upload, deadline=time.time() + 0.5)
+    items = counted(inventory, snapshots)
+    submit_all(pipeline, items, snapshots)
+
+    started = time.monotonic()
+    try:
+        assert pipeline.finish(inventory, snapshots) == 3
+    finally:
+        hold.set()
+    assert time.monotonic() - started < 5
+    assert upload.uploaded == [1, 2, 3]
+    assert not pipeline.outstanding and pipeline.completed == 0
+
+
+def test_failed_uploads_and_valuations_still_come_back():
+    inventory, snapshots = InventoryAggregator(), SnapshotStore()
+
+    def upload(image_bytes, track_id, snapshot_info, item_count):
+        if track_id == 2:
+            raise ConnectionError("storage unavailable")
+        return f"https://example.com/{track_id}.jpg"
+
+    estimator = Estimator()
+    estimator.analyze_items_with_gemini = lambda images, labels=None: [("Chair", 100)]
+    pipeline = ValuationPipeline(estimator, upload)
+    items = counted(inventory, snapshots)
+    submit_all(pipeline, items, snapshots)
+
+    assert pipeline.finish(inventory, snapshots) == 0
+    assert not pipeline.outstanding
+    # Item 2 was not uploaded and keeps its crop; item 3 is listed without a price
+    assert pipeline.completed == 2
+    assert list(snapshots.in_memory) == [2]
+    assert [snapshot_info.get("estimated_price") for _, _, snapshot_info in items] == [100, None, None]
+
+
+def test_items_come_back_when_the_executor_refuses_the_batch(monkeypatch):
+    class ShutDown:
+        def submit(self, fn, *args, **kwargs):
+            raise RuntimeError("cannot schedule new futures after shutdown")
+
+    monkeypatch.setattr(pipeline_module, 'valuation_executor', ShutDown())
+    inventory, snapshots, upload = InventoryAggregator(), SnapshotStore(), Uploads()
+    pipeline = ValuationPipeline(Estimator(), upload)
+    submit_all(pipeline, counted(inventory, snapshots), snapshots)
+
+    assert pipeline.finish(inventory, snapshots) == 0
+    assert pipeline.completed == 3 and inventory.total_value == 0
+
+
+def test_items_come_back_when_the_worker_dies():
+    inventory, snapshots, upload = InventoryAggregator(), SnapshotStore(), Uploads()
+    pipeline = ValuationPipeline(Estimator(), upload, batch_size=2)
+
+    def send(batch):
+        raise RuntimeError("worker bug")
+    pipeline._send = send
+    items = counted(inventory, snapshots, count=4)
+    submit_all(pipeline, items, snapshots)
+
+    assert pipeline.finish(inventory, snapshots) == 0
+    assert not pipeline.outstanding
+    # The batch that killed the worker was uploaded and comes back unvalued; the rest fail
+    assert upload.uploaded == [1, 2]
+    assert pipeline.completed == 2
+    assert sorted(snapshots.in_memory) == [3, 4]
+
+
+def test_items_come_back_when_the_source_is_abandoned():
+    inventory, snapshots, upload = InventoryAggregator(), SnapshotStore(), Uploads()
+    pipeline = ValuationPipeline(Estimator(), upload)
+
+    def abandoned():
+        raise RuntimeError("download cancelled")
+    pipeline.crop_from("missing.mp4", ready=abandoned)
+    item_id = inventory.count_item(7, 'chair', 0.9, 7)
+    snapshot_info = {"class": 'chair', "conf": 0.9, "frame_number": 7, "box": (0, 0, 8, 8), "saved": False}
+    assert pipeline.submit(7, item_id, 1, snapshot_info, snapshots)
+
+    pipeline.release_source()
+    assert pipeline.finish(inventory, snapshots) == 0
+    assert upload.uploaded == [] and not pipeline.outstanding
@@ -0,0 +1,48 @@
+import pytest
+import requests
+
+import VideoIngest
+from VideoIngest import VideoSpool, is_remote, is_transient
+
+
+def http_error(status):
+    response = requests.Response()
+    response.status_code = status
+    return requests.HTTPError(f"{status} error", response=response)
+
+
+def test_is_remote():
+    assert is_remote("https://example.com/video.mp4")
+    assert not is_remote("/tmp/video.mp4")
+
+
+@pytest.mark.parametrize('error, transient', [
+    (http_error(429), True),
+    (http_error(500), True),
+    (http_error(503), True),
+    (http_error(403), False),
+    (http_error(404), False),
+    (requests.HTTPError("no response"), True),
+    (requests.ConnectionError("reset"), True),
+    (requests.Timeout("read timed out"), True),
+    (requests.exceptions.ChunkedEncodingError("truncated"), True),
+    (requests.exceptions.InvalidURL("bad url"), False),
+])
+def test_is_transient(error, transient):
+    assert is_transient(error) == transient
+
+
+def test_permanent_error_fails_without_retrying(tmp_path, monkeypatch):
+    calls = []
+
+    def get(url, **kwargs):
+        calls.append(url)
+        raise http_error(404)
+
+    monkeypatch.setattr(VideoIngest.requests, 'get', get)
+    monkeypatch.setattr(VideoIngest.time, 'sleep', lambda seconds: pytest.fail("retried a 404"))
+    spool = VideoSpool("https://example.com/missing.mp4", spool_dir=str(tmp_path))
+    with pytest.raises(IOError):
+        spool.wait()
+    spool.close()
+    assert len(calls) == 1